@@ -46,6 +46,9 @@ from dialogs.dataviewer import *
 from dialogs.selectnodes import *
 import logging
 import threading
+import multiprocessing
+import jsoncodec
+from asyncthread import availableEngines
 from server import Server, RequestHandler
 
 # Some hackery required for pyInstaller
@@ -94,6 +97,7 @@ class MainWindow(QMainWindow):
 
     def createDB(self):
         self.database = Database(self)
+        self.setDatabaseProfile()
 
         dbname= cmd_args.database #sys.argv[1] if len(sys.argv) > 1 else None
         lastpath = self.settings.value("lastpath")
@@ -275,6 +279,72 @@ class MainWindow(QMainWindow):
         self.maxsizeEdit.setValue(self.settings.value('maxsize',5))
         self.settingsLayout.addRow('Maximum size',self.maxsizeEdit)
 
+        # Burst
+        self.burstEdit = QSpinBox(self)
+        self.burstEdit.setMinimum(1)
+        self.burstEdit.setMaximum(1000)
+        self.burstEdit.setToolTip(wraptip(
+            "How many requests may be sent at once before the requests per minute apply? "
+            "With 1, the requests are spaced evenly."))
+        self.burstEdit.setValue(int(self.settings.value('burst', 1)))
+        self.settingsLayout.addRow('Burst requests', self.burstEdit)
+
+        # Request engine
+        self.engineEdit = QComboBox(self)
+        self.engineEdit.setToolTip(wraptip(
+            "Choose how requests are sent. Threads send one request per thread. The async engine sends many requests "
+            "concurrently from one event loop, which is useful for APIs that tolerate high request rates (requires httpx)."))
+        self.engineEdit.insertItems(0, availableEngines())
+        self.engineEdit.setCurrentText(self.settings.value('engine', 'threads'))
+        self.settingsLayout.addRow('Request engine', self.engineEdit)
+
+        self.concurrencyEdit = QSpinBox(self)
+        self.concurrencyEdit.setMinimum(1)
+        self.concurrencyEdit.setMaximum(1000)
+        self.concurrencyEdit.setToolTip(wraptip("How many requests will the async engine send concurrently at maximum?"))
+        self.concurrencyEdit.setValue(int(self.settings.value('concurrency', 50)))
+        self.settingsLayout.addRow('Concurrent requests', self.concurrencyEdit)
+
+        # Connection pool
+        self.poolconnectionsEdit = QSpinBox(self)
+        self.poolconnectionsEdit.setMinimum(1)
+        self.poolconnectionsEdit.setMaximum(1000)
+        self.poolconnectionsEdit.setToolTip(wraptip("For how many hosts will connections be kept alive between requests?"))
+        self.poolconnectionsEdit.setValue(int(self.settings.value('poolconnections', 10)))
+        self.settingsLayout.addRow('Pooled hosts', self.poolconnectionsEdit)
+
+        self.poolmaxsizeEdit = QSpinBox(self)
+        self.poolmaxsizeEdit.setMinimum(1)
+        self.poolmaxsizeEdit.setMaximum(1000)
+        self.poolmaxsizeEdit.setToolTip(wraptip(
+            "How many connections will be kept alive for each host? Use at least the number of parallel threads."))
+        self.poolmaxsizeEdit.setValue(int(self.settings.value('poolmaxsize', 10)))
+        self.settingsLayout.addRow('Connections per host', self.poolmaxsizeEdit)
+
+        # Response cache
+        self.cacheCheckbox = QCheckBox("Cache responses",self)
+        self.cacheCheckbox.setToolTip(wraptip(
+            "Check to store responses on disk. Identical requests are answered from the cache without "
+            "sending them again. Responses with an ETag or Last-Modified header are revalidated after the lifetime."))
+        self.settingsLayout.addRow(self.cacheCheckbox)
+        self.cacheCheckbox.setChecked(str(self.settings.value('cache', 'false')) == 'true')
+
+        self.cachettlEdit = QSpinBox(self)
+        self.cachettlEdit.setMinimum(1)
+        self.cachettlEdit.setMaximum(8760)
+        self.cachettlEdit.setSuffix(' h')
+        self.cachettlEdit.setToolTip(wraptip("How many hours are cached responses used without asking the server?"))
+        self.cachettlEdit.setValue(int(self.settings.value('cachettl', 24)))
+        self.settingsLayout.addRow('Cache lifetime', self.cachettlEdit)
+
+        self.cachesizeEdit = QSpinBox(self)
+        self.cachesizeEdit.setMinimum(1)
+        self.cachesizeEdit.setMaximum(100000)
+        self.cachesizeEdit.setSuffix(' MB')
+        self.cachesizeEdit.setToolTip(wraptip("How large may the cache grow? The least recently used responses are removed first."))
+        self.cachesizeEdit.setValue(int(self.settings.value('cachesize', 500)))
+        self.settingsLayout.addRow('Cache size', self.cachesizeEdit)
+
         # Expand Box
         self.autoexpandCheckbox = QCheckBox("Expand new nodes",self)
         self.autoexpandCheckbox.setToolTip(wraptip(
@@ -312,6 +382,44 @@ class MainWindow(QMainWindow):
         self.styleEdit.currentIndexChanged.connect(self.setStyle)
         self.settingsLayout.addRow('Style', self.styleEdit)
 
+        # JSON codec
+        self.codecEdit = QComboBox(self)
+        self.codecEdit.setToolTip(wraptip("Choose the library for parsing and storing JSON data. "
+                                          "By default, the fastest installed library is used (orjson, ujson or the json module)."))
+        self.codecEdit.insertItems(0, jsoncodec.availableCodecs())
+        self.codecEdit.setCurrentText(self.settings.value('jsoncodec', 'auto'))
+        jsoncodec.setCodec(self.codecEdit.currentText())
+
+        self.codecEdit.currentIndexChanged.connect(self.setCodec)
+        self.settingsLayout.addRow('JSON codec', self.codecEdit)
+
+        # Database profile
+        self.dbprofileEdit = QComboBox(self)
+        self.dbprofileEdit.setToolTip(wraptip(
+            "Choose the SQLite settings. The performance profile uses write-ahead logging (WAL) "
+            "and keeps more data in memory, which speeds up writing and reading large databases. "
+            "Changes apply when opening a database. Don't use it for databases on network drives."))
+        self.dbprofileEdit.insertItems(0, ['default', 'performance'])
+        self.dbprofileEdit.setCurrentText(self.settings.value('dbprofile', 'default'))
+        self.dbprofileEdit.currentIndexChanged.connect(self.setDatabaseProfile)
+        self.settingsLayout.addRow('Database profile', self.dbprofileEdit)
+
+        self.dbcacheEdit = QSpinBox(self)
+        self.dbcacheEdit.setMinimum(2)
+        self.dbcacheEdit.setMaximum(8192)
+        self.dbcacheEdit.setToolTip(wraptip("How many megabytes of the database will be cached in memory (performance profile)?"))
+        self.dbcacheEdit.setValue(int(self.settings.value('dbcachesize', 64)))
+        self.dbcacheEdit.valueChanged.connect(self.setDatabaseProfile)
+        self.settingsLayout.addRow('Database cache', self.dbcacheEdit)
+
+        self.dbmmapEdit = QSpinBox(self)
+        self.dbmmapEdit.setMinimum(0)
+        self.dbmmapEdit.setMaximum(65536)
+        self.dbmmapEdit.setToolTip(wraptip("How many megabytes of the database file will be memory-mapped (performance profile)? Set to 0 to disable."))
+        self.dbmmapEdit.setValue(int(self.settings.value('dbmmapsize', 256)))
+        self.dbmmapEdit.valueChanged.connect(self.setDatabaseProfile)
+        self.settingsLayout.addRow('Database memory map', self.dbmmapEdit)
+
         #
         #  Components
         #
@@ -420,12 +528,20 @@ class MainWindow(QMainWindow):
         self.threadsEdit.setToolTip(wraptip("The number of concurrent threads performing the requests. Higher values increase the speed, but may result in API-Errors/blocks"))
         fetchsettings.addRow("Parallel Threads", self.threadsEdit)
 
+        #-Adaptive threads
+        self.adaptiveCheckbox = QCheckBox(self)
+        self.adaptiveCheckbox.setCheckState(Qt.Unchecked)
+        self.adaptiveCheckbox.setToolTip(wraptip("Check to adjust the number of threads while fetching. Starting with one thread, threads are added as long as the latency is stable and no rate limits or server errors occur. The number of parallel threads is the maximum. Changes are shown in the status log."))
+        fetchsettings.addRow("Adaptive threads", self.adaptiveCheckbox)
+
         # Speed Box
         self.speedEdit = QSpinBox(self)
         self.speedEdit.setMinimum(1)
         self.speedEdit.setMaximum(60000)
         self.speedEdit.setValue(200)
-        self.speedEdit.setToolTip(wraptip("Limit the total amount of requests per minute (calm down to avoid API blocking)"))
+        self.speedEdit.setToolTip(wraptip("Limit the total amount of requests per minute (calm down to avoid API blocking). "
+                                          "The limit applies to each host and access token. The speed is reduced automatically "
+                                          "if the API reports its rate limits in the response headers."))
         fetchsettings.addRow("Requests per minute", self.speedEdit)
 
         #Error Box
@@ -479,6 +595,32 @@ class MainWindow(QMainWindow):
         self.loglist.clear()
         groupLayout.addWidget(self.loglist)
 
+    def setDatabaseProfile(self):
+        if not hasattr(self, 'database'):
+            return False
+
+        self.database.setProfile(self.dbprofileEdit.currentText(),
+                                 self.dbcacheEdit.value(), self.dbmmapEdit.value())
+
+    def applyDatabaseProfile(self, profile):
+        """
+        Update the database profile and the settings widgets, e.g. from remote control
+        """
+        self.database.setProfile(profile.get('profile'), profile.get('cachesize'), profile.get('mmapsize'))
+        profile = self.database.getProfile()
+
+        for widget in [self.dbprofileEdit, self.dbcacheEdit, self.dbmmapEdit]:
+            widget.blockSignals(True)
+        self.dbprofileEdit.setCurrentText(profile['profile'])
+        self.dbcacheEdit.setValue(profile['cachesize'])
+        self.dbmmapEdit.setValue(profile['mmapsize'])
+        for widget in [self.dbprofileEdit, self.dbcacheEdit, self.dbmmapEdit]:
+            widget.blockSignals(False)
+
+    def setCodec(self):
+        codec = jsoncodec.setCodec(self.codecEdit.currentText())
+        self.logmessage("Using {} for JSON data".format(codec))
+
     def setStyle(self):
         style = self.styleEdit.currentText()
         try:
@@ -571,6 +713,18 @@ class MainWindow(QMainWindow):
         self.settings.setValue('expand', self.autoexpandCheckbox.isChecked())
         self.settings.setValue('logrequests', self.logCheckbox.isChecked())
         self.settings.setValue('style', self.styleEdit.currentText())
+        self.settings.setValue('jsoncodec', self.codecEdit.currentText())
+        self.settings.setValue('dbprofile', self.dbprofileEdit.currentText())
+        self.settings.setValue('engine', self.engineEdit.currentText())
+        self.settings.setValue('concurrency', self.concurrencyEdit.value())
+        self.settings.setValue('burst', self.burstEdit.value())
+        self.settings.setValue('poolconnections', self.poolconnectionsEdit.value())
+        self.settings.setValue('poolmaxsize', self.poolmaxsizeEdit.value())
+        self.settings.setValue('cache', self.cacheCheckbox.isChecked())
+        self.settings.setValue('cachettl', self.cachettlEdit.value())
+        self.settings.setValue('cachesize', self.cachesizeEdit.value())
+        self.settings.setValue('dbcachesize', self.dbcacheEdit.value())
+        self.settings.setValue('dbmmapsize', self.dbmmapEdit.value())
 
         self.settings.beginGroup("GlobalSettings")
         self.settings.setValue("clearsettings", self.clearCheckbox.isChecked())
@@ -770,6 +924,9 @@ def startMain():
 
 
 if __name__ == "__main__":
+    # Support worker processes in frozen builds
+    multiprocessing.freeze_support()
+
     # Logging
     try:
         logfolder = os.path.join(os.path.expanduser("~"),'Facepager','Logs')
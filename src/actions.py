@@ -9,6 +9,7 @@ from widgets.progressbar import ProgressBar
 from database import *
 from apimodules import *
 from apithread import ApiThreadPool
+from scheduler import FetchScheduler
 from collections import defaultdict
 import io
 import os
@@ -21,6 +22,177 @@ if sys.version_info.major < 3:
 else:
     from urllib.request import pathname2url
 
+class ThreadPoolWaiter(QObject):
+    """
+    Wait in a local event loop until the thread pool has results,
+    the user clicked a button in the progress window or the interval passed.
+    The threads emit the signal, it is queued to the event loop of the main thread.
+    """
+    ready = Signal()
+
+    def __init__(self, threadpool, progress, interval=100):
+        super(ThreadPoolWaiter, self).__init__()
+        self.threadpool = threadpool
+        self.loop = QEventLoop()
+
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.loop.quit)
+
+        self.ready.connect(self.loop.quit, Qt.QueuedConnection)
+        progress.changed.connect(self.loop.quit)
+        threadpool.setNotify(self.ready.emit)
+
+    def wait(self):
+        if self.threadpool.hasResults():
+            return
+
+        self.timer.start()
+        self.loop.exec_()
+        self.timer.stop()
+
+class GuiFetchScheduler(FetchScheduler):
+    """
+    Show the progress of the fetch scheduler in the progress window
+    and update the tree when nodes were written
+    """
+
+    def __init__(self, actions, progress, apimodule, options, jobqueue=None):
+        super(GuiFetchScheduler, self).__init__(apimodule, options, actions.mainWindow.database, jobqueue)
+        self.actions = actions
+        self.mainWindow = actions.mainWindow
+        self.progress = progress
+        self.waiter = None
+
+    def logmessage(self, msg):
+        self.mainWindow.logmessage(msg)
+
+    def nodesWritten(self, written):
+        """
+        Notify the tree about nodes saved by the node writer,
+        only parents loaded in the tree are updated
+        """
+        super(GuiFetchScheduler, self).nodesWritten(written)
+
+        treemodel = self.mainWindow.tree.treemodel
+        index = treemodel.getIndexById(written['parent_id'])
+        if not index.isValid():
+            return
+
+        if self.options.get('expand', False):
+            self.mainWindow.tree.setExpanded(index, True)
+
+        fetch = self.options.get('expand', False) or self.mainWindow.tree.isExpanded(index)
+        treemodel.nodesAppended(index, written['count'], fetch)
+
+    def jobsAdded(self, complete):
+        if complete:
+            self.progress.setMaximum(self.stats['nodes'])
+            self.progress.setRemaining(self.threadpool.getJobCount())
+            self.progress.resetRate()
+            self.progress.removeInfo('input')
+            self.logmessage("Added {} node(s) to queue.".format(self.stats['nodes']))
+        elif self.jobqueue is None:
+            self.progress.setMaximum(self.stats['nodes'])
+
+    def jobProgress(self, job):
+        progresskey = 'nodeprogress' + str(job.get('threadnumber', ''))
+        if 'current' in job:
+            percent = int((job.get('current',0) * 100.0 / job.get('total',1)))
+            self.progress.showInfo(progresskey, "{}% of current node processed.".format(percent))
+        elif job.get('page', 0) > 1:
+            self.progress.showInfo(progresskey, "{} page(s) of current node processed.".format(job.get('page',0)))
+
+    def jobFinished(self, job):
+        self.progress.removeInfo('nodeprogress' + str(job.get('threadnumber', '')))
+        if not self.threadpool.suspended:
+            self.progress.step()
+
+    def dataAdded(self, job, status):
+        if not self.threadpool.suspended:
+            self.actions.state = 'fetchdata'
+
+        count = self.stats['status'][status]
+        self.progress.showInfo(status,"{} response(s) with status: {}".format(count,status))
+
+        # Custom info from modules
+        info = job['options'].get('info', {})
+        for name, value in info.items():
+            self.progress.showInfo(name, value)
+
+    def update(self, newdata):
+        # Show info once for all results
+        if newdata:
+            self.progress.showInfo('newnodes',"{} new node(s) created".format(self.stats['newnodes']))
+            self.progress.showInfo('threads',"{} active thread(s)".format(self.threadpool.getThreadCount()))
+            self.progress.setRemaining(self.getRemaining())
+
+            reuse = self.apimodule.getConnectionReuse(self.connectionstats)
+            if reuse is not None:
+                self.progress.showInfo('connections', "{:.0%} of the requests reused a connection".format(reuse))
+
+            cachehits = self.apimodule.getCacheHits(self.cachestats)
+            if cachehits['hits'] or cachehits['revalidated']:
+                self.progress.showInfo('cache', "{} response(s) from the cache, {} revalidated".format(
+                    cachehits['hits'], cachehits['revalidated']))
+            if cachehits['coalesced']:
+                self.progress.showInfo('coalesced', "{} identical request(s) shared a response".format(
+                    cachehits['coalesced']))
+
+        # Abort
+        if self.progress.wasCanceled and not self.canceled:
+            self.progress.showInfo('cancel', "Disconnecting from stream, may take some time.")
+            self.cancel()
+
+    def suspend(self, msg, ratelimit, autoretry):
+        self.actions.state = 'ratelimit'
+        if not ratelimit:
+            msg += "\nPlease check your settings."
+
+        # 5 minutes
+        self.progress.showError(msg, 60 * 5, autoretry)
+        self.mainWindow.tree.treemodel.commitNewNodes()
+
+    def errorsPending(self, count):
+        msg = "All nodes finished but you have {} pending errors. Skip or retry?".format(count)
+        self.progress.showError(msg, 60 * 5, False)
+
+    def resume(self):
+        if not self.progress.wasResumed:
+            return False
+
+        if self.progress.wasRetried:
+            self.threadpool.retryJobs()
+        else:
+            self.threadpool.clearRetry()
+            self.threadpool.resumeJobs()
+
+        self.progress.setRemaining(self.getRemaining())
+        self.progress.hideError()
+        return True
+
+    def stopping(self):
+        self.progress.showInfo('cancel', "Work finished, shutting down threads.")
+
+    def wait(self):
+        # Wake up when the threads have results or the user clicked a button
+        if self.waiter is None:
+            self.waiter = ThreadPoolWaiter(self.threadpool, self.progress)
+
+        self.progress.computeRate()
+        self.waiter.wait()
+        QApplication.processEvents()
+
+    def finish(self):
+        summary = [str(val)+" x "+key for key,val in self.stats['status'].items()]
+        summary = ", ".join(summary)
+        end = "Fetching completed" if not self.canceled else 'Fetching cancelled by user'
+        self.logmessage("{}, {} new node(s) created. Summary of responses: {}.".format(end, self.stats['newnodes'], summary))
+
+        super(GuiFetchScheduler, self).finish()
+        self.mainWindow.tree.treemodel.commitNewNodes()
+
 class ApiActions(object):
     """
     Actions called by GuiActions or Http clients
@@ -145,198 +317,32 @@ class ApiActions(object):
         progress = ProgressBar("Fetching Data", parent=self.mainWindow)
 
         try:
-            # Get seed nodes
-            indexes = self.getIndexes(options, indexes, progress)
+            # Get seed nodes, all nodes are selected from the database
+            nodequeue = self.getNodeQueue(options, indexes)
+            jobqueue = self.getJobQueue(apimodule, options, nodequeue)
+
+            if jobqueue is not None:
+                jobs = (self.prepareJob(node, options) for node in jobqueue)
+            else:
+                indexes = self.getIndexes(options, indexes, progress)
+                jobs = (self.prepareJob(self.getNodeFromIndex(index), options) if index.isValid() else None
+                        for index in indexes)
 
             # Update progress window
             self.mainWindow.logmessage("Start fetching data.")
-            totalnodes = 0
-            hasindexes = True
-            progress.setMaximum(totalnodes)
-            self.mainWindow.tree.treemodel.nodecounter = 0
-
-            #Init status messages
-            statuscount = defaultdict(int)
-            errorcount = 0
-            ratelimitcount = 0
-            allowedstatus = ['fetched (200)','downloaded (200)','fetched (202)']
-
-            try:
-                #Spawn Threadpool
-                threadpool = ApiThreadPool(apimodule)
-                threadpool.spawnThreads(options.get("threads", 1))
-
-                #Process Logging/Input/Output Queue
-                while True:
-                    try:
-                        #Logging (sync logs in threads with main thread)
-                        msg = threadpool.getLogMessage()
-                        if msg is not None:
-                            self.mainWindow.logmessage(msg)
-
-                        # Jobs in: packages of 100 at a time
-                        jobsin = 0
-                        while hasindexes and (jobsin < 100):
-                            index = next(indexes, False)
-                            if index:
-                                jobsin += 1
-                                totalnodes += 1
-                                if index.isValid():
-                                    job = self.prepareJob(index, options)
-                                    threadpool.addJob(job)
-                            else:
-                                threadpool.applyJobs()
-                                progress.setRemaining(threadpool.getJobCount())
-                                progress.resetRate()
-                                hasindexes = False
-                                progress.removeInfo('input')
-                                self.mainWindow.logmessage("Added {} node(s) to queue.".format(totalnodes))
-
-                        if jobsin > 0:
-                            progress.setMaximum(totalnodes)
-
-                        #Jobs out
-                        job = threadpool.getJob()
-
-                        #-Finished all nodes (sentinel)...
-                        if job is None:
-                            break
-
-                        #-Finished one node...
-                        elif 'progress' in job:
-                            progresskey = 'nodeprogress' + str(job.get('threadnumber', ''))
-
-                            # Update single progress
-                            if 'current' in job:
-                                percent = int((job.get('current',0) * 100.0 / job.get('total',1)))
-                                progress.showInfo(progresskey, "{}% of current node processed.".format(percent))
-                            elif 'page' in job:
-                                if job.get('page', 0) > 1:
-                                    progress.showInfo(progresskey, "{} page(s) of current node processed.".format(job.get('page',0)))
-
-                            # Update total progress
-                            else:
-                                progress.removeInfo(progresskey)
-                                if not threadpool.suspended:
-                                    progress.step()
-
-                        #-Add data...
-                        elif 'data' in job and (not progress.wasCanceled):
-                            if not job['nodeindex'].isValid():
-                                continue
-
-                            # Add data
-                            treeindex = job['nodeindex']
-                            treenode = treeindex.internalPointer()
-
-                            newcount = treenode.appendNodes(job['data'], job['options'], True)
-                            if options.get('expand',False):
-                                 self.mainWindow.tree.setExpanded(treeindex,True)
-
-                            # Count status and errors
-                            status = job['options'].get('querystatus', 'empty')
-                            statuscount[status] += 1
-                            errorcount += int(not status in allowedstatus)
+            progress.setMaximum(len(jobqueue) if jobqueue is not None else 0)
 
-                            # Detect rate limit
-                            ratelimit = job['options'].get('ratelimit', False)
-                            #ratelimit = ratelimit or (not newcount)
-                            ratelimitcount += int(ratelimit)
-                            autoretry = (ratelimitcount) or (status == "request error")
-
-                            # Clear errors when everything is ok
-                            if not threadpool.suspended and (status in allowedstatus) and (not ratelimit):
-                                #threadpool.clearRetry()
-                                errorcount = 0
-                                ratelimitcount = 0
-                                self.state = 'fetchdata'
-
-                            # Suspend on error or ratelimit
-                            elif (errorcount >= options['errors']) or (ratelimitcount > 0):
-                                threadpool.suspendJobs()
-                                self.state = 'ratelimit'
-
-                                if ratelimit:
-                                    msg = "You reached the rate limit of the API."
-                                else:
-                                    msg = "{} consecutive errors occurred.\nPlease check your settings.".format(errorcount)
-
-                                timeout = 60 * 5 # 5 minutes
-
-                                # Adjust progress
-                                progress.showError(msg, timeout, autoretry)
-                                self.mainWindow.tree.treemodel.commitNewNodes()
-
-                            # Add job for retry
-                            if not status in allowedstatus:
-                                threadpool.addError(job)
-
-                            # Show info
-                            progress.showInfo(status,"{} response(s) with status: {}".format(statuscount[status],status))
-                            progress.showInfo('newnodes',"{} new node(s) created".format(self.mainWindow.tree.treemodel.nodecounter))
-                            progress.showInfo('threads',"{} active thread(s)".format(threadpool.getThreadCount()))
-                            progress.setRemaining(threadpool.getJobCount())
-
-                            # Custom info from modules
-                            info = job['options'].get('info', {})
-                            for name, value in info.items():
-                                progress.showInfo(name, value)
-
-                        # Abort
-                        elif progress.wasCanceled:
-                            progress.showInfo('cancel', "Disconnecting from stream, may take some time.")
-                            threadpool.stopJobs()
-
-                        # Retry
-                        elif progress.wasResumed:
-                            if progress.wasRetried:
-                                threadpool.retryJobs()
-                            else:
-                                threadpool.clearRetry()
-                                # errorcount = 0
-                                # ratelimitcount = 0
-                                threadpool.resumeJobs()
-
-                            progress.setRemaining(threadpool.getJobCount())
-                            progress.hideError()
-
-                        # Continue
-                        elif not threadpool.suspended:
-                            threadpool.resumeJobs()
-
-                        # Finished with pending errors
-                        if not threadpool.hasJobs() and threadpool.hasErrorJobs():
-                            msg = "All nodes finished but you have {} pending errors. Skip or retry?".format(threadpool.getErrorJobsCount())
-                            autoretry = False
-                            timeout = 60 * 5  # 5 minutes
-                            progress.showError(msg, timeout, autoretry)
-
-                        # Finished
-                        if not threadpool.hasJobs():
-                            progress.showInfo('cancel', "Work finished, shutting down threads.")
-                            threadpool.stopJobs()
-
-                        #-Waiting...
-                        progress.computeRate()
-                        time.sleep(1.0 / 1000.0)
-                    finally:
-                        QApplication.processEvents()
-
-            finally:
-                request_summary = [str(val)+" x "+key for key,val in statuscount.items()]
-                request_summary = ", ".join(request_summary)
-                request_end = "Fetching completed" if not progress.wasCanceled else 'Fetching cancelled by user'
-
-                self.mainWindow.logmessage("{}, {} new node(s) created. Summary of responses: {}.".format(request_end, self.mainWindow.tree.treemodel.nodecounter,request_summary))
+            # Write nodes in a separate thread
+            self.mainWindow.tree.treemodel.commitNewNodes()
+            scheduler = GuiFetchScheduler(self, progress, apimodule, options, jobqueue)
+            scheduler.run(jobs)
 
-                self.mainWindow.tree.treemodel.commitNewNodes()
         except Exception as e:
             self.mainWindow.logmessage("Error in scheduler, fetching aborted: {}.".format(str(e)))
         finally:
             progress.close()
             return not progress.wasCanceled
 
-    # Non-blocking methods (that may call blocking methods)
     def getDatabaseName(self):
         return (self.mainWindow.database.filename)
 
@@ -371,7 +377,9 @@ class ApiActions(object):
         settings['nodelevel'] = self.mainWindow.levelEdit.value()
         settings['excludetypes'] = self.mainWindow.typesEdit.text()
         settings['threads'] = self.mainWindow.threadsEdit.value()
+        settings['adaptive'] = self.mainWindow.adaptiveCheckbox.isChecked()
         settings['speed'] = self.mainWindow.speedEdit.value()
+        settings['burst'] = self.mainWindow.burstEdit.value()
         settings['errors'] = self.mainWindow.errorEdit.value()
         settings['expand'] = self.mainWindow.autoexpandCheckbox.isChecked()
         settings['logrequests'] = self.mainWindow.logCheckbox.isChecked()
@@ -382,6 +390,13 @@ class ApiActions(object):
         settings['allnodes'] = self.mainWindow.allnodesCheckbox.isChecked()
         settings['resume'] = self.mainWindow.resumeCheckbox.isChecked()
         settings['emptyonly'] = self.mainWindow.emptyCheckbox.isChecked()
+        settings['engine'] = self.mainWindow.engineEdit.currentText()
+        settings['concurrency'] = self.mainWindow.concurrencyEdit.value()
+        settings['poolconnections'] = self.mainWindow.poolconnectionsEdit.value()
+        settings['poolmaxsize'] = self.mainWindow.poolmaxsizeEdit.value()
+        settings['cache'] = self.mainWindow.cacheCheckbox.isChecked()
+        settings['cachettl'] = self.mainWindow.cachettlEdit.value()
+        settings['cachesize'] = self.mainWindow.cachesizeEdit.value()
 
         return settings
 
@@ -398,10 +413,18 @@ class ApiActions(object):
         if value is not None:
             self.mainWindow.threadsEdit.setValue(int(value))
 
+        value = settings.get('adaptive', None) # default None
+        if value is not None:
+            self.mainWindow.adaptiveCheckbox.setChecked(bool(value))
+
         value = settings.get('speed') # default 200
         if value is not None:
             self.mainWindow.speedEdit.setValue(int(value))
 
+        value = settings.get('burst') # default 1
+        if value is not None:
+            self.mainWindow.burstEdit.setValue(int(value))
+
         value = settings.get('errors', None) # default None
         if value is not None:
             self.mainWindow.errorEdit.setValue(int(value))
@@ -442,6 +465,34 @@ class ApiActions(object):
         if value is not None:
             self.mainWindow.emptyCheckbox.setChecked(bool(value))
 
+        value = settings.get('engine', None) # default None
+        if value is not None:
+            self.mainWindow.engineEdit.setCurrentText(str(value))
+
+        value = settings.get('concurrency', None) # default None
+        if value is not None:
+            self.mainWindow.concurrencyEdit.setValue(int(value))
+
+        value = settings.get('poolconnections', None) # default None
+        if value is not None:
+            self.mainWindow.poolconnectionsEdit.setValue(int(value))
+
+        value = settings.get('poolmaxsize', None) # default None
+        if value is not None:
+            self.mainWindow.poolmaxsizeEdit.setValue(int(value))
+
+        value = settings.get('cache', None) # default None
+        if value is not None:
+            self.mainWindow.cacheCheckbox.setChecked(bool(value))
+
+        value = settings.get('cachettl', None) # default None
+        if value is not None:
+            self.mainWindow.cachettlEdit.setValue(int(value))
+
+        value = settings.get('cachesize', None) # default None
+        if value is not None:
+            self.mainWindow.cachesizeEdit.setValue(int(value))
+
     def getPresetOptions(self):
         # Global options
         settings = self.getGlobalOptions()
@@ -505,15 +556,56 @@ class ApiActions(object):
 
         return indexes
 
-    # Copy node data and options
-    def prepareJob(self, index, options):
+    def getNodeQueue(self, options, indexes=None):
+        """
+        Select the nodes from the database if all nodes should be fetched,
+        otherwise return None
+        """
+        if (indexes is not None) or not options.get('allnodes', False):
+            return None
+
+        level = options.get('nodelevel', 1) - 1
+        objecttypes = options.get('excludetypes', '').replace(' ', '').split(',')
+        return NodeQueue(self.mainWindow.database.session, level, objecttypes, options)
+
+    def getJobQueue(self, apimodule, options, nodequeue):
+        """
+        Save the jobs in the database if the nodes are selected from the database,
+        an interrupted run with the same settings is continued if confirmed
+        """
+        if nodequeue is None:
+            return None
+
+        session = self.mainWindow.database.session
+        jobqueue = JobQueue.findRun(session, apimodule.name, options)
+        if jobqueue is not None:
+            msg = "A previous run with the same settings was interrupted, {} node(s) are not finished. " \
+                  "Continue the previous run?".format(len(jobqueue))
+            reply = QMessageBox.question(self.mainWindow, "Continue run", msg, QMessageBox.Yes | QMessageBox.No)
+            if reply == QMessageBox.Yes:
+                self.mainWindow.logmessage("Continuing the previous run with {} node(s).".format(len(jobqueue)))
+                return jobqueue
+            jobqueue.discard()
+
+        return JobQueue.createRun(session, apimodule.name, options, nodequeue)
+
+    def getNodeFromIndex(self, index):
+        """
+        Copy the data of a tree item, see NodeQueue for the format
+        """
         treenode = index.internalPointer()
-        node_data = deepcopy(treenode.data)
+        return {'id': treenode.id,
+                'data': deepcopy(dict(treenode.data)),
+                'lastdata': treenode.lastdata}
+
+    # Copy options, jobs refer to the node by id
+    def prepareJob(self, node, options):
         node_options = deepcopy(options)
-        node_options['lastdata'] = treenode.lastdata if hasattr(treenode, 'lastdata') else None
+        node_options['lastdata'] = node['lastdata']
+        node_options.update(node.get('options', {}))
 
-        job = {'nodeindex': index,
-               'nodedata': node_data,
+        job = {'nodeid': node['id'],
+               'nodedata': node['data'],
                'options': node_options}
 
         return job
@@ -544,6 +636,8 @@ class ServerActions(object):
                 self.apiActions.addNodes(payload)
             elif action == "fetchdata":
                 self.apiActions.fetchData()
+            elif action == "databaseprofile":
+                self.mainWindow.applyDatabaseProfile(payload)
             else:
                 self.mainWindow.logmessage("Invalid action from remote control.")
         except Exception as e:
@@ -559,6 +653,8 @@ class ServerActions(object):
             response['settings'] = options
         elif snippets == 'log':
             response['log'] = self.mainWindow.getlog()
+        elif snippets == 'database':
+            response['profile'] = self.mainWindow.database.getProfile()
 
         return response
 
@@ -1004,7 +1100,7 @@ class GuiActions(object):
     # Copy node data and options
     def prepareJob(self, index, options):
         treenode = index.internalPointer()
-        node_data = deepcopy(treenode.data)
+        node_data = deepcopy(dict(treenode.data))
         node_options = deepcopy(options)
         node_options['lastdata'] = treenode.lastdata if hasattr(treenode, 'lastdata') else None
 
@@ -1306,14 +1402,14 @@ class GuiActions(object):
             return False
 
         # Prepare job
-        job = self.apiActions.prepareJob(index, options)
+        job = self.apiActions.prepareJob(self.apiActions.getNodeFromIndex(index), options)
 
         # Open browser
         def logData(data, options, headers):
             data = sliceData(data, headers, options)
 
             # Add data
-            treeindex = job['nodeindex']
+            treeindex = index
             treenode = treeindex.internalPointer()
 
             newcount = treenode.appendNodes(data, options, False)
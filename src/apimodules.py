@@ -11,6 +11,7 @@ import os, sys, time
 import io
 from collections import OrderedDict
 import threading
+import asyncio
 
 from PySide2.QtWebEngineWidgets import QWebEngineView, QWebEnginePage, QWebEngineProfile
 from PySide2.QtWebEngineCore import QWebEngineHttpRequest
@@ -25,9 +26,18 @@ from requests_oauthlib import OAuth2Session
 from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
 from urllib.parse import urlparse, parse_qs, unquote
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
 import webbrowser
 import cchardet
 import json
+import jsoncodec
+from ratelimiter import ratelimiter
+from httpcache import httpcache, SingleFlight
+from downloader import FileDownload, reserveFilename
 
 if sys.version_info.major < 3:
     from urllib import url2pathname
@@ -66,10 +76,19 @@ class ApiTab(QScrollArea):
         self.loginWindow = None
         self.name = name
         self.connected = False
-        self.lastrequest = None
         self.speed = None
-        self.lock_session = threading.Lock()
+        self.burst = 1
+        self.credential = ''
+        self.lock_session = threading.RLock()
         self.sessions = []
+        self.adapter = None
+        self.lock_stats = threading.Lock()
+        self.connectionstats = {'requests': 0, 'connections': 0}
+        self.cache = False
+        self.cachettl = 24
+        self.cachesize = 500
+        self.cachestats = {'hits': 0, 'revalidated': 0, 'coalesced': 0}
+        self.flights = SingleFlight()
 
         # Layout       
         self.mainLayout = QFormLayout()
@@ -1011,10 +1030,14 @@ class ApiTab(QScrollArea):
 
     def getProxies(self, reload=False):
         if not hasattr(self, "proxies") or reload:
-            self.proxies = {}
+            proxies = []
             if hasattr(self, "proxyEdit"):
-                self.proxies = self.proxyEdit.text().strip()
-                self.proxies = self.proxies .split(";")
+                proxies = [proxy.strip() for proxy in self.proxyEdit.text().split(";") if proxy.strip() != '']
+
+            # Pooled connections belong to the proxy
+            if hasattr(self, "proxies") and (set(proxies) != set(self.proxies)):
+                self.resetConnectionPool()
+            self.proxies = proxies
 
         if len(self.proxies) == 0:
             proxy = ""
@@ -1055,9 +1078,17 @@ class ApiTab(QScrollArea):
             if lastdata is not None:
                 return None
 
+        # continue the page count after the cursor of an interrupted run (see JobQueue)
+        lastpage = getDictValueOrNone(options, 'lastdata.currentpage', dump=False)
+        lastparams = getDictValueOrNone(options, 'lastdata.params', dump=False)
+        if (lastpage is not None) and ('currentpage' not in options):
+            options['currentpage'] = int(lastpage) + 1
+
         # paging by auto count
         if (options.get('paging_type') == "count") and (options.get('param_paging', '') is not None):
             offset = options.get('offset_start', 1)
+            if isinstance(lastparams, dict) and (lastparams.get(options.get('param_paging', '')) is not None):
+                offset = int(lastparams[options.get('param_paging', '')]) + options.get('offset_step', 1)
             options['params'][options.get('param_paging', '')] = offset
 
         # paging by key (continue previous fetching process based on last fetched child offcut node)
@@ -1220,8 +1251,8 @@ class ApiTab(QScrollArea):
                 session = requests.Session()
                 session.proxies.update(self.getProxies())
 
-                # Mount new adapters = don't cache connections
-                adapter = requests.adapters.HTTPAdapter()
+                # Mount the shared adapter = keep connections alive across sessions
+                adapter = self.initConnectionPool()
                 session.mount('http://', adapter)
                 session.mount('https://', adapter)
                 session.mount('file://', LocalFileAdapter())
@@ -1230,79 +1261,343 @@ class ApiTab(QScrollArea):
 
         return session
 
+    def initConnectionPool(self, connections=None, maxsize=None):
+        """
+        Return the adapter shared by all sessions or create a new adapter if the pool size changed
+        :param connections: Number of hosts with pooled connections
+        :param maxsize: Number of connections kept alive for each host
+        :return: adapter
+        """
+        with self.lock_session:
+            adapter = self.adapter
+            connections = connections or (adapter.poolsize[0] if adapter is not None else 10)
+            maxsize = maxsize or (adapter.poolsize[1] if adapter is not None else 10)
+
+            if (adapter is None) or (adapter.poolsize != (connections, maxsize)):
+                self.resetConnectionPool()
+                self.adapter = PooledAdapter(self.countConnection, connections, maxsize)
+
+            return self.adapter
+
+    def resetConnectionPool(self):
+        """
+        Close all pooled connections, e.g. after login or proxy changes
+        """
+        with self.lock_session:
+            # Sessions are created again with the new adapter, the list keeps its size for initSession()
+            for no in range(len(self.sessions)):
+                self.sessions[no] = None
+
+            if self.adapter is not None:
+                self.adapter.close()
+                self.adapter = None
+
+    def countConnection(self, key):
+        with self.lock_stats:
+            self.connectionstats[key] += 1
+
+    def getConnectionStats(self):
+        """
+        Number of requests and new connections of the pooled adapters
+        """
+        with self.lock_stats:
+            return dict(self.connectionstats)
+
+    def getConnectionReuse(self, since=None):
+        """
+        Share of requests sent on kept-alive connections since the given stats
+        """
+        stats = self.getConnectionStats()
+        requests = stats['requests'] - (since['requests'] if since is not None else 0)
+        connections = stats['connections'] - (since['connections'] if since is not None else 0)
+        return max(0, requests - connections) / requests if requests > 0 else None
+
     def closeSession(self, no=0):
         """
-        Close the session
+        Discard the session, connections of the shared adapter are kept alive
         :param no: number of session
         :return: None
         """
         with self.lock_session:
             if (len(self.sessions) > no) and (self.sessions[no] is not None):
-                self.sessions[no].close()
                 self.sessions[no] = None
 
-    def request(self, session_no=0, path=None, args=None, headers=None, method="GET", payload=None,foldername=None,
+    def initRateLimit(self, options):
+        self.speed = options.get('speed', None)
+        self.burst = options.get('burst', 1)
+
+        # Different tokens may have different quotas
+        token = options.get('access_token', '')
+        self.credential = hashlib.sha1(token.encode('utf-8')).hexdigest() if token else ''
+
+    def getRateLimit(self, path):
+        """
+        Return the token bucket of the module, host and credential,
+        None if the speed is not limited
+        """
+        if not self.speed:
+            return None
+
+        key = (self.name, urlparse(path).netloc, self.credential)
+        return ratelimiter.getBucket(key, self.speed / 60.0, self.burst)
+
+    def initCache(self, options):
+        self.cache = options.get('cache', False)
+        self.cachettl = options.get('cachettl', 24)
+        self.cachesize = options.get('cachesize', 500)
+
+    def getCachedResponse(self, method, path, args, headers, payload, download=False):
+        """
+        Look up the request in the response cache,
+        returns the cache key, the cached response and whether the response is still fresh
+        """
+        if not self.cache or download:
+            return None, None, False
+
+        key = httpcache.getKey(method, path, args, headers, payload, self.credential)
+        if key is None:
+            return None, None, False
+
+        cached = httpcache.get(key)
+        if cached is None:
+            return key, None, False
+
+        return key, cached, cached.getAge() < self.cachettl * 3600
+
+    def getCachedResult(self, cached, path, args, format, revalidated=False):
+        """
+        Result of request() from a fresh or revalidated cache entry
+        """
+        self.countCache('revalidated' if revalidated else 'hits')
+
+        data = self.getResponseData(cached, path, args, format)
+        status = 'fetched (' + str(cached.status_code) + ')'
+        return data, dict(cached.headers), status
+
+    def storeCachedResponse(self, key, response):
+        """
+        Store successful responses after the body was downloaded
+        """
+        if (key is not None) and (200 <= response.status_code < 300):
+            httpcache.put(key, str(response.url), response.status_code, dict(list(response.headers.items())),
+                          response.content, self.cachesize * 1024 * 1024)
+
+    def countCache(self, key):
+        with self.lock_stats:
+            self.cachestats[key] += 1
+
+    def getCacheStats(self):
+        """
+        Number of responses served from the cache, revalidated by the server
+        and shared by concurrent identical requests
+        """
+        with self.lock_stats:
+            return dict(self.cachestats)
+
+    def getCacheHits(self, since=None):
+        stats = self.getCacheStats()
+        return {key: value - (since[key] if since is not None else 0) for key, value in stats.items()}
+
+    def getFlightKey(self, method, path, args, headers, payload, download=False):
+        """
+        Key of requests that may be coalesced, None for downloads, local files and other methods than GET
+        """
+        if download or (method.upper() not in ['GET', 'HEAD']) or path.startswith('file://'):
+            return None
+
+        return httpcache.getKey(method, path, args, headers, payload, self.credential)
+
+    def prepareRequest(self, method, path, args, headers, payload, format, download=False):
+        """
+        Steps of sendRequest() and sendRequestAsync() before sending: fresh responses are served
+        from the cache, stale responses are revalidated.
+        Returns the cache key, the cached response, the request headers and the result of fresh responses
+        """
+        cachekey, cached, fresh = self.getCachedResponse(method, path, args, headers, payload, download)
+        if fresh:
+            return cachekey, cached, headers, self.getCachedResult(cached, path, args, format)
+
+        if cached is not None:
+            headers = dict(headers or {})
+            headers.update(cached.getValidators())
+
+        return cachekey, cached, headers, None
+
+    def checkResponse(self, response, ratelimit=None):
+        """
+        Steps of sendRequest() and sendRequestAsync() after the headers were received:
+        check the size and adjust the rate limit. Returns the status and the response headers
+        """
+        if int(response.headers.get('content-length',0)) > (self.maxsize * 1024 * 1024):
+            raise DataTooBigError(f"File is too big, content length is {response.headers['content-length']}.")
+
+        status = 'fetched' if response.status_code < 400 else 'error'
+        status = status + ' (' + str(response.status_code) + ')'
+        headers = dict(list(response.headers.items()))
+        if ratelimit is not None:
+            ratelimit.update(headers, response.status_code)
+
+        return status, headers
+
+    def getRevalidatedResult(self, response, cachekey, cached, path, args, format):
+        """
+        Result from the cache if the server confirmed the stale response, otherwise None
+        """
+        if (cached is None) or (response.status_code != 304):
+            return None
+
+        httpcache.refresh(cachekey, response.headers)
+        return self.getCachedResult(cached, path, args, format, True)
+
+    def canSendAsync(self, path, download=False):
+        """
+        Check whether the httpx client of the async engine can send the request.
+        Local files are read by the adapter of the requests session, downloads use ranged requests
+        and cookies in the jar of the sessions are only sent by request()
+        """
+        if path.startswith('file://') or download:
+            return False
+
+        with self.lock_session:
+            return not any(len(session.cookies) > 0 for session in self.sessions if session is not None)
+
+    def canStreamResponse(self, response, format, cachekey=None, download=False):
+        """
+        Check whether the JSON response is decoded incrementally,
+        cached responses and downloads need the complete body
+        """
+        if (format != 'json') or (cachekey is not None) or download:
+            return False
+
+        return jsoncodec.canStream(response)
+
+    def getStreamData(self, chunks):
+        """
+        Decode the JSON body from the byte chunks of requests
+        """
+        try:
+            return jsoncodec.loadsStream(chunks)
+        except Exception as e:
+            return {'error': 'Data could not be converted to JSON', 'exception': str(e)}
+
+    async def getStreamDataAsync(self, chunks):
+        """
+        Decode the JSON body from the byte chunks of httpx
+        """
+        try:
+            return await jsoncodec.loadsStreamAsync(chunks)
+        except Exception as e:
+            return {'error': 'Data could not be converted to JSON', 'exception': str(e)}
+
+    def getDownloadFilename(self, response, path, foldername=None, filename=None, fileext=None):
+        if (foldername is None) or (filename is None):
+            return None
+
+        if fileext is None:
+            contentype = response.headers.get("content-type")
+            if contentype is not None:
+                guessed_ext = guess_all_extensions(contentype)
+                fileext = guessed_ext[-1] if len(guessed_ext) > 0 else None
+
+        # Concurrent downloads with the same name write to different files
+        return reserveFilename(lambda exists: makefilename(path, foldername, filename, fileext, exists=exists))
+
+    def getResponseData(self, response, path, args, format='json', fullfilename=None):
+        """
+        Parse the response of requests or httpx after the body was downloaded
+        """
+        data = {
+            'content-type': response.headers.get("content-type",""),
+            'sourcepath': path,'sourcequery': args,'finalurl': str(response.url)
+        }
+
+        if fullfilename is not None:
+            data['filename'] = os.path.basename(fullfilename)
+            data['filepath'] = fullfilename
+
+        # Text
+        if format == 'text':
+            data['text'] = response.text
+
+        # Scrape links
+        elif format == 'links':
+            try:
+                links, base = extractLinks(response.text, str(response.url))
+                data['links'] = links
+                data['base'] = base
+            except Exception as  e:
+                data['error'] = 'Could not extract Links.'
+                data['message'] = str(e)
+                data['response'] = response.text
+
+        # JSON
+        elif format == 'json':
+            try:
+                data = jsoncodec.loadsResponse(response)
+            except Exception as e:
+                # self.logMessage("No valid JSON data, try to convert XML to JSON ("+str(e)+")")
+                # try:
+                #     data = xmlToJson(response.text)
+                # except:
+                data = {'error': 'Data could not be converted to JSON','response': response.text,'exception':str(e)}
+
+        # JSON
+        elif format == 'xml':
+            try:
+                data = xmlToJson(response.text)
+            except Exception as e:
+                data = {'error': 'Data could not be converted to JSON','response': response.text,'exception':str(e)}
+
+        return data
+
+    def request(self, session_no=0, path=None, args=None, headers=None, method="GET", payload=None, foldername=None,
+                filename=None, fileext=None, format='json'):
+        """
+        Send the request or wait for an identical request of another thread
+        """
+        key = self.getFlightKey(method, path, args, headers, payload, (foldername is not None) and (filename is not None))
+        if key is None:
+            return self.sendRequest(session_no, path, args, headers, method, payload, foldername, filename, fileext, format)
+
+        future, sender = self.flights.join(key)
+        if not sender:
+            self.countCache('coalesced')
+            return deepcopy(future.result())
+
+        try:
+            result = self.sendRequest(session_no, path, args, headers, method, payload, foldername, filename, fileext, format)
+        except BaseException as e:
+            self.flights.leave(key, exception=e)
+            raise
+        else:
+            self.flights.leave(key, result)
+            return result
+
+    def sendRequest(self, session_no=0, path=None, args=None, headers=None, method="GET", payload=None,foldername=None,
                                                       filename=None, fileext=None, format='json'):
         """
         Start a new threadsafe session and request
         """
 
         def download(response,foldername=None,filename=None,fileext=None):
-            if foldername is not None and filename is not None:
-                if fileext is None:
-                    contentype = response.headers.get("content-type")
-                    if contentype is not None:
-                        guessed_ext = guess_all_extensions(contentype)
-                        fileext = guessed_ext[-1] if len(guessed_ext) > 0 else None
-                    else:
-                        fileext = None
-
-
-                fullfilename = makefilename(path,foldername, filename, fileext)
-                file = open(fullfilename, 'wb')
-            else:
-                fullfilename = None
-                file = None
-
-            # requests completely downloads data to memory if not stream=True
-            # iter_content, text and content all fall back to the previously downloaded content
-            # no need to download into string object a second time
-
-            # try:
-            #     content = io.BytesIO()
-            #     try:
-            #         for chunk in response.iter_content(1024):
-            #             content.write(chunk)
-            #             if file is not None:
-            #                 file.write(chunk)
-            #
-            #         out = content.getvalue().decode('utf-8')
-            #     except Exception as e:
-            #         out = str(e)
-            #     finally:
-            #         content.close()
-            # finally:
-            #     if file is not None:
-            #         file.close()
-
-            if file is not None:
-                try:
-                    for chunk in response.iter_content(1024):
-                        file.write(chunk)
-                finally:
-                    file.close()
+            fullfilename = self.getDownloadFilename(response, path, foldername, filename, fileext)
 
+            # Written in large chunks and ranged segments, the body is not read into memory
+            if fullfilename is not None:
+                FileDownload(session, response, fullfilename, self.timeout, lambda: self.connected).run()
 
             return fullfilename
 
-        #Throttle speed
-        if (self.speed is not None) and (self.lastrequest is not None):
-            pause = ((60 * 1000) / float(self.speed)) - self.lastrequest.msecsTo(QDateTime.currentDateTime())
-            while (self.connected) and (pause > 0):
-                time.sleep(0.1)
-                pause = ((60 * 1000) / float(self.speed)) - self.lastrequest.msecsTo(QDateTime.currentDateTime())
+        # Serve identical requests from the cache without sending and throttling them
+        isdownload = (foldername is not None) and (filename is not None)
+        cachekey, cached, headers, result = self.prepareRequest(method, path, args, headers, payload, format, isdownload)
+        if result is not None:
+            return result
 
-        self.lastrequest = QDateTime.currentDateTime()
+        #Throttle speed
+        ratelimit = self.getRateLimit(path)
+        if ratelimit is not None:
+            ratelimit.acquire(lambda: self.connected)
 
         if session_no is None:
             session_no = 0
@@ -1341,58 +1636,21 @@ class ApiTab(QScrollArea):
                     else:
                         break
 
-                if int(response.headers.get('content-length',0)) > (self.maxsize * 1024 * 1024):
-                    raise DataTooBigError(f"File is too big, content length is {response.headers['content-length']}.")
+                status, headers = self.checkResponse(response, ratelimit)
 
-                status = 'fetched' if response.ok else 'error'
-                status = status + ' (' + str(response.status_code) + ')'
-                headers = dict(list(response.headers.items()))
+                # Not modified since the response was cached
+                result = self.getRevalidatedResult(response, cachekey, cached, path, args, format)
+                if result is not None:
+                    data, headers, status = result
 
-                # Download data
-                data = {
-                    'content-type': response.headers.get("content-type",""),
-                    'sourcepath': path,'sourcequery': args,'finalurl': response.url
-                }
-
-                fullfilename = download(response, foldername, filename, fileext)
-
-                if fullfilename is not None:
-                    data['filename'] = os.path.basename(fullfilename)
-                    data['filepath'] = fullfilename
-
-                # Text
-                if format == 'text':
-                        data['text'] = response.text  # str(response.text)
-
-                 # Scrape links
-                elif format == 'links':
-                    try:
-                        links, base = extractLinks(response.text, response.url)
-                        data['links'] = links
-                        data['base'] = base
-                    except Exception as  e:
-                        data['error'] = 'Could not extract Links.'
-                        data['message'] = str(e)
-                        data['response'] = response.text
-
-                # JSON
-                elif format == 'json':
-                    try:
-                        data = response.json() if response.text != '' else []
-                    except Exception as e:
-                        # self.logMessage("No valid JSON data, try to convert XML to JSON ("+str(e)+")")
-                        # try:
-                        #     data = xmlToJson(response.text)
-                        # except:
-                        data = {'error': 'Data could not be converted to JSON','response': response.text,'exception':str(e)}
-
-                # JSON
-                elif format == 'xml':
-                    try:
-                        data = xmlToJson(response.text)
-                    except Exception as e:
-                        data = {'error': 'Data could not be converted to JSON','response': response.text,'exception':str(e)}
+                # Decode large JSON responses without reading the body into memory
+                elif self.canStreamResponse(response, format, cachekey, isdownload):
+                    data = self.getStreamData(response.iter_content(jsoncodec.STREAM_CHUNK))
 
+                else:
+                    fullfilename = download(response, foldername, filename, fileext)
+                    data = self.getResponseData(response, path, args, format, fullfilename)
+                    self.storeCachedResponse(cachekey, response)
 
             except Exception as e:
             #except (DataTooBigError, HTTPError, ReadTimeout, ConnectionError, InvalidURL, MissingSchema) as e:
@@ -1407,6 +1665,111 @@ class ApiTab(QScrollArea):
 
             return data, headers, status
 
+    async def requestAsync(self, client, session_no=0, path=None, args=None, headers=None, method="GET", payload=None,
+                           foldername=None, filename=None, fileext=None, format='json'):
+        """
+        Send the request or wait for an identical request of another task
+        """
+        key = self.getFlightKey(method, path, args, headers, payload, (foldername is not None) and (filename is not None))
+        if key is None:
+            return await self.sendRequestAsync(client, session_no, path, args, headers, method, payload,
+                                               foldername, filename, fileext, format)
+
+        future, sender = self.flights.join(key)
+        if not sender:
+            self.countCache('coalesced')
+            return deepcopy(await asyncio.wrap_future(future))
+
+        try:
+            result = await self.sendRequestAsync(client, session_no, path, args, headers, method, payload,
+                                                 foldername, filename, fileext, format)
+        except BaseException as e:
+            self.flights.leave(key, exception=e)
+            raise
+        else:
+            self.flights.leave(key, result)
+            return result
+
+    async def sendRequestAsync(self, client, session_no=0, path=None, args=None, headers=None, method="GET", payload=None,
+                               foldername=None, filename=None, fileext=None, format='json'):
+        """
+        Send a request with the httpx client of the async engine,
+        the result is the same as from request()
+        """
+
+        if not self.canSendAsync(path, (foldername is not None) and (filename is not None)):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.sendRequest, session_no, path, args, headers, method, payload,
+                                              foldername, filename, fileext, format)
+
+        # Serve identical requests from the cache without sending and throttling them
+        cachekey, cached, headers, result = self.prepareRequest(method, path, args, headers, payload, format)
+        if result is not None:
+            return result
+
+        #Throttle speed
+        ratelimit = self.getRateLimit(path)
+        if ratelimit is not None:
+            await ratelimit.acquireAsync(lambda: self.connected)
+
+        # The client is shared by all requests, cookies are sent in the header
+        if isinstance(payload, (MultipartEncoder, MultipartEncoderMonitor)):
+            payload = payload.read()
+        content, data = (payload, None) if isinstance(payload, (str, bytes)) else (None, payload)
+        params = {key: value for key, value in args.items() if value is not None} if args else None
+
+        response = None
+        try:
+            try:
+                maxretries = 3
+                while True:
+                    try:
+                        request = client.build_request(method, path, params=params, headers=headers,
+                                                       content=content, data=data, timeout=self.timeout)
+                        response = await client.send(request, stream=True)
+
+                    except httpx.TransportError as e:
+                        maxretries -= 1
+                        if (maxretries > 0) and (self.connected):
+                            await asyncio.sleep(0.1)
+                            self.logMessage("Automatic retry: Request Error: {0}".format(str(e)))
+                        else:
+                            raise e
+                    else:
+                        break
+
+                status, headers = self.checkResponse(response, ratelimit)
+
+                # Not modified since the response was cached
+                result = self.getRevalidatedResult(response, cachekey, cached, path, args, format)
+                if result is not None:
+                    data, headers, status = result
+
+                # Decode large JSON responses without reading the body into memory
+                elif self.canStreamResponse(response, format, cachekey):
+                    data = await self.getStreamDataAsync(response.aiter_bytes(jsoncodec.STREAM_CHUNK))
+
+                else:
+                    await response.aread()
+                    data = self.getResponseData(response, path, args, format)
+                    self.storeCachedResponse(cachekey, response)
+
+            except Exception as e:
+                status = 'request error'
+                data = {'error':str(e)}
+                headers = {}
+        finally:
+            if response is not None:
+                await response.aclose()
+
+        return data, headers, status
+
+    async def fetchDataAsync(self, nodedata, options, logData, logMessage, logProgress, client):
+        """
+        Modules without async implementation run fetchData() in the executor of the async engine
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.fetchData, nodedata, options, logData, logMessage, logProgress)
 
     def disconnectSocket(self):
         """Used to hardly disconnect the streaming client"""
@@ -1751,16 +2114,47 @@ class AuthTab(ApiTab):
         super(AuthTab, self).setOptions(options)
 
     def fetchData(self, nodedata, options=None, logData=None, logMessage=None, logProgress=None):
+        session_no = options.get('threadnumber',0)
+        self.closeSession(session_no)
+
+        pages = self.fetchPages(nodedata, options, logData, logMessage, logProgress)
+        try:
+            request = next(pages)
+            while True:
+                request = pages.send(self.request(session_no, *request))
+        except StopIteration as e:
+            return e.value
+
+    async def fetchDataAsync(self, nodedata, options, logData, logMessage, logProgress, client):
+        # Modules with their own fetchData() are not converted yet, OAuth1 requests are signed by the session
+        if (type(self).fetchData is not AuthTab.fetchData) or (options.get('auth_type') == 'OAuth1'):
+            return await super(AuthTab, self).fetchDataAsync(nodedata, options, logData, logMessage, logProgress, client)
+
+        session_no = options.get('threadnumber',0)
+        pages = self.fetchPages(nodedata, options, logData, logMessage, logProgress)
+        try:
+            request = next(pages)
+            while True:
+                request = pages.send(await self.requestAsync(client, session_no, *request))
+        except StopIteration as e:
+            return e.value
+
+    def fetchPages(self, nodedata, options, logData, logMessage, logProgress):
+        """
+        Generator with the page loop, yields the arguments of a request
+        and receives the data, headers and status of the response
+        """
         # Preconditions
         if not self.auth_userauthorized and self.auth_preregistered:
             raise Exception('You are not authorized, login please!')
 
-        session_no = options.get('threadnumber',0)
-        self.closeSession(session_no)
         self.connected = True
-        self.speed = options.get('speed', None)
+        self.initRateLimit(options)
+        self.initCache(options)
         self.timeout = options.get('timeout', 15)
         self.maxsize = options.get('maxsize', 5)
+        self.getProxies(True)
+        self.initConnectionPool(options.get('poolconnections'), options.get('poolmaxsize'))
 
         # Init pagination
         options = self.initPagingOptions(nodedata, options)
@@ -1798,8 +2192,8 @@ class AuthTab(ApiTab):
 
             # data
             options['querytime'] = str(datetime.now())
-            data, headers, status = self.request(session_no,urlpath, urlparams, requestheaders, method, payload,
-                                                 foldername, filename, fileext, format=format)
+            data, headers, status = yield (urlpath, urlparams, requestheaders, method, payload,
+                                           foldername, filename, fileext, format)
 
             # status handling
             options['querystatus'] = status
@@ -1843,7 +2237,7 @@ class AuthTab(ApiTab):
         :param session_no: the number of the session used for login
         :return:
         """
-        self.closeSession(session_no)
+        self.resetConnectionPool()
         options = self.getOptions()
 
         if options['auth_type'] == 'OAuth2 Client Credentials':
@@ -2156,19 +2550,25 @@ class AuthTab(ApiTab):
         :param no: session number
         :return: session object
         """
+        with self.lock_session:
+            while (len(self.sessions) <= no):
+                self.sessions.append(None)
+
+            session = self.sessions[no] if not renew else None
+            if session is None:
+                if (self.tokenEdit.text() == '') or (self.tokensecretEdit.text() == ''):
+                    raise Exception("No access, login please!")
 
-        while (len(self.sessions) <= no):
-            self.sessions.append(None)
+                service = self.getOAuth1Service()
+                session = service.get_session((self.tokenEdit.text(), self.tokensecretEdit.text()))
+                session.proxies.update(self.getProxies())
 
-        session = self.sessions[no] if not renew else None
-        if session is None:
-            if (self.tokenEdit.text() == '') or (self.tokensecretEdit.text() == ''):
-                raise Exception("No access, login please!")
+                adapter = self.initConnectionPool()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
 
-            service = self.getOAuth1Service()
-            session = service.get_session((self.tokenEdit.text(), self.tokensecretEdit.text()))
+            self.sessions[no] = session
 
-        self.sessions[no] = session
         return session
 
     def initOAuth2Session(self, no=0, renew=False):
@@ -2472,9 +2872,12 @@ class FacebookTab(AuthTab):
             raise Exception('Access token is missing, login please!')
 
         self.connected = True
-        self.speed = options.get('speed',None)
+        self.initRateLimit(options)
+        self.initCache(options)
         self.timeout = options.get('timeout', 15)
         self.maxsize = options.get('maxsize', 5)
+        self.getProxies(True)
+        self.initConnectionPool(options.get('poolconnections'), options.get('poolmaxsize'))
         session_no = options.get('threadnumber', 0)
 
         # Init pagination
@@ -2508,7 +2911,7 @@ class FacebookTab(AuthTab):
 
             # rate limit info
             if 'x-app-usage' in headers:
-                appusage = json.loads(headers['x-app-usage'])
+                appusage = jsoncodec.loads(headers['x-app-usage'])
                 appusage = appusage.get('call_count', 'Undefined')
                 if appusage > 0:
                     options['info'] = {'x-app-usage': "{} percent of app level rate limit reached.".format(appusage)}
@@ -2893,7 +3296,7 @@ class TwitterTab(AuthTab):
         if not response.ok :
              return None
 
-        data = response.json() if response.text != '' else []
+        data = jsoncodec.loadsResponse(response)
         return getDictValueOrNone(data, 'screen_name')
 
     def fetchData(self, nodedata, options=None, logData=None, logMessage=None, logProgress=None):
@@ -2902,9 +3305,12 @@ class TwitterTab(AuthTab):
             raise Exception('You are not authorized, login please!')
 
         self.connected = True
-        self.speed = options.get('speed', None)
+        self.initRateLimit(options)
+        self.initCache(options)
         self.timeout = options.get('timeout', 15)
         self.maxsize = options.get('maxsize', 5)
+        self.getProxies(True)
+        self.initConnectionPool(options.get('poolconnections'), options.get('poolmaxsize'))
         session_no = options.get('threadnumber',0)
 
         # Init pagination
@@ -3057,7 +3463,7 @@ class TwitterStreamingTab(TwitterTab):
                             break
                         if line:
                             try:
-                                data = json.loads(line)
+                                data = jsoncodec.loads(line)
                             except ValueError:  # pragma: no cover
                                 raise Exception("Unable to decode response, not valid JSON")
                             else:
@@ -3098,6 +3504,8 @@ class TwitterStreamingTab(TwitterTab):
 
         self.timeout = options.get('timeout',30)
         self.maxsize = options.get('maxsize', 5)
+        self.getProxies(True)
+        self.initConnectionPool(options.get('poolconnections'), options.get('poolmaxsize'))
 
         # data
         session_no = options.get('threadnumber',0)
@@ -3244,5 +3652,44 @@ class LocalFileAdapter(requests.adapters.BaseAdapter):
     def close(self):
         pass
 
+class PooledAdapter(requests.adapters.HTTPAdapter):
+    """
+    Adapter shared by the sessions of a module, urllib3 keeps a connection pool for each host.
+    Counts requests and new connections to report the reuse rate.
+    """
+
+    def __init__(self, count, connections=10, maxsize=10):
+        self.count = count
+        self.poolsize = (connections, maxsize)
+        super(PooledAdapter, self).__init__(pool_connections=connections, pool_maxsize=maxsize)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(PooledAdapter, self).init_poolmanager(*args, **kwargs)
+        self.countConnections(self.poolmanager)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        counted = proxy in self.proxy_manager
+        manager = super(PooledAdapter, self).proxy_manager_for(proxy, **proxy_kwargs)
+        if not counted:
+            self.countConnections(manager)
+        return manager
+
+    def countConnections(self, manager):
+        count = self.count
+
+        def countingPool(poolclass):
+            class CountingPool(poolclass):
+                def _new_conn(self):
+                    count('connections')
+                    return super(CountingPool, self)._new_conn()
+            return CountingPool
+
+        manager.pool_classes_by_scheme = {scheme: countingPool(poolclass)
+                                          for scheme, poolclass in manager.pool_classes_by_scheme.items()}
+
+    def send(self, request, *args, **kwargs):
+        self.count('requests')
+        return super(PooledAdapter, self).send(request, *args, **kwargs)
+
 class DataTooBigError(Exception):
     pass
\ No newline at end of file
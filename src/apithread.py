@@ -2,15 +2,18 @@ import queue
 import collections
 import threading
 import time
+import re
 from copy import deepcopy
 from utilities import *
 
 class ApiThreadPool():
-    def __init__(self, module):
+    def __init__(self, module, adaptive=False):
         self.input = collections.deque()
         self.errors = queue.Queue()
-        self.output = queue.Queue(100)
-        self.logs = queue.Queue()
+        self.output = NotifyingQueue(100, self.notify)
+        self.logs = NotifyingQueue(0, self.notify)
+        self.wakeup = threading.Event()
+        self.notifycallback = None
         self.module = module
         self.threads = []
         self.pool_lock = threading.Lock()
@@ -19,6 +22,7 @@ class ApiThreadPool():
         self.jobcount = 0
         self.jobsadded = False
         self.suspended = False
+        self.controller = ConcurrencyController() if adaptive else None
 
     def getLogMessage(self):
         try:
@@ -32,6 +36,38 @@ class ApiThreadPool():
         finally:
             return msg
 
+    def getLogMessages(self):
+        msgs = []
+        while True:
+            try:
+                msgs.append(self.logs.get_nowait())
+                self.logs.task_done()
+            except queue.Empty:
+                return msgs
+
+    # Notifications
+    def setNotify(self, callback):
+        """
+        The callback is called from the threads when results or log messages are available
+        """
+        self.notifycallback = callback
+
+    def notify(self):
+        # Only notify once until the results were taken
+        if not self.wakeup.is_set():
+            self.wakeup.set()
+            if self.notifycallback is not None:
+                self.notifycallback()
+
+    def hasResults(self):
+        return self.wakeup.is_set()
+
+    def waitForJobs(self, timeout=None):
+        """
+        Block until results or log messages are available, returns False after the timeout
+        """
+        return self.wakeup.wait(timeout)
+
     # Jobs
     def addJob(self, job):
         if job is not None:
@@ -56,20 +92,39 @@ class ApiThreadPool():
         finally:
             return job
 
+    def getJobs(self, maxcount=None):
+        """
+        Take all available results without blocking
+        """
+        self.wakeup.clear()
+        jobs = []
+        while (maxcount is None) or (len(jobs) < maxcount):
+            try:
+                jobs.append(self.output.get_nowait())
+                self.output.task_done()
+            except queue.Empty:
+                break
+
+        # Results left for the next batch
+        if not (self.output.empty() and self.logs.empty()):
+            self.wakeup.set()
+
+        return jobs
+
     def suspendJobs(self):
         self.suspended = True
-        for thread in self.threads:
+        for thread in list(self.threads):
             thread.process.clear()
 
     def resumeJobs(self):
-        for thread in self.threads:
+        for thread in list(self.threads):
             thread.process.set()
 
         self.spawnThreads()
         self.suspended = False
 
     def stopJobs(self):
-        for thread in self.threads:
+        for thread in list(self.threads):
             thread.halt.set()
             thread.process.set()
 
@@ -97,7 +152,7 @@ class ApiThreadPool():
         if not self.output.empty():
             return True
 
-        for thread in self.threads:
+        for thread in list(self.threads):
             if thread.process.isSet():
                 return True
 
@@ -105,7 +160,7 @@ class ApiThreadPool():
 
     # Errors
     def addError(self, job):
-        newjob = {'nodeindex': job['nodeindex'],
+        newjob = {'nodeid': job['nodeid'],
                   'nodedata': deepcopy(job['nodedata']),
                   'options': deepcopy(job['options'])}
         self.errors.put(newjob)
@@ -132,7 +187,11 @@ class ApiThreadPool():
 
     # Threads
     def addThread(self):
-        thread = ApiThread(self.input, self.errors, self.output, self.module, self, self.logs, self.threadcount+1)
+        # Reuse the numbers of stopped threads
+        numbers = [thread.number for thread in self.threads]
+        number = min(set(range(1, len(numbers) + 2)) - set(numbers))
+
+        thread = ApiThread(self.input, self.errors, self.output, self.module, self, self.logs, number)
         self.threadcount += 1
         self.threads.append(thread)
 
@@ -140,22 +199,57 @@ class ApiThreadPool():
         thread.process.set()
 
     def removeThread(self):
-        if count(self.threads):
-            self.threads[0].halt.set()
-            self.threads[0].process.set()
+        # The thread finishes the current job before it stops
+        running = self.getRunningThreads()
+        if len(running):
+            running[-1].retire.set()
+            running[-1].process.set()
+
+    def getRunningThreads(self):
+        return [thread for thread in self.threads if not (thread.halt.is_set() or thread.retire.is_set())]
 
     def spawnThreads(self, threadcount= None):
         if threadcount is not None:
             self.maxthreads = threadcount
+            if self.controller is not None:
+                self.controller.setMaximum(threadcount)
+
+        if self.controller is not None:
+            maxthreads = self.controller.threads
+        else:
+            maxthreads = self.maxthreads
 
-        threadcount = min(len(self.input), self.maxthreads)
-        threadcount = max(1, threadcount)
+        # Start threads only for waiting jobs, running threads are only stopped to decrease the maximum
+        threadcount = min(len(self.input), maxthreads)
+        threadcount = max(1, threadcount, min(len(self.getRunningThreads()), maxthreads))
 
         self.setThreadCount(threadcount)
 
-    def threadFinished(self):
+    def adaptThreads(self):
+        """
+        Adjust the number of threads to the latency and errors of the responses
+        """
+        if (self.controller is None) or self.suspended:
+            return False
+
+        msg = self.controller.adapt(len(self.input))
+        if msg is None:
+            return False
+
+        self.logs.put(msg)
+        self.spawnThreads()
+        return True
+
+    def addResponse(self, latency, status):
+        if self.controller is not None:
+            self.controller.addResponse(latency, status)
+
+    def threadFinished(self, thread=None):
         with self.pool_lock:
             self.threadcount -= 1
+            if thread in self.threads:
+                self.threads.remove(thread)
+
             if (self.threadcount == 0):
                 self.clearJobs()
                 self.output.put(None)  #sentinel
@@ -166,14 +260,114 @@ class ApiThreadPool():
 
     def setThreadCount(self,threadcount):
         with self.pool_lock:
-            diff = threadcount - self.threadcount
+            diff = threadcount - len(self.getRunningThreads())
             if diff > 0:
                 for x in range(diff):
                     self.addThread()
             elif diff < 0:
-                for x in range(diff):
+                for x in range(-diff):
                     self.removeThread()
 
+class ConcurrencyController():
+    """
+    Adjust the number of threads by additive increase and multiplicative decrease (AIMD).
+
+    The controller starts with one thread and doubles the threads (slow start) until
+    the first congestion signal: rate limits (429), server errors (5xx or request errors)
+    or a median latency of more than twice the lowest median latency. Afterwards,
+    one thread is added in each interval and the threads are halved on congestion.
+    Threads are only added if there are more waiting jobs than threads.
+    The latency includes the time waiting for the rate limit, so threads are
+    not added if they would only wait for the speed limit.
+    """
+
+    def __init__(self, maxthreads=1, interval=5, minresponses=5):
+        self.lock = threading.Lock()
+        self.maxthreads = max(1, maxthreads)
+        self.threads = 1
+        self.slowstart = True
+        self.interval = interval
+        self.minresponses = minresponses
+        self.checkat = time.time() + interval
+        self.baseline = None
+        self.resetWindow()
+
+    def resetWindow(self):
+        self.latencies = []
+        self.ratelimits = 0
+        self.servererrors = 0
+
+    def setMaximum(self, maxthreads):
+        with self.lock:
+            self.maxthreads = max(1, maxthreads)
+            self.threads = min(self.threads, self.maxthreads)
+
+    def addResponse(self, latency, status):
+        code = re.search(r'\((\d+)\)', status or '')
+        code = int(code.group(1)) if code is not None else None
+
+        with self.lock:
+            self.latencies.append(latency)
+            if code == 429:
+                self.ratelimits += 1
+            elif (status == 'request error') or ((code is not None) and (code >= 500)):
+                self.servererrors += 1
+
+    def adapt(self, waiting):
+        """
+        Decide about the number of threads, returns a log message if the number changed
+        """
+        with self.lock:
+            now = time.time()
+            if (now < self.checkat) or (len(self.latencies) < self.minresponses):
+                return None
+
+            responses = len(self.latencies)
+            latency = sorted(self.latencies)[responses // 2]
+            ratelimits = self.ratelimits
+            servererrors = self.servererrors
+            self.resetWindow()
+            self.checkat = now + self.interval
+
+            threads = self.threads
+            if ratelimits or (servererrors > responses * 0.05):
+                reason = 'congestion'
+                self.threads = max(1, threads // 2)
+                self.slowstart = False
+            elif (self.baseline is not None) and (latency > 2 * self.baseline):
+                reason = 'rising latency'
+                self.threads = max(1, threads // 2)
+                self.slowstart = False
+            elif waiting > threads:
+                reason = 'slow start' if self.slowstart else 'increase'
+                self.threads = min(self.maxthreads, threads * 2 if self.slowstart else threads + 1)
+            else:
+                reason = None
+
+            if (self.baseline is None) or (latency < self.baseline):
+                self.baseline = latency
+
+            if (reason is None) or (self.threads == threads):
+                return None
+
+            return "Adaptive threads: {} -> {} ({}, {} responses, median latency {:.0f} ms, " \
+                   "{} rate limits, {} server errors).".format(
+                threads, self.threads, reason, responses, latency * 1000, ratelimits, servererrors)
+
+class NotifyingQueue(queue.Queue):
+    """
+    Queue calling notify() after each new item
+    """
+
+    def __init__(self, maxsize=0, notify=None):
+        super(NotifyingQueue, self).__init__(maxsize)
+        self.notify = notify
+
+    def put(self, item, block=True, timeout=None):
+        super(NotifyingQueue, self).put(item, block, timeout)
+        if self.notify is not None:
+            self.notify()
+
 # Thread will process jobs and automatically pause if no job is available.
 # To resume after adding new jobs set process-Signal.
 # To completely halt the tread, set halt-Signal and process-Signal.
@@ -189,13 +383,20 @@ class ApiThread(threading.Thread):
         self.logs = logs
         self.number = number
         self.halt = threading.Event()
+        self.retire = threading.Event()
         self.retry = threading.Event()
         self.process = threading.Event()
 
     def run(self):
         def logData(data, options, headers):
+            # Latency of the request, including the wait for the rate limit
+            now = time.time()
+            self.pool.addResponse(now - self.started, options.get('querystatus'))
+            self.started = now
+
             data = sliceData(data, headers, options)
-            out = {'nodeindex': job['nodeindex'], 'nodedata' : job['nodedata'], 'data': data, 'options': options}
+            out = {'nodeid': job['nodeid'], 'nodedata' : job['nodedata'], 'data': data, 'options': options,
+                   'paging': getPagingState(options)}
             self.output.put(out)
 
         def logMessage(msg):
@@ -209,25 +410,37 @@ class ApiThread(threading.Thread):
                 raise CancelException('Request cancelled.')
             
         try:
-            while not self.halt.isSet():
-                try:
-                    time.sleep(0)
+            while True:
+                # wait for signal
+                self.process.wait()
+                if self.halt.isSet() or self.retire.isSet():
+                    break
 
+                try:
                     # Get from input queue
                     job = self.input.popleft()
                     job['threadnumber'] = self.number
+                    self.started = time.time()
 
                     # Fetch data
+                    finished = False
                     try:
                         self.module.fetchData(job['nodedata'], job['options'], logData, logMessage, logProgress)
+                        finished = True
                     finally:
                         # Progress
-                        self.output.put({'progress': job.get('number', 0), 'threadnumber': self.number})
+                        self.output.put({'progress': job.get('number', 0), 'threadnumber': self.number,
+                                         'nodeid': job['nodeid'], 'finished': finished})
 
 
-                # queue empty
+                # queue empty, pause until new jobs are added
                 except IndexError:
-                    pass
+                    self.process.clear()
+                    if len(self.input) and not self.pool.suspended:
+                        self.process.set()
+                    else:
+                        # The main thread checks whether all jobs are finished
+                        self.pool.notify()
 
                 # canceled
                 except CancelException:
@@ -236,13 +449,15 @@ class ApiThread(threading.Thread):
                 # error
                 except Exception as e:
                     logMessage(e)
-
-
-                # wait for signal
-                self.process.clear()
-                self.process.wait()
         finally:
-            self.pool.threadFinished()
+            self.pool.threadFinished(self)
 
 class CancelException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+def getPagingState(options):
+    """
+    Copy the page number and parameters when the data is logged,
+    the module changes the options for the next page in the meantime
+    """
+    return {'currentpage': options.get('currentpage'), 'params': dict(options.get('params') or {})}
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+Fetch data on an asyncio event loop instead of one thread per request.
+
+AsyncApiThreadPool has the interface of ApiThreadPool. One thread runs the
+event loop, the number of concurrent requests is limited by the number of
+worker tasks. Modules send their requests with httpx in fetchDataAsync(),
+modules without an async implementation run fetchData() in the executor.
+The output queue receives the same jobs as from the threads. It is not
+bounded because a blocking put() would stop the event loop, instead workers
+wait before taking new jobs while too many results are pending.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from apithread import ApiThreadPool, NotifyingQueue, CancelException, getPagingState
+from utilities import sliceData
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+ENGINES = ['threads', 'async']
+
+# Pending results before workers stop taking new jobs
+OUTPUT_SIZE = 100
+
+def availableEngines():
+    return [engine for engine in ENGINES if (httpx is not None) or (engine != 'async')]
+
+def createThreadPool(module, options):
+    if options.get('engine', 'threads') == 'async':
+        return AsyncApiThreadPool(module, options.get('concurrency', 50))
+    else:
+        return ApiThreadPool(module, options.get('adaptive', False))
+
+class AsyncApiThreadPool(ApiThreadPool):
+    def __init__(self, module, concurrency=50):
+        if httpx is None:
+            raise Exception("Install httpx to use the async engine.")
+
+        super(AsyncApiThreadPool, self).__init__(module)
+        self.output = NotifyingQueue(0, self.notify)
+        self.maxthreads = max(1, concurrency)
+        self.loop = None
+        self.thread = None
+        self.workers = []
+        self.newjobs = None
+        self.halted = False
+        self.active = 0
+
+    # Jobs
+    def suspendJobs(self):
+        self.suspended = True
+
+    def resumeJobs(self):
+        self.spawnThreads()
+        self.suspended = False
+        self.wakeupWorkers()
+
+    def stopJobs(self):
+        self.halted = True
+        self.module.disconnectSocket()
+        self.callSoon(self.cancelWorkers)
+
+    def hasJobs(self):
+        if not self.jobsadded:
+            return True
+
+        if self.suspended:
+            return True
+
+        if len(self.input) > 0:
+            return True
+
+        if not self.output.empty():
+            return True
+
+        return self.active > 0
+
+    # Event loop
+    def spawnThreads(self, threadcount=None):
+        """
+        Start the event loop, the thread count is replaced by the concurrency limit
+        """
+        with self.pool_lock:
+            if self.thread is None:
+                self.threadcount = 1
+                self.thread = threading.Thread(target=self.runLoop)
+                self.thread.start()
+
+    def getThreadCount(self):
+        return self.active
+
+    def callSoon(self, callback):
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(callback)
+            except RuntimeError:
+                # Loop already closed
+                pass
+
+    def wakeupWorkers(self):
+        if len(self.input) > 0:
+            self.callSoon(lambda: self.newjobs.set())
+
+    def cancelWorkers(self):
+        self.newjobs.set()
+        for worker in self.workers:
+            worker.cancel()
+
+    def runLoop(self):
+        try:
+            asyncio.run(self.runWorkers())
+        finally:
+            self.loop = None
+            self.threadFinished()
+
+    async def runWorkers(self):
+        self.newjobs = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+
+        # Blocking fetchData() of modules without async implementation
+        executor = ThreadPoolExecutor(self.maxthreads)
+        self.loop.set_default_executor(executor)
+
+        proxies = self.module.getProxies()
+        mounts = {scheme + '://': httpx.AsyncHTTPTransport(proxy=proxy) for scheme, proxy in proxies.items()}
+        limits = httpx.Limits(max_connections=self.maxthreads, max_keepalive_connections=self.maxthreads)
+
+        async with httpx.AsyncClient(limits=limits, mounts=mounts, follow_redirects=True) as client:
+            self.workers = [asyncio.ensure_future(self.runWorker(client, number + 1))
+                            for number in range(self.maxthreads)]
+            await asyncio.gather(*self.workers, return_exceptions=True)
+
+    async def runWorker(self, client, number):
+        while not self.halted:
+            # Backpressure from a slow consumer of the output queue
+            if self.output.qsize() >= OUTPUT_SIZE:
+                await asyncio.sleep(0.05)
+                continue
+
+            # Count the job as active before taking it from the queue, see hasJobs()
+            self.active += 1
+            try:
+                job = self.input.popleft() if not self.suspended else None
+            except IndexError:
+                job = None
+
+            try:
+                if job is not None:
+                    await self.runJob(client, job, number)
+            finally:
+                self.active -= 1
+
+            # Wait for new jobs, the main thread checks whether all jobs are finished
+            if job is None:
+                self.newjobs.clear()
+                self.notify()
+                await self.newjobs.wait()
+
+    async def runJob(self, client, job, number):
+        def logData(data, options, headers):
+            data = sliceData(data, headers, options)
+            out = {'nodeid': job['nodeid'], 'nodedata': job['nodedata'], 'data': data, 'options': options,
+                   'paging': getPagingState(options)}
+            self.output.put(out)
+
+        def logMessage(msg):
+            self.logs.put(msg)
+
+        def logProgress(progress):
+            progress['progress'] = job.get('number', 0)
+            progress['threadnumber'] = number
+            self.output.put(progress)
+            if self.halted:
+                raise CancelException('Request cancelled.')
+
+        job['threadnumber'] = number
+        finished = False
+
+        try:
+            await self.module.fetchDataAsync(job['nodedata'], job['options'], logData, logMessage, logProgress, client)
+            finished = True
+
+        # canceled
+        except CancelException:
+            pass
+
+        # error
+        except Exception as e:
+            logMessage(e)
+
+        finally:
+            # Progress
+            self.output.put({'progress': job.get('number', 0), 'threadnumber': number,
+                             'nodeid': job['nodeid'], 'finished': finished})
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+"""
+Run presets without the user interface, e.g. for scheduled collections on servers.
+
+    facepager-batch database.db "Get Facebook posts.json" "Get comments.json" --level 1
+
+The first preset fetches all nodes of the given level, the next preset
+the nodes one level below and so on. Presets are looked up in the given
+path, the preset folder and the default preset folder of Facepager.
+Module settings such as access tokens are read from the Facepager
+settings of the current user, login in the user interface once.
+
+The API modules are created on an offscreen Qt platform, no window is shown
+and no display is needed.
+"""
+
+import os
+import sys
+import argparse
+import time
+from datetime import datetime
+from copy import deepcopy
+
+# The widgets of the modules are never shown
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PySide2.QtCore import QCoreApplication, QSettings
+from PySide2.QtWidgets import QApplication
+
+import jsoncodec
+from database import Database, Node, NodeQueue, JobQueue
+from apimodules import GenericTab, FacebookTab, AmazonTab, TwitterTab, TwitterStreamingTab, YoutubeTab
+from scheduler import FetchScheduler
+from dialogs.apiviewer import ApiViewer
+
+MODULES = {
+    'Generic': GenericTab,
+    'Files': GenericTab,
+    'Facebook': FacebookTab,
+    'Amazon': AmazonTab,
+    'Twitter': TwitterTab,
+    'Twitter Streaming': TwitterStreamingTab,
+    'YouTube': YoutubeTab
+}
+
+# Defaults of the fetch settings in the main window
+GLOBAL_OPTIONS = {
+    'excludetypes': 'offcut',
+    'threads': 1,
+    'adaptive': False,
+    'speed': 200,
+    'burst': 1,
+    'errors': 10,
+    'expand': False,
+    'logrequests': True,
+    'saveheaders': False,
+    'fulloffcut': False,
+    'timeout': 15,
+    'maxsize': 5,
+    'resume': False,
+    'emptyonly': False,
+    'engine': 'threads',
+    'concurrency': 50,
+    'poolconnections': 10,
+    'poolmaxsize': 10,
+    'cache': False,
+    'cachettl': 24,
+    'cachesize': 500
+}
+
+PRESET_FOLDERS = [
+    os.path.join(os.path.expanduser("~"), 'Facepager', 'Presets'),
+    os.path.join(os.path.expanduser("~"), 'Facepager', 'DefaultPresets')
+]
+
+
+class BatchRunner(object):
+    """
+    Provides the parts of the main window used by the API modules
+    """
+
+    def __init__(self, retries=3, retrywait=300, interval=10, restart=False):
+        self.retries = retries
+        self.retrywait = retrywait
+        self.interval = interval
+        self.restart = restart
+        self.modules = {}
+
+        QSettings.setDefaultFormat(QSettings.IniFormat)
+        QCoreApplication.setOrganizationName("Strohne")
+        QCoreApplication.setApplicationName("Facepager")
+        self.settings = QSettings()
+
+        jsoncodec.setCodec(self.settings.value('jsoncodec', 'auto'))
+
+        self.database = Database(None)
+        self.database.setProfile(self.settings.value('dbprofile', 'default'),
+                                 self.settings.value('dbcachesize', 64),
+                                 self.settings.value('dbmmapsize', 256))
+
+        self.apiWindow = ApiViewer(None)
+
+    def logmessage(self, message):
+        if isinstance(message, Exception):
+            message = "Exception: " + str(message)
+        print(str(datetime.now()) + " " + str(message), flush=True)
+
+    def getModule(self, name):
+        if name not in MODULES:
+            raise ValueError("Unknown module {}".format(name))
+
+        module = self.modules.get(MODULES[name])
+        if module is None:
+            module = MODULES[name](self)
+            self.modules[MODULES[name]] = module
+        return module
+
+    def loadPreset(self, filename):
+        candidates = [filename] + [os.path.join(folder, filename) for folder in PRESET_FOLDERS]
+        for candidate in candidates:
+            for name in (candidate, candidate + '.json'):
+                if os.path.isfile(name):
+                    with open(name, 'r', encoding='utf-8') as input:
+                        return jsoncodec.loads(input.read())
+
+        raise FileNotFoundError("Preset {} not found".format(filename))
+
+    def getQueryOptions(self, preset, level, overrides):
+        module = self.getModule(preset.get('module', 'Generic'))
+        module.setOptions(preset.get('options', {}))
+        module.getProxies(True)
+
+        if not module.auth_userauthorized and module.auth_preregistered:
+            raise Exception("Not authorized, login in the user interface first.")
+
+        options = module.getOptions('fetch')
+        for key, value in GLOBAL_OPTIONS.items():
+            options[key] = preset.get(key, value)
+        options.update({key: value for key, value in overrides.items() if value is not None})
+
+        options['nodelevel'] = level
+        options['allnodes'] = True
+
+        return module, options
+
+    def runPipeline(self, filename, presets, level=1, overrides={}):
+        self.database.connect(filename)
+        if not self.database.connected:
+            raise Exception("Could not open database {}".format(filename))
+
+        try:
+            for preset in presets:
+                self.logmessage("Level {}: {}".format(level, preset))
+                module, options = self.getQueryOptions(self.loadPreset(preset), level, overrides)
+
+                stats = self.fetchData(module, options)
+                if stats['canceled']:
+                    return False
+
+                level += 1
+        finally:
+            self.database.disconnect()
+
+        return True
+
+    def fetchData(self, module, options):
+        """
+        Fetch all nodes of the level, see FetchScheduler
+        """
+        excludetypes = options.get('excludetypes', '').replace(' ', '').split(',')
+        nodequeue = NodeQueue(self.database.session, options['nodelevel'] - 1, excludetypes, options)
+        jobqueue = self.getJobQueue(module, options, nodequeue)
+        self.logmessage("Added {} node(s) to queue.".format(len(jobqueue)))
+
+        scheduler = BatchScheduler(self, module, options, jobqueue)
+        return scheduler.run(self.prepareJob(node, options) for node in jobqueue)
+
+    def getJobQueue(self, module, options, nodequeue):
+        """
+        Save the jobs in the database, an interrupted run with the same settings is continued
+        """
+        jobqueue = JobQueue.findRun(self.database.session, module.name, options)
+        if jobqueue is not None:
+            if not self.restart:
+                self.logmessage("Continuing the previous run with {} unfinished node(s).".format(len(jobqueue)))
+                return jobqueue
+            jobqueue.discard()
+
+        return JobQueue.createRun(self.database.session, module.name, options, nodequeue)
+
+    def prepareJob(self, node, options):
+        node_options = deepcopy(options)
+        node_options['lastdata'] = node['lastdata']
+        node_options.update(node.get('options', {}))
+        return {'nodeid': node['id'], 'nodedata': node['data'], 'options': node_options}
+
+
+class BatchScheduler(FetchScheduler):
+    """
+    Log the progress of the fetch scheduler and retry after a pause
+    """
+
+    def __init__(self, runner, apimodule, options, jobqueue):
+        super(BatchScheduler, self).__init__(apimodule, options, runner.database, jobqueue)
+        self.runner = runner
+        self.queued = len(jobqueue)
+        self.retries = runner.retries
+        self.retryat = None
+        self.reportat = time.time() + runner.interval
+
+    def logmessage(self, msg):
+        self.runner.logmessage(msg)
+
+    def update(self, newdata):
+        if time.time() >= self.reportat:
+            self.reportat = time.time() + self.runner.interval
+            self.logProgress()
+
+    def suspend(self, msg, ratelimit, autoretry):
+        self.logmessage(msg)
+        if self.retries > 0:
+            self.scheduleRetry()
+        else:
+            self.logmessage("No retries left, fetching cancelled.")
+            self.cancel()
+
+    def errorsPending(self, count):
+        self.logmessage("All nodes finished but {} error(s) are pending.".format(count))
+        if self.retries > 0:
+            self.scheduleRetry()
+        else:
+            self.logmessage("No retries left, errors skipped.")
+            self.threadpool.clearRetry()
+            self.threadpool.resumeJobs()
+
+    def scheduleRetry(self):
+        self.logmessage("Waiting {} second(s), {} retries left.".format(self.runner.retrywait, self.retries))
+        self.retryat = time.time() + self.runner.retrywait
+        self.retries -= 1
+
+    def resume(self):
+        if (self.retryat is None) or (time.time() < self.retryat):
+            return False
+
+        self.logmessage("Retrying {} node(s).".format(self.threadpool.getErrorJobsCount()))
+        self.retryat = None
+        self.threadpool.retryJobs()
+        return True
+
+    def logProgress(self):
+        stats = self.stats
+        duration = max(time.time() - stats['started'], 0.001)
+        self.logmessage("{} of {} node(s) finished, {:.1f} node(s)/s, {} response(s), {} new node(s), {} thread(s).".format(
+            stats['finished'], self.queued, stats['finished'] / duration,
+            stats['responses'], stats['newnodes'], self.threadpool.getThreadCount()))
+
+    def finish(self):
+        stats = self.stats
+        duration = max(stats['duration'], 0.001)
+        summary = ", ".join([str(value) + " x " + key for key, value in stats['status'].items()])
+        self.logmessage("{} {} node(s) in {:.1f} s: {:.2f} node(s)/s, {:.2f} response(s)/s, "
+                        "{} new node(s) ({:.1f}/s). Summary of responses: {}.".format(
+            'Cancelled after' if stats['canceled'] else 'Fetched', stats['finished'], duration,
+            stats['finished'] / duration, stats['responses'] / duration,
+            stats['newnodes'], stats['newnodes'] / duration, summary))
+
+        super(BatchScheduler, self).finish()
+
+
+def main(args=None):
+    cmd_args = argparse.ArgumentParser(prog='facepager-batch', description='Run Facepager presets without the user interface.')
+    cmd_args.add_argument('database', help='Database file, created if missing')
+    cmd_args.add_argument('presets', nargs='+', help='Preset files, one for each level')
+    cmd_args.add_argument('--level', type=int, default=1, help='Node level of the first preset (base level is 1)')
+    cmd_args.add_argument('--seed', dest='seeds', action='append', default=[], help='Add a seed node before fetching')
+    cmd_args.add_argument('--threads', type=int, default=None, help='Number of parallel threads')
+    cmd_args.add_argument('--adaptive', action='store_true', default=None, help='Adjust the number of threads to the responses, --threads is the maximum')
+    cmd_args.add_argument('--speed', type=int, default=None, help='Maximum requests per minute')
+    cmd_args.add_argument('--burst', type=int, default=None, help='Requests that may be sent at once before the speed limit applies')
+    cmd_args.add_argument('--resume', action='store_true', default=None, help='Resume pagination')
+    cmd_args.add_argument('--emptyonly', action='store_true', default=None, help='Only fetch nodes without children')
+    cmd_args.add_argument('--engine', choices=['threads', 'async'], default=None, help='Send requests from threads or from an asyncio event loop (requires httpx)')
+    cmd_args.add_argument('--concurrency', type=int, default=None, help='Maximum number of concurrent requests of the async engine')
+    cmd_args.add_argument('--cache', action='store_true', default=None, help='Answer identical requests from the response cache')
+    cmd_args.add_argument('--cachettl', type=int, default=None, help='Hours until cached responses are revalidated')
+    cmd_args.add_argument('--retries', type=int, default=3, help='Retries after errors or rate limits')
+    cmd_args.add_argument('--retrywait', type=int, default=300, help='Seconds to wait before retrying')
+    cmd_args.add_argument('--interval', type=int, default=10, help='Seconds between progress messages')
+    cmd_args.add_argument('--restart', action='store_true', help='Start a new run instead of continuing an interrupted run')
+    cmd_args = cmd_args.parse_args(args)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    runner = BatchRunner(cmd_args.retries, cmd_args.retrywait, cmd_args.interval, cmd_args.restart)
+
+    if cmd_args.seeds:
+        runner.database.connect(cmd_args.database)
+        try:
+            runner.database.session.add_all([Node(seed) for seed in cmd_args.seeds])
+            runner.database.session.commit()
+            runner.logmessage("Added {} seed node(s).".format(len(cmd_args.seeds)))
+        finally:
+            runner.database.disconnect()
+
+    overrides = {'threads': cmd_args.threads, 'adaptive': cmd_args.adaptive, 'speed': cmd_args.speed, 'burst': cmd_args.burst,
+                 'resume': cmd_args.resume, 'emptyonly': cmd_args.emptyonly,
+                 'engine': cmd_args.engine, 'concurrency': cmd_args.concurrency,
+                 'cache': cmd_args.cache, 'cachettl': cmd_args.cachettl}
+    finished = runner.runPipeline(cmd_args.database, cmd_args.presets, cmd_args.level, overrides)
+
+    for module in runner.modules.values():
+        module.cleanup()
+
+    return 0 if finished else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
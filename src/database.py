@@ -1,17 +1,25 @@
 #from requester import *
 import sqlalchemy as sql
-from sqlalchemy import Column, Integer, String,ForeignKey,Text
+from sqlalchemy import Column, Integer, String,ForeignKey,Text,Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import create_engine,event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, backref,sessionmaker,session,scoped_session
+from sqlalchemy.orm import relationship, backref,sessionmaker,session,scoped_session,aliased
 from sqlalchemy.engine import Engine
+from sqlalchemy.pool import SingletonThreadPool
 
 import json
+import hashlib
+import jsoncodec
 from utilities import *
 from dateutil import parser
 import datetime
 import os
+import threading
+import queue
+import time
+from array import array
+from collections import OrderedDict
 from PySide2.QtGui import *
 from PySide2.QtCore import *
 
@@ -19,11 +27,24 @@ Base = declarative_base()
 
 class Database(object):
 
+    # SQLite pragmas applied to every connection.
+    # The default profile restores the defaults of SQLite.
+    # The performance profile uses write-ahead logging, readers are not
+    # blocked by commits and only checkpoints are synced to disk.
+    PROFILES = {
+        'default': OrderedDict([('journal_mode', 'DELETE'), ('synchronous', 'FULL')]),
+        'performance': OrderedDict([('journal_mode', 'WAL'), ('synchronous', 'NORMAL'), ('temp_store', 'MEMORY')])
+    }
+
     def __init__(self,parent):
         self.parent = parent
         self.connected=False
         self.filename=""
 
+        self.profile = 'default'
+        self.cachesize = 64
+        self.mmapsize = 256
+
     @event.listens_for(Engine, "connect")
     def set_sqlite_pragma(dbapi_connection, connection_record):
         cursor = dbapi_connection.cursor()
@@ -35,21 +56,83 @@ class Database(object):
             if self.connected:
                 self.disconnect()
 
-            self.engine = create_engine('sqlite:///%s'%filename, convert_unicode=True)
+            # Keep the connection open to reuse the cache and the memory map,
+            # each thread has its own connection but all are closed by disconnect()
+            if self.profile == 'performance':
+                self.engine = create_engine('sqlite:///%s'%filename, convert_unicode=True, poolclass=SingletonThreadPool,
+                                            connect_args={'check_same_thread': False})
+            else:
+                self.engine = create_engine('sqlite:///%s'%filename, convert_unicode=True)
+            event.listen(self.engine, "connect", self.applyProfile)
             self.session = scoped_session(sessionmaker(autocommit=False,autoflush=False,bind=self.engine))
             Base.query = self.session.query_property()
             #Create a query attribute by inheritance from the declarative base
             Base.metadata.create_all(bind=self.engine)
+            self.migrate()
             self.filename = filename
             self.connected = True
         except Exception as e:
             self.filename=""
             self.connected=False
+
+            # Without user interface, e.g. in batch mode
+            if self.parent is None:
+                raise e
             QMessageBox.critical(self.parent,"Facepager",str(e))
 
+    def migrate(self):
+        """
+        Add indexes missing in databases created by older versions.
+        Building the indexes may take a while the first time a large database is opened.
+        """
+        existing = [index['name'] for index in sql.inspect(self.engine).get_indexes(Node.__tablename__)]
+        for index in Node.__table__.indexes:
+            if index.name not in existing:
+                index.create(bind=self.engine)
+
+    def setProfile(self, profile=None, cachesize=None, mmapsize=None):
+        """
+        Select the pragmas, changes apply when the database is opened the next time.
+        Cache size and memory map size are given in megabytes
+        and only used by the performance profile.
+        """
+        if profile is not None:
+            if profile not in self.PROFILES:
+                raise ValueError("Unknown database profile {}".format(profile))
+            self.profile = profile
+        if cachesize is not None:
+            self.cachesize = max(0, int(cachesize))
+        if mmapsize is not None:
+            self.mmapsize = max(0, int(mmapsize))
+
+    def getProfile(self):
+        return {'profile': self.profile, 'cachesize': self.cachesize, 'mmapsize': self.mmapsize}
+
+    def getPragmas(self):
+        pragmas = OrderedDict(self.PROFILES[self.profile])
+        if self.profile == 'performance':
+            # Negative values are kibibytes
+            pragmas['cache_size'] = -self.cachesize * 1024
+            pragmas['mmap_size'] = self.mmapsize * 1024 * 1024
+        return pragmas
+
+    def applyProfile(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for key, value in self.getPragmas().items():
+                try:
+                    cursor.execute("PRAGMA {}={}".format(key, value))
+                except Exception as e:
+                    # The journal mode can't be changed while other connections are open
+                    if key != 'journal_mode':
+                        raise e
+        finally:
+            cursor.close()
+
     def disconnect(self):
         if self.connected:
             self.session.close()
+            self.engine.dispose()
 
         self.filename=""
         self.connected=False
@@ -79,6 +162,23 @@ class Database(object):
         else:
             QMessageBox.information(self.parent,"Facepager","No database connection")
 
+    def iterNodes(self, batchsize=5000, lastid=0):
+        """
+        Stream all nodes ordered by id.
+        Uses keyset pagination (WHERE id > :last ORDER BY id LIMIT n) instead of offsets,
+        so every batch is a range scan on the primary key and memory stays flat.
+        """
+        while True:
+            nodes = Node.query.filter(Node.id > lastid).order_by(Node.id).limit(batchsize)
+
+            count = 0
+            for node in nodes.yield_per(1000):
+                lastid = node.id
+                count += 1
+                yield node
+
+            if count < batchsize:
+                break
 
 
 class Node(Base):
@@ -87,8 +187,14 @@ class Node(Base):
         relevant to the data-view. It creates an empty node on __init__
         """
         __tablename__='Nodes'
+        __table_args__ = (
+            # Last child by object type (resuming), children by id are served by the index on parent_id
+            Index('ix_Nodes_parent_id_objecttype', 'parent_id', 'objecttype', 'id'),
+            # Nodes on a level (selecting nodes for fetching and exporting)
+            Index('ix_Nodes_level_objecttype', 'level', 'objecttype'),
+        )
 
-        objectid=Column(String)
+        objectid=Column(String,index=True)
         objecttype=Column(String)
         querystatus=Column(String)
         querytype=Column(String)
@@ -111,15 +217,30 @@ class Node(Base):
             self.objecttype = 'seed'
             self.sortkey = ''
 
+        def _decode(self, attr, raw):
+            """
+            Parse JSON once per instance and raw value.
+            The memo is checked by identity, so reloading from the
+            database or assigning a new raw value invalidates it.
+            Note: the returned object is shared, copy before modifying.
+            """
+            if raw is None:
+                return {}
+
+            memo = self.__dict__.get(attr)
+            if (memo is not None) and (memo[0] is raw):
+                return memo[1]
+
+            value = jsoncodec.loads(raw)
+            self.__dict__[attr] = (raw, value)
+            return value
+
         @property
         def response(self):
             """
             The response attribute holds the data (JSON) itself
             """
-            if (self.response_raw == None):
-                return {}
-            else:
-                return  json.loads(self.response_raw)
+            return self._decode('_response', self.response_raw)
 
         @response.setter
         def response(self, response_raw):
@@ -127,7 +248,8 @@ class Node(Base):
             Tries to dump the data as JSON
             Note: Error Handling should be implemented here
             """
-            self.response_raw = json.dumps(response_raw)
+            self.__dict__.pop('_response', None)
+            self.response_raw = jsoncodec.dumps(response_raw)
 
         @property
         def queryparams(self):
@@ -135,14 +257,12 @@ class Node(Base):
             The queryparams atrribute holds the Query-Parameters
             specified in the API-Tab
             """
-            if (self.queryparams_raw == None):
-                return {}
-            else:
-                return json.loads(self.queryparams_raw)
+            return self._decode('_queryparams', self.queryparams_raw)
 
         @queryparams.setter
         def queryparams(self, queryparams_raw):
-            self.queryparams_raw = json.dumps(queryparams_raw)
+            self.__dict__.pop('_queryparams', None)
+            self.queryparams_raw = jsoncodec.dumps(queryparams_raw)
 
         def getResponseValue(self,key,encoding=None):
             name, value=extractValue(self.response,key)
@@ -151,3 +271,588 @@ class Node(Base):
             else:
                 return (name, value)
 
+        def getResponseValues(self,keys,encoding=None):
+            """
+            Extract several keys (e.g. the custom columns) in one pass,
+            see extractValues() for details
+            """
+            values = extractValues(self.response, keys)
+            if encoding:
+                values = [(name, value.encode(encoding)) if isinstance(value, str) else (name, value)
+                          for name, value in values]
+            return values
+
+
+# Columns that can be used in node filters, see getFilterClauses()
+FILTER_COLUMNS = {
+    'level': Node.level,
+    'objectid': Node.objectid,
+    'objecttype': Node.objecttype,
+    'querystatus': Node.querystatus,
+    'querytime': Node.querytime,
+    'querytype': Node.querytype
+}
+
+def getFilterClauses(filter, exact=True):
+    """
+    Translate a node filter to SQL clauses, see TreeModel.checkFilter() for the filter format.
+    Returns None if the filter contains keys without column (e.g. the response).
+    As in checkFilter(), empty values match and partial matches ignore inversion.
+    """
+    clauses = []
+    for key, value in filter.items():
+        inverse = key[0] == '!'
+        key = key[1:] if inverse else key
+
+        column = FILTER_COLUMNS.get(key)
+        if column is None:
+            return None
+
+        orlist = value if type(value) is list else [value]
+        if not orlist:
+            clause = sql.true() if inverse else sql.false()
+        elif exact or (column is Node.level):
+            clause = column.notin_(orlist) if inverse else column.in_(orlist)
+        else:
+            clause = sql.or_(*[sql.func.instr(column, str(v)) > 0 for v in orlist])
+
+        clauses.append(sql.or_(column.is_(None), clause))
+
+    return clauses
+
+class ResponseCache(object):
+    """
+    Bounded LRU cache for decoded responses, keyed by node id.
+    Entries are only valid as long as the raw JSON is unchanged,
+    leave out raw for values that don't change.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, id, raw=None):
+        with self.lock:
+            item = self.items.get(id)
+            if (item is None) or (item[0] != raw):
+                return None
+
+            self.items.move_to_end(id)
+            return item[1]
+
+    def put(self, id, raw, value):
+        if id is None:
+            return False
+
+        with self.lock:
+            self.items[id] = (raw, value)
+            self.items.move_to_end(id)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+# Children used for resuming, see isPagingFinished()
+RESUME_FILTER = {'querystatus': "fetched (200)", 'objecttype': ["data", "offcut", "empty"]}
+
+def getNodeData(node):
+    """
+    Create a dict with the node data as used in jobs,
+    the keys are the same as in the data of tree items
+    """
+    return {'level': node.level,
+            'childcount': node.childcount,
+            'objectid': node.objectid,
+            'objecttype': node.objecttype,
+            'querystatus': node.querystatus,
+            'querytime': node.querytime,
+            'querytype': node.querytype,
+            'queryparams': node.queryparams,
+            'response': node.response}
+
+def isPagingFinished(lastdata, options):
+    """
+    Check whether the last offcut or data node has no next cursor
+    """
+    response = getDictValueOrNone(lastdata, 'response', dump=False)
+    cursor = getDictValueOrNone(response, options.get('key_paging'))
+    stopvalue = not extractValue(response, options.get('paging_stop'), dump=False, default=True)[1]
+    return (cursor is None) or stopvalue
+
+class NodeQueue(object):
+    """
+    Select the nodes of one level for fetching directly from the database,
+    the nodes are not loaded into the tree.
+
+    The matching ids are queried once when creating the queue. Iterating
+    loads the nodes in batches and yields dicts with the id, the node data
+    (see getNodeData) and the last data for resuming. Nodes with finished
+    pagination are skipped if resume is set in the options.
+    """
+
+    def __init__(self, session, level, excludetypes=None, options=None, batchsize=500):
+        self.session = session
+        self.options = options if options is not None else {}
+        self.batchsize = batchsize
+        self.position = 0
+
+        filter = {'level': level, '!objecttype': excludetypes if excludetypes is not None else []}
+        query = session.query(Node.id).filter(*getFilterClauses(filter))
+
+        if self.options.get('emptyonly', False):
+            child = aliased(Node)
+            query = query.filter(~sql.exists().where(child.parent_id == Node.id))
+
+        self.ids = array('q', sorted(id for id, in query))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def getRemaining(self):
+        return len(self.ids) - self.position
+
+    def getLastData(self, ids):
+        """
+        Get the last offcut or data child of each node by node id
+        """
+        return getLastData(self.session, ids)
+
+    def __iter__(self):
+        resume = self.options.get('resume', False) and not self.options.get('emptyonly', False)
+
+        while self.position < len(self.ids):
+            ids = self.ids[self.position:self.position + self.batchsize].tolist()
+            self.position += len(ids)
+
+            nodes = self.session.query(Node).filter(Node.id.in_(ids)).order_by(Node.id).all()
+            lastdata = self.getLastData(ids) if resume else {}
+
+            for node in nodes:
+                data = lastdata.get(node.id)
+                if (data is not None) and isPagingFinished(data, self.options):
+                    continue
+
+                yield {'id': node.id, 'data': getNodeData(node), 'lastdata': data}
+
+def getLastData(session, ids):
+    """
+    Get the last offcut or data child of each node by node id
+    """
+    lastids = session.query(sql.func.max(Node.id)).\
+        filter(Node.parent_id.in_(ids), *getFilterClauses(RESUME_FILTER)).\
+        group_by(Node.parent_id).all()
+    lastids = [id for id, in lastids]
+    if not lastids:
+        return {}
+
+    nodes = session.query(Node).filter(Node.id.in_(lastids)).all()
+    return {node.parent_id: getNodeData(node) for node in nodes}
+
+class Run(Base):
+    """
+    A fetch run of one module on one level, see JobQueue
+    """
+    __tablename__ = 'Runs'
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String, index=True)
+    module = Column(String)
+    level = Column(Integer)
+    status = Column(String)
+    created = Column(String)
+    updated = Column(String)
+    total = Column(Integer)
+    options_raw = Column("options", Text)
+
+class Job(Base):
+    """
+    The state of one node in a fetch run: pending, inflight, done or failed.
+    The cursor is the last fetched page, see getJobCursor().
+    """
+    __tablename__ = 'Jobs'
+    __table_args__ = (
+        Index('ix_Jobs_run_id_node_id', 'run_id', 'node_id', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('Runs.id', ondelete='CASCADE'))
+    node_id = Column(Integer, ForeignKey('Nodes.id', ondelete='CASCADE'), index=True)
+    status = Column(String)
+    cursor = Column(Text)
+
+# Settings that don't change the fetched data, runs with different values can be continued
+RUN_SETTINGS = ['threads', 'adaptive', 'speed', 'burst', 'errors', 'expand', 'logrequests', 'timeout',
+                'resume', 'allnodes', 'engine', 'concurrency', 'poolconnections', 'poolmaxsize',
+                'cache', 'cachettl', 'cachesize', 'lastdata']
+
+def getJobCursor(data, paging):
+    """
+    Create the cursor of a job from sliced data and the paging state (see getPagingState).
+    The response is the last offcut or data node as used for resuming.
+    """
+    if data['offcut'] is not None:
+        response = data['offcut']
+    elif len(data['nodes']):
+        response = data['nodes'][-1][1]
+    else:
+        response = data['empty']
+
+    cursor = {'response': response}
+    cursor.update(paging or {})
+    return cursor
+
+class JobQueue(object):
+    """
+    Persist the jobs of a fetch run in the database to continue interrupted runs.
+
+    The run contains one job for each node selected by a NodeQueue. A job is pending
+    until the first page was fetched, inflight while paging, and done or failed when
+    the last page was fetched. The cursor of each page is written by the NodeWriter
+    in the same transaction as the nodes. After a crash or cancelling, the run
+    continues with all jobs that are not done: the pagination starts after the page
+    in the cursor. Iterating yields the same dicts as NodeQueue.
+    """
+
+    def __init__(self, session, run, options=None, batchsize=500):
+        self.session = session
+        self.run = run
+        self.options = options if options is not None else {}
+        self.batchsize = batchsize
+        self.lastid = 0
+        self.failed = set()
+
+        self.total = session.query(sql.func.count(Job.id)).\
+            filter(Job.run_id == run.id, Job.status != 'done').scalar()
+        self.position = 0
+
+    @staticmethod
+    def getKey(module, options):
+        settings = {key: value for key, value in options.items() if key not in RUN_SETTINGS}
+        settings['module'] = module
+        return hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def findRun(cls, session, module, options):
+        """
+        Get the last unfinished run with the same module and options or None
+        """
+        run = session.query(Run).\
+            filter(Run.key == cls.getKey(module, options), Run.status.in_(['running', 'canceled'])).\
+            order_by(Run.id.desc()).first()
+        return cls(session, run, options) if run is not None else None
+
+    @classmethod
+    def createRun(cls, session, module, options, nodequeue):
+        """
+        Add a run with a pending job for each node of the node queue
+        """
+        now = str(datetime.datetime.now())
+        run = Run(key=cls.getKey(module, options), module=module, level=options.get('nodelevel', 1) - 1,
+                  status='running', created=now, updated=now, total=len(nodequeue),
+                  options_raw=jsoncodec.dumps({key: value for key, value in options.items() if key != 'lastdata'}))
+        session.add(run)
+        session.flush()
+
+        insert = Job.__table__.insert()
+        for position in range(0, len(nodequeue.ids), 10000):
+            ids = nodequeue.ids[position:position + 10000]
+            session.execute(insert, [{'run_id': run.id, 'node_id': id, 'status': 'pending'} for id in ids])
+        session.commit()
+
+        return cls(session, run, options)
+
+    def __len__(self):
+        return self.total
+
+    def getRemaining(self):
+        return self.total - self.position
+
+    def __iter__(self):
+        resume = self.options.get('resume', False) and not self.options.get('emptyonly', False)
+
+        while True:
+            rows = self.session.query(Job.node_id, Job.cursor, Node).\
+                join(Node, Node.id == Job.node_id).\
+                filter(Job.run_id == self.run.id, Job.status != 'done', Job.node_id > self.lastid).\
+                order_by(Job.node_id).limit(self.batchsize).all()
+            if not rows:
+                break
+
+            self.lastid = rows[-1][0]
+            self.position += len(rows)
+
+            # Nodes without cursor are resumed from the last child as in NodeQueue
+            lastdata = getLastData(self.session, [id for id, cursor, node in rows if cursor is None]) \
+                if resume else {}
+
+            finished = []
+            for id, cursor, node in rows:
+                if cursor is not None:
+                    # Continue after the page in the cursor
+                    yield {'id': id, 'data': getNodeData(node), 'lastdata': jsoncodec.loads(cursor),
+                           'options': {'resume': True, 'emptyonly': False}}
+                    continue
+
+                data = lastdata.get(id)
+                if (data is not None) and isPagingFinished(data, self.options):
+                    finished.append(id)
+                    continue
+
+                yield {'id': id, 'data': getNodeData(node), 'lastdata': data}
+
+            if finished:
+                self.session.query(Job).\
+                    filter(Job.run_id == self.run.id, Job.node_id.in_(finished)).\
+                    update({'status': 'done'}, synchronize_session=False)
+                self.session.commit()
+
+    def getPageState(self, job, success):
+        """
+        Get the state of a job after a page was fetched, pass it to NodeWriter.addNodes()
+        """
+        if not success:
+            self.failed.add(job['nodeid'])
+            return None
+
+        cursor = getJobCursor(job['data'], job.get('paging'))
+        return {'run_id': self.run.id, 'node_id': job['nodeid'], 'status': 'inflight',
+                'cursor': jsoncodec.dumps(cursor)}
+
+    def getFinalState(self, job, canceled=False):
+        """
+        Get the state of a job after all pages were fetched, pass it to NodeWriter.updateJob().
+        Cancelled jobs are not updated, they are continued from the last cursor.
+        """
+        failed = job['nodeid'] in self.failed
+        self.failed.discard(job['nodeid'])
+        if canceled:
+            return None
+
+        status = 'done' if job.get('finished', True) and not failed else 'failed'
+        return {'run_id': self.run.id, 'node_id': job['nodeid'], 'status': status, 'cursor': None}
+
+    def finish(self, canceled=False):
+        """
+        Mark the run as finished or canceled, the jobs of finished runs are removed except failed jobs
+        """
+        self.run.status = 'canceled' if canceled else 'finished'
+        self.run.updated = str(datetime.datetime.now())
+        if not canceled:
+            self.session.query(Job).\
+                filter(Job.run_id == self.run.id, Job.status == 'done').\
+                delete(synchronize_session=False)
+        self.session.commit()
+
+    def discard(self):
+        """
+        Remove all jobs of an unfinished run that should not be continued
+        """
+        self.run.status = 'discarded'
+        self.run.updated = str(datetime.datetime.now())
+        self.session.query(Job).filter(Job.run_id == self.run.id).delete(synchronize_session=False)
+        self.session.commit()
+
+def getNodeRecords(parent, data, options):
+    """
+    Create the column values of new nodes from sliced data (see sliceData).
+    The parent is a dict with id, objectid and level of the parent node.
+    """
+    records = []
+
+    querystatus = options.get("querystatus", "")
+    querytime = str(options.get("querytime", ""))
+    querytype = options.get('querytype', '')
+    queryparams = {key: options.get(key, '') for key in ['nodedata', 'basepath', 'resource']}
+
+    def appendRecord(objecttype, objectid, response, extractedkey=''):
+        queryparams['nodedata'] = extractedkey
+        records.append({
+            'objectid': str(objectid),
+            'objecttype': objecttype,
+            'querystatus': querystatus,
+            'querytime': querytime,
+            'querytype': querytype,
+            'queryparams': jsoncodec.dumps(queryparams),
+            'response': jsoncodec.dumps(response),
+            'parent_id': parent['id'],
+            'level': parent['level'] + 1,
+            'childcount': 0
+        })
+
+    #empty records
+    if data['empty'] is not None:
+        appendRecord('empty', parent['objectid'], data['empty'])
+
+    #extracted nodes
+    objecttype = options.get('objecttype', 'data')
+    for k, n in data['nodes']:
+        # Extract Object ID or use parent id if no key present
+        o = options.get('objectid')
+        if o is not None:
+            o = extractValue(n, o, default=None)[1]
+        if o is None:
+            o = parent['objectid']
+
+        appendRecord(objecttype, o, n, k)
+
+    #offcut
+    if data['offcut'] is not None:
+        appendRecord('offcut', parent['objectid'], data['offcut'])
+
+    #headers
+    if data['headers'] is not None:
+        appendRecord('headers', parent['objectid'], data['headers'])
+
+    return records
+
+
+def countRows(item):
+    """
+    Number of rows written for an item of the NodeWriter
+    """
+    parent, data = item[0], item[1]
+    return len(data['nodes']) + 1 if parent is not None else 1
+
+class NodeWriter(threading.Thread):
+    """
+    Write fetched nodes in a separate thread.
+
+    Nodes are inserted with Core executemany in transactions of up to
+    maxrows rows or maxtime seconds. The child counts of the parents
+    are updated once per transaction. After each transaction,
+    getWritten() returns the number of new nodes by parent.
+    """
+
+    def __init__(self, engine, maxrows=5000, maxtime=0.5):
+        super(NodeWriter, self).__init__()
+        self.daemon = True
+        self.engine = engine
+        self.maxrows = maxrows
+        self.maxtime = maxtime
+
+        self.input = queue.Queue()
+        self.output = queue.Queue()
+
+        table = Node.__table__
+        self.insertStatement = table.insert()
+        self.updateStatement = table.update().\
+            where(table.c.id == sql.bindparam('parent')).\
+            values(childcount=sql.func.coalesce(table.c.childcount, 0) + sql.bindparam('count'))
+
+        table = Job.__table__
+        self.jobStatement = table.update().\
+            where(sql.and_(table.c.run_id == sql.bindparam('run'), table.c.node_id == sql.bindparam('node'))).\
+            values(status=sql.bindparam('jobstatus'),
+                   cursor=sql.func.coalesce(sql.bindparam('jobcursor'), table.c.cursor))
+
+    def addNodes(self, parent, data, options, tag=None, job=None):
+        """
+        Queue sliced data for writing.
+        The tag (e.g. the index of the parent) is passed back by getWritten().
+        The job state (see JobQueue) is written in the same transaction.
+        """
+        self.input.put((parent, data, options, tag, job))
+
+    def updateJob(self, job):
+        """
+        Queue a job state without nodes, e.g. after the last page
+        """
+        if job is not None:
+            self.input.put((None, None, None, None, job))
+
+    def getWritten(self):
+        """
+        Return a list of dicts with parent_id, tag and count of new nodes,
+        or with an error message
+        """
+        written = []
+        while True:
+            try:
+                written.append(self.output.get_nowait())
+            except queue.Empty:
+                return written
+
+    def stop(self):
+        """
+        Write remaining nodes and wait for the thread to finish
+        """
+        self.input.put(None)
+        self.join()
+
+    def run(self):
+        finished = False
+        while not finished:
+            item = self.input.get()
+            if item is None:
+                break
+
+            batch = [item]
+            rows = countRows(item)
+            deadline = time.perf_counter() + self.maxtime
+            while rows < self.maxrows:
+                try:
+                    item = self.input.get(True, max(0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+
+                if item is None:
+                    finished = True
+                    break
+
+                batch.append(item)
+                rows += countRows(item)
+
+            self.write(batch)
+
+    def write(self, batch):
+        try:
+            self.writeBatch(batch)
+        except sql.exc.IntegrityError:
+            # Parents may have been deleted in the meantime, write them one by one
+            for item in batch:
+                try:
+                    self.writeBatch([item])
+                except Exception as e:
+                    self.output.put({'error': "Could not save nodes: {}".format(str(getattr(e, 'orig', e)))})
+        except Exception as e:
+            self.output.put({'error': "Could not save nodes: {}".format(str(getattr(e, 'orig', e)))})
+
+    def writeBatch(self, batch):
+        records = []
+        parents = OrderedDict()
+        jobs = OrderedDict()
+        for parent, data, options, tag, job in batch:
+            # Last state of each job, the cursor is kept if not changed
+            if job is not None:
+                key = (job['run_id'], job['node_id'])
+                jobs.setdefault(key, {'run': key[0], 'node': key[1], 'jobstatus': None, 'jobcursor': None})
+                jobs[key]['jobstatus'] = job['status']
+                if job['cursor'] is not None:
+                    jobs[key]['jobcursor'] = job['cursor']
+
+            if parent is None:
+                continue
+
+            new = getNodeRecords(parent, data, options)
+            records.extend(new)
+
+            if parent['id'] in parents:
+                parents[parent['id']]['count'] += len(new)
+            else:
+                parents[parent['id']] = {'parent_id': parent['id'], 'tag': tag, 'count': len(new)}
+
+        if records or jobs:
+            with self.engine.begin() as connection:
+                if records:
+                    connection.execute(self.insertStatement, records)
+                    connection.execute(self.updateStatement,
+                                       [{'parent': id, 'count': item['count']} for id, item in parents.items()])
+                if jobs:
+                    connection.execute(self.jobStatement, list(jobs.values()))
+
+        for item in parents.values():
+            self.output.put(item)
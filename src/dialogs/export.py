@@ -1,9 +1,14 @@
 from PySide2.QtCore import *
 from PySide2.QtGui import *
-from PySide2.QtWidgets import QFileDialog, QCheckBox, QComboBox, QLabel, QHBoxLayout
-import csv
+from PySide2.QtWidgets import QFileDialog, QCheckBox, QComboBox, QLabel, QHBoxLayout, QSpinBox, QApplication
+import sys
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
 from widgets.progressbar import ProgressBar
 from database import *
+import exporter
+import jsoncodec
 
 class ExportFileDialog(QFileDialog):
     """
@@ -14,7 +19,7 @@ class ExportFileDialog(QFileDialog):
         super(ExportFileDialog,self).__init__(*args,**kwargs)
 
         self.mainWindow = self.parent()
-        self.setWindowTitle("Export nodes to CSV")
+        self.setWindowTitle("Export nodes")
         self.setAcceptMode(QFileDialog.AcceptSave)
         self.setOption(QFileDialog.DontUseNativeDialog)
         #self.setFilter("CSV Files (*.csv)")
@@ -30,6 +35,19 @@ class ExportFileDialog(QFileDialog):
         self.optionSeparator.insertItems(0, [";","\\t",","])
         self.optionSeparator.setEditable(True)
 
+        self.optionProcesses = QSpinBox(self)
+        self.optionProcesses.setMinimum(1)
+        self.optionProcesses.setMaximum(max(1, os.cpu_count() or 1))
+        self.optionProcesses.setValue(self.optionProcesses.maximum())
+        self.optionProcesses.setToolTip("Number of processes used to export all nodes of large databases.")
+
+        self.optionFormat = QComboBox(self)
+        for format in exporter.availableFormats():
+            self.optionFormat.addItem(exporter.FORMATS[format][0], format)
+        self.optionFormat.setToolTip("JSON Lines files contain the full response of each node. "
+                                     "Parquet and Arrow files are typed and compressed, they need the pyarrow package.")
+        self.optionFormat.currentIndexChanged.connect(self.formatChanged)
+
         # if none or all are selected, export all
         # if one or more are selected, export selective
         self.optionAll = QComboBox(self)
@@ -48,12 +66,17 @@ class ExportFileDialog(QFileDialog):
         options.addWidget(self.optionLinebreaks)
         options.addWidget(QLabel('Separator'))
         options.addWidget(self.optionSeparator)
+        options.addWidget(QLabel('Processes'))
+        options.addWidget(self.optionProcesses)
         options.addStretch(1)
 
         layout.addLayout(options,row,1,1,2)
 
         layout.addWidget(QLabel('Export mode'),row+2,0)
         layout.addWidget(self.optionAll,row+2,1,1,2)
+
+        layout.addWidget(QLabel('Format'),row+3,0)
+        layout.addWidget(self.optionFormat,row+3,1,1,2)
         self.setLayout(layout)
 
         datadir = self.mainWindow.database.filename
@@ -65,26 +88,39 @@ class ExportFileDialog(QFileDialog):
         self.setDirectory(datadir)
 
         if self.exec_():
+            filename = self.selectedFiles()[0]
             try:
-                if os.path.isfile(self.selectedFiles()[0]):
-                    os.remove(self.selectedFiles()[0])
+                if os.path.isfile(filename):
+                    os.remove(filename)
             except Exception as e:
                 QMessageBox.information(self,"Facepager","Could not overwrite file:"+str(e))
                 return False
 
-            output = open(self.selectedFiles()[0], 'w', newline='', encoding='utf8')
-            try:
-                if self.optionBOM.isChecked():
-                    output.write('\ufeff')
+            if self.optionAll.currentIndex() == 0:
+                self.exportAllNodes(filename)
+            else:
+                self.exportSelectedNodes(filename)
 
-                if self.optionAll.currentIndex() == 0:
-                    self.exportAllNodes(output)
-                else:
-                    self.exportSelectedNodes(output)
-            finally:
-                output.close()
+    def formatChanged(self):
+        format = self.optionFormat.currentData()
+        self.setDefaultSuffix(exporter.FORMATS[format][1])
 
-    def exportSelectedNodes(self,output):
+        csvformat = format == 'csv'
+        self.optionBOM.setEnabled(csvformat)
+        self.optionLinebreaks.setEnabled(csvformat)
+        self.optionSeparator.setEnabled(csvformat)
+        self.optionProcesses.setEnabled(csvformat)
+
+    def createWriter(self, filename, header):
+        delimiter = self.optionSeparator.currentText()
+        delimiter = delimiter.encode('utf-8').decode('unicode_escape')
+
+        return exporter.createWriter(self.optionFormat.currentData(), filename, header,
+                                     delimiter=delimiter,
+                                     linebreaks=self.optionLinebreaks.isChecked(),
+                                     bom=self.optionBOM.isChecked())
+
+    def exportSelectedNodes(self,filename):
         progress = ProgressBar("Exporting data...", self.mainWindow)
 
         #indexes = self.mainWindow.tree.selectionModel().selectedRows()
@@ -94,93 +130,137 @@ class ExportFileDialog(QFileDialog):
         progress.setMaximum(len(indexes))
 
         try:
-            delimiter = self.optionSeparator.currentText()
-            delimiter = delimiter.encode('utf-8').decode('unicode_escape')
-            writer = csv.writer(output, delimiter=delimiter, quotechar='"', quoting=csv.QUOTE_ALL, doublequote=True,
-                                lineterminator='\r\n')
-
-
             #headers
             row = [str(val) for val in self.mainWindow.tree.treemodel.getRowHeader()]
-            if self.optionLinebreaks.isChecked():
-                row = [val.replace('\n', ' ').replace('\r',' ') for val in row]
             row = ['path'] + row
-            writer.writerow(row)
-
-            #rows
-            path = []
-            for index in indexes:
-                if progress.wasCanceled:
-                    break
+            writer = self.createWriter(filename, row)
+            csvformat = self.optionFormat.currentData() == 'csv'
 
-                # data
-                rowdata = self.mainWindow.tree.treemodel.getRowData(index)
+            try:
+                #rows
+                path = []
+                for index in indexes:
+                    if progress.wasCanceled:
+                        break
 
-                # path of parents (#2=level;#3=object ID)
-                while rowdata[2] < len(path):
-                    path.pop()
-                path.append(rowdata[3])
+                    # data
+                    rowdata = self.mainWindow.tree.treemodel.getRowData(index)
 
-                # values
-                row = [str(val) for val in rowdata]
-                row = ["/".join(path)] + row
-                if self.optionLinebreaks.isChecked():
-                    row = [val.replace('\n', ' ').replace('\r',' ') for val in row]
+                    # path of parents (#2=level;#3=object ID)
+                    while rowdata[2] < len(path):
+                        path.pop()
+                    path.append(rowdata[3])
 
-                writer.writerow(row)
+                    # values
+                    row = ["/".join(path)] + rowdata
+                    if csvformat:
+                        row = [str(val) for val in row]
+                        writer.writeRow(row)
+                    else:
+                        response = index.internalPointer().data['response']
+                        writer.writeRow(row, jsoncodec.dumps(response))
 
-                progress.step()
+                    progress.step()
+            finally:
+                writer.close()
 
         finally:
             progress.close()
 
 
-    def exportAllNodes(self,output):
+    def exportAllNodes(self,filename):
         progress = ProgressBar("Exporting data...", self.mainWindow)
         progress.setMaximum(Node.query.count())
 
         try:
-            delimiter = self.optionSeparator.currentText()
-            delimiter = delimiter.encode('utf-8').decode('unicode_escape')
-            writer = csv.writer(output, delimiter=delimiter, quotechar='"',
-                                quoting=csv.QUOTE_ALL, doublequote=True,
-                                lineterminator='\r\n')
-
             # Headers
-            row = ["level", "id", "parent_id", "object_id", "object_type","object_key",
-                   "query_status", "query_time", "query_type"]
-            for key in extractNames(self.mainWindow.tree.treemodel.customcolumns):
-                row.append(key)
-            if self.optionLinebreaks.isChecked():
-                row = [val.replace('\n', ' ').replace('\r',' ') for val in row]
-            writer.writerow(row)
-
-            # Rows
-            page = 0
-            while not progress.wasCanceled:
-                allnodes = Node.query.offset(page * 5000).limit(5000)
-                if allnodes.count() == 0:
-                    break
+            row = exporter.HEADER + list(extractNames(self.mainWindow.tree.treemodel.customcolumns))
+            writer = self.createWriter(filename, row)
 
-                for node in allnodes:
+            try:
+                # Large databases are exported in worker processes
+                if (self.optionFormat.currentData() == 'csv') and \
+                        (self.optionProcesses.value() > 1) and (progress.delayedmaximum > 50000):
+                    self.exportAllNodesParallel(writer, progress)
+                    return
+
+                # Rows
+                customkeys = compileKeys(self.mainWindow.tree.treemodel.customcolumns)
+                for node in self.mainWindow.database.iterNodes():
                     if progress.wasCanceled:
                         break
 
                     row = [node.level, node.id, node.parent_id, node.objectid,
                            node.objecttype,getDictValue(node.queryparams,'nodedata'),
                            node.querystatus, node.querytime, node.querytype]
-                    for key in self.mainWindow.tree.treemodel.customcolumns:
-                        row.append(node.getResponseValue(key)[1])
+                    for name, value in node.getResponseValues(customkeys):
+                        row.append(value)
 
-                    if self.optionLinebreaks.isChecked():
-                        row = [str(val).replace('\n', ' ').replace('\r',' ') for val in row]
-
-                    writer.writerow(row)
+                    writer.writeRow(row, node.response_raw)
 
                     # Step the bar
                     progress.step()
-
-                page += 1
+            finally:
+                writer.close()
 
         finally:
             progress.close()
+
+    def exportAllNodesParallel(self, writer, progress):
+        """
+        Split the ids into shards and export them in worker processes.
+        Each worker reads the database with its own read-only connection,
+        the shards are merged back in id order.
+        """
+
+        # Workers only see committed data
+        self.mainWindow.database.commit()
+        writer.output.flush()
+
+        # Rows
+        customcolumns = self.mainWindow.tree.treemodel.customcolumns
+        delimiter = self.optionSeparator.currentText()
+        delimiter = delimiter.encode('utf-8').decode('unicode_escape')
+        processes = self.optionProcesses.value()
+        minid, maxid = exporter.getIdRange(self.mainWindow.database.filename)
+        shards = exporter.splitIdRange(minid, maxid, processes * 4)
+
+        executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+        futures = [executor.submit(exporter.exportShard, self.mainWindow.database.filename, shard,
+                                   customcolumns, delimiter, self.optionLinebreaks.isChecked(),
+                                   jsoncodec.getCodec())
+                   for shard in shards]
+
+        merged = 0
+        try:
+            exported = 0
+            for future in futures:
+                while not future.done() and not progress.wasCanceled:
+                    QApplication.processEvents(maximumTime=100)
+                    wait([future], timeout=0.1)
+
+                if progress.wasCanceled:
+                    break
+
+                merged += 1
+                tempname, count = future.result()
+                try:
+                    with open(tempname, 'r', newline='', encoding='utf8') as shardfile:
+                        shutil.copyfileobj(shardfile, writer.output, 1024 * 1024)
+                finally:
+                    os.remove(tempname)
+
+                exported += count
+                progress.setValue(exported)
+
+        finally:
+            # Don't wait for running shards, their files are removed when they are finished
+            for future in futures[merged:]:
+                future.add_done_callback(exporter.removeShard)
+
+            if sys.version_info >= (3, 9):
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=False)
@@ -0,0 +1,268 @@
+"""
+Download files in large chunks directly to disk.
+
+The body is written to a .part file next to the target file. If the server
+accepts byte ranges and the file is larger than SEGMENT_SIZE, the file is
+split into segments: the first segment is read from the response, the others
+are fetched by parallel range requests into their region of the preallocated
+file. The written bytes of each segment are saved in a .part.json file at
+most every STATE_INTERVAL seconds and after each segment, an interrupted
+download is resumed if the server reports the same size and validator.
+Downloads that can't be resumed remove their files after errors. The file is
+renamed after its size was verified.
+
+Target files are reserved by reserveFilename() until the download finished,
+concurrent downloads with the same name get numbered file names.
+"""
+
+import os
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 1024 * 1024
+SEGMENT_SIZE = 8 * 1024 * 1024
+MAX_SEGMENTS = 4
+STATE_INTERVAL = 1.0
+
+# Target files of the downloads in progress
+reserved = set()
+reservedlock = threading.Lock()
+
+class DownloadError(Exception):
+    pass
+
+class RangeError(DownloadError):
+    pass
+
+def reserveFilename(makefilename):
+    """
+    Choose a target file that no other download in progress writes to.
+    :param makefilename: called with a function that checks whether a file name is taken
+    :return: the reserved file name, released by FileDownload.run()
+    """
+    with reservedlock:
+        fullfilename = makefilename(lambda name: os.path.isfile(name) or (name in reserved))
+        reserved.add(fullfilename)
+        return fullfilename
+
+def releaseFilename(fullfilename):
+    with reservedlock:
+        reserved.discard(fullfilename)
+
+class FileDownload(object):
+
+    def __init__(self, session, response, fullfilename, timeout=15, connected=None):
+        """
+        :param session: requests session for the range requests
+        :param response: streamed response of the first request, the body was not read yet
+        :param fullfilename: target file
+        :param connected: callable returning False to cancel the download
+        """
+        self.session = session
+        self.response = response
+        self.fullfilename = fullfilename
+        self.partfilename = fullfilename + '.part'
+        self.statefilename = fullfilename + '.part.json'
+        self.timeout = timeout
+        self.connected = connected
+        self.lock = threading.Lock()
+        self.failed = False
+        self.saved = 0
+
+        # Ranges and sizes refer to the encoded body
+        headers = response.headers
+        encoded = headers.get('content-encoding', 'identity').lower() != 'identity'
+        length = headers.get('content-length')
+        self.length = int(length) if (length is not None) and not encoded else None
+        self.ranges = (self.length is not None) and (headers.get('accept-ranges', '').lower() == 'bytes')
+        self.validator = headers.get('etag') or headers.get('last-modified')
+        self.segments = []
+
+    def getSegments(self):
+        """
+        Split the file into segments of at least SEGMENT_SIZE bytes if the server accepts ranges
+        """
+        if not self.length:
+            return [{'start': 0, 'end': self.length, 'written': 0}]
+
+        count = min(MAX_SEGMENTS, -(-self.length // SEGMENT_SIZE)) if self.ranges else 1
+        size = -(-self.length // count)
+        return [{'start': start, 'end': min(start + size, self.length), 'written': 0}
+                for start in range(0, self.length, size)]
+
+    def loadState(self):
+        """
+        Segments of an interrupted download of the same file, None if the download can't be resumed
+        """
+        # The size alone doesn't identify the same file
+        if not self.ranges or (self.validator is None):
+            return None
+
+        if not os.path.isfile(self.statefilename) or not os.path.isfile(self.partfilename):
+            return None
+
+        try:
+            with open(self.statefilename, 'r') as file:
+                state = json.load(file)
+        except (ValueError, OSError):
+            return None
+
+        if (state.get('length') != self.length) or (state.get('validator') != self.validator):
+            return None
+
+        if os.path.getsize(self.partfilename) != self.length:
+            return None
+
+        return state.get('segments')
+
+    def saveState(self, force=False):
+        """
+        Save the written bytes of the segments, not more often than every STATE_INTERVAL seconds unless forced
+        """
+        if not self.ranges:
+            return
+
+        with self.lock:
+            if not force and (time.monotonic() - self.saved < STATE_INTERVAL):
+                return
+            self.saved = time.monotonic()
+
+            state = {'length': self.length, 'validator': self.validator, 'segments': self.segments}
+            with open(self.statefilename, 'w') as file:
+                json.dump(state, file)
+
+    def run(self):
+        try:
+            return self.download()
+        finally:
+            releaseFilename(self.fullfilename)
+
+    def download(self):
+        segments = self.loadState()
+        resumed = segments is not None
+        self.segments = segments if resumed else self.getSegments()
+
+        try:
+            if not resumed:
+                with open(self.partfilename, 'wb') as file:
+                    if self.length is not None:
+                        file.truncate(self.length)
+                self.saveState(True)
+
+            pending = [segment for segment in self.segments if not self.isComplete(segment)]
+
+            # The first response delivers the beginning of the file
+            if resumed or (len(pending) == 0) or (pending[0]['start'] != 0):
+                self.response.close()
+                first = None
+            else:
+                first = pending.pop(0)
+
+            try:
+                self.fetchSegments(pending, first)
+            except RangeError:
+                self.fetchSequential()
+
+            self.verify()
+            os.replace(self.partfilename, self.fullfilename)
+        except Exception:
+            # Keep the files only if the download can be resumed, see loadState()
+            if not (self.ranges and self.validator):
+                self.removeFiles()
+            raise
+
+        self.removeFiles()
+        return self.fullfilename
+
+    def removeFiles(self):
+        for filename in [self.partfilename, self.statefilename]:
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+    def fetchSegments(self, pending, first=None):
+        """
+        Fetch the first segment from the response and the pending segments by range requests
+        """
+        # Segments stop after an error in another segment, see fetchSegment()
+        with ThreadPoolExecutor(max(1, len(pending))) as executor:
+            results = [executor.submit(self.fetchSegment, segment) for segment in pending]
+            if first is not None:
+                self.fetchSegment(first, self.response)
+            for result in results:
+                result.result()
+
+    def fetchSequential(self):
+        """
+        Download the complete file again if the server ignored the range requests
+        """
+        self.ranges = False
+        self.failed = False
+        if os.path.isfile(self.statefilename):
+            os.remove(self.statefilename)
+
+        self.segments = [{'start': 0, 'end': self.length, 'written': 0}]
+        with open(self.partfilename, 'wb') as file:
+            file.truncate(self.length)
+
+        response = self.session.send(self.response.request.copy(), stream=True, timeout=self.timeout)
+        self.fetchSegment(self.segments[0], response)
+
+    def isComplete(self, segment):
+        return (segment['end'] is not None) and (segment['start'] + segment['written'] >= segment['end'])
+
+    def fetchSegment(self, segment, response=None):
+        try:
+            if response is None:
+                response = self.requestRange(segment['start'] + segment['written'], segment['end'])
+
+            with open(self.partfilename, 'r+b') as file:
+                file.seek(segment['start'] + segment['written'])
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    # The error of the failed segment is raised by fetchSegments()
+                    if self.failed:
+                        break
+                    if (self.connected is not None) and not self.connected():
+                        raise DownloadError("Download cancelled.")
+
+                    # The first response continues after the first segment
+                    if segment['end'] is not None:
+                        chunk = memoryview(chunk)[:segment['end'] - segment['start'] - segment['written']]
+
+                    file.write(chunk)
+                    with self.lock:
+                        segment['written'] += len(chunk)
+                    self.saveState()
+
+                    if self.isComplete(segment):
+                        break
+        except Exception:
+            self.failed = True
+            raise
+        finally:
+            if response is not None:
+                response.close()
+
+            # Written bytes since the last state, also after errors
+            self.saveState(True)
+
+    def requestRange(self, start, end):
+        request = self.response.request.copy()
+        request.headers['Range'] = 'bytes={}-{}'.format(start, end - 1)
+        request.headers['Accept-Encoding'] = 'identity'
+
+        response = self.session.send(request, stream=True, timeout=self.timeout)
+        if response.status_code != 206:
+            response.close()
+            raise RangeError("Server did not return the requested range (status {}).".format(response.status_code))
+        return response
+
+    def verify(self):
+        if self.length is None:
+            return
+
+        written = sum(segment['written'] for segment in self.segments)
+        size = os.path.getsize(self.partfilename)
+        if (written != self.length) or (size != self.length):
+            raise DownloadError("Download incomplete, {} of {} bytes received.".format(written, self.length))
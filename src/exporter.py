@@ -0,0 +1,262 @@
+"""
+Export nodes to CSV, JSON Lines, Parquet or Arrow IPC files.
+
+All writers receive the same rows, extracted by the export dialog or by getRow().
+The shard functions work on plain SQLite connections so they can run in worker
+processes. Shards are id ranges, each worker writes its rows to a temporary
+CSV file and the files are merged in id order by the calling process.
+"""
+
+import csv
+import os
+import sqlite3
+import tempfile
+from collections import OrderedDict
+from urllib.request import pathname2url
+
+import jsoncodec
+from utilities import getDictValue, compileKeys, extractValues
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+HEADER = ["level", "id", "parent_id", "object_id", "object_type", "object_key",
+          "query_status", "query_time", "query_type"]
+
+COLUMNS = "level, id, parent_id, objectid, objecttype, queryparams, querystatus, querytime, querytype, response"
+
+# Format: (caption, file extension)
+FORMATS = OrderedDict([
+    ('csv', ('CSV', 'csv')),
+    ('jsonl', ('JSON Lines', 'jsonl')),
+    ('parquet', ('Apache Parquet', 'parquet')),
+    ('arrow', ('Apache Arrow IPC', 'arrow'))
+])
+
+INTEGER_COLUMNS = ['level', 'id', 'parent_id']
+
+def availableFormats():
+    return [key for key in FORMATS.keys() if (pyarrow is not None) or (key not in ['parquet', 'arrow'])]
+
+def uniqueNames(header, reserved=()):
+    """
+    Make column names unique, custom columns may repeat names
+    """
+    names = []
+    for name in header:
+        name = str(name)
+        unique = name
+        while (unique in names) or (unique in reserved):
+            unique += '_'
+        names.append(unique)
+    return names
+
+def createWriter(format, filename, header, **options):
+    if format == 'jsonl':
+        return JsonLinesWriter(filename, header)
+    elif format == 'parquet':
+        return ParquetWriter(filename, header)
+    elif format == 'arrow':
+        return ArrowWriter(filename, header)
+    else:
+        return CsvWriter(filename, header, **options)
+
+class CsvWriter(object):
+    """
+    Quotes all values, line breaks are optionally replaced by spaces
+    """
+
+    def __init__(self, filename, header=None, delimiter=';', linebreaks=True, bom=False):
+        self.linebreaks = linebreaks
+        self.output = open(filename, 'w', newline='', encoding='utf8')
+        if bom:
+            self.output.write('\ufeff')
+
+        self.writer = csv.writer(self.output, delimiter=delimiter, quotechar='"',
+                                 quoting=csv.QUOTE_ALL, doublequote=True,
+                                 lineterminator='\r\n')
+        if header is not None:
+            self.writeRow(header)
+
+    def writeRow(self, row, response=None):
+        if self.linebreaks:
+            row = [str(val).replace('\n', ' ').replace('\r', ' ') for val in row]
+        self.writer.writerow(row)
+
+    def close(self):
+        self.output.close()
+
+class JsonLinesWriter(object):
+    """
+    Writes one object per line, the raw response is embedded without
+    decoding and encoding it again
+    """
+
+    def __init__(self, filename, header):
+        # The response key is added to the objects
+        self.header = uniqueNames(header, ['response'])
+        self.output = open(filename, 'w', newline='\n', encoding='utf8')
+
+    def writeRow(self, row, response=None):
+        line = jsoncodec.dumps(OrderedDict(zip(self.header, row)))
+        if response is not None:
+            line = line[:-1] + (',' if len(self.header) else '') + '"response":' + response + '}'
+        self.output.write(line + '\n')
+
+    def close(self):
+        self.output.close()
+
+class ArrowWriter(object):
+    """
+    Writes typed and compressed record batches, all columns except the ids
+    and the level are stored as strings
+    """
+
+    def __init__(self, filename, header, batchsize=10000):
+        if pyarrow is None:
+            raise Exception("Install pyarrow to export Arrow or Parquet files.")
+
+        names = uniqueNames(header)
+        self.schema = pyarrow.schema([
+            (name, pyarrow.int64() if name in INTEGER_COLUMNS else pyarrow.string()) for name in names
+        ])
+        self.integers = [name in INTEGER_COLUMNS for name in names]
+        self.batchsize = batchsize
+        self.columns = [[] for name in names]
+        self.count = 0
+        self.open(filename)
+
+    def open(self, filename):
+        options = pyarrow.ipc.IpcWriteOptions(compression='zstd')
+        self.writer = pyarrow.ipc.new_file(filename, self.schema, options=options)
+
+    def writeRow(self, row, response=None):
+        for column, integer, value in zip(self.columns, self.integers, row):
+            if (value is None) or integer:
+                column.append(value)
+            else:
+                column.append(str(value))
+
+        self.count += 1
+        if self.count >= self.batchsize:
+            self.flush()
+
+    def flush(self):
+        if self.count > 0:
+            batch = pyarrow.record_batch(self.columns, schema=self.schema)
+            self.writeBatch(batch)
+            self.columns = [[] for column in self.columns]
+            self.count = 0
+
+    def writeBatch(self, batch):
+        self.writer.write_batch(batch)
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+class ParquetWriter(ArrowWriter):
+    """
+    Each batch becomes a row group
+    """
+
+    def open(self, filename):
+        self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema, compression='zstd')
+
+    def writeBatch(self, batch):
+        self.writer.write_table(pyarrow.Table.from_batches([batch]))
+
+def connectReadOnly(filename):
+    uri = 'file:{}?mode=ro'.format(pathname2url(os.path.abspath(filename)))
+    return sqlite3.connect(uri, uri=True)
+
+def getIdRange(filename):
+    connection = connectReadOnly(filename)
+    try:
+        return connection.execute("SELECT MIN(id), MAX(id) FROM Nodes").fetchone()
+    finally:
+        connection.close()
+
+def splitIdRange(minid, maxid, count):
+    """
+    Split the ids into shards of (first id exclusive, last id inclusive)
+    """
+    if minid is None or maxid is None:
+        return []
+
+    size = max(1, -(-(maxid - minid + 1) // count))
+    return [(lastid, min(lastid + size, maxid)) for lastid in range(minid - 1, maxid, size)]
+
+def getRow(record, customkeys):
+    level, id, parent_id, objectid, objecttype, queryparams, querystatus, querytime, querytype, response = record
+
+    queryparams = jsoncodec.loads(queryparams) if queryparams is not None else {}
+    response = jsoncodec.loads(response) if response is not None else {}
+
+    row = [level, id, parent_id, objectid, objecttype, getDictValue(queryparams, 'nodedata'),
+           querystatus, querytime, querytype]
+    for name, value in extractValues(response, customkeys):
+        row.append(value)
+
+    return row
+
+def iterRecords(connection, lastid, maxid, batchsize=5000):
+    """
+    Yield raw node records with keyset pagination
+    """
+    while True:
+        cursor = connection.execute(
+            "SELECT " + COLUMNS + " FROM Nodes WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+            (lastid, maxid, batchsize))
+
+        count = 0
+        for record in cursor:
+            lastid = record[1]
+            count += 1
+            yield record
+
+        if count < batchsize:
+            break
+
+def exportShard(filename, shard, customcolumns, delimiter, linebreaks, codec='auto'):
+    """
+    Write the nodes of one shard to a temporary CSV file,
+    returns the file name and the number of rows
+    """
+    jsoncodec.setCodec(codec)
+    customkeys = compileKeys(customcolumns)
+
+    connection = connectReadOnly(filename)
+    handle, tempname = tempfile.mkstemp(suffix='.csv', prefix='facepager_')
+    os.close(handle)
+    count = 0
+    try:
+        writer = CsvWriter(tempname, None, delimiter, linebreaks)
+        try:
+            for record in iterRecords(connection, shard[0], shard[1]):
+                writer.writeRow(getRow(record, customkeys))
+                count += 1
+        finally:
+            writer.close()
+    except:
+        os.remove(tempname)
+        raise
+    finally:
+        connection.close()
+
+    return tempname, count
+
+def removeShard(future):
+    """
+    Remove the file of a shard that was not merged, callback of the shard future
+    """
+    if future.cancelled() or (future.exception() is not None):
+        return
+
+    tempname, count = future.result()
+    if os.path.isfile(tempname):
+        os.remove(tempname)
@@ -0,0 +1,237 @@
+"""
+Cache responses on disk to avoid sending identical requests again.
+
+Responses are stored in an SQLite database next to the settings. The key is a
+hash of the final request: method, URL, sorted parameters, headers, a hash of
+the body and the credential. Entries are fresh for the configured lifetime.
+Stale entries with an ETag or Last-Modified header are revalidated by a
+conditional request, a 304 response refreshes the entry. The least recently
+used entries are removed when the cache grows above its size limit.
+
+SingleFlight coalesces identical requests sent at the same time by different
+threads or tasks: the first caller sends the request, the others wait for its
+future and receive a copy of the result.
+"""
+
+import os
+import time
+import json
+import hashlib
+import sqlite3
+import threading
+from copy import deepcopy
+from concurrent.futures import Future
+
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+CACHEFILE = os.path.join(os.path.expanduser("~"), 'Facepager', 'httpcache.db')
+
+class CachedResponse(object):
+    """
+    Stored response with the attributes used by getResponseData()
+    """
+
+    def __init__(self, url, status_code, headers, content, stored=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.stored = time.time() if stored is None else stored
+        self.encoding = get_encoding_from_headers(self.headers)
+        self.ok = status_code < 400
+        self.is_error = not self.ok
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def getAge(self, now=None):
+        return (time.time() if now is None else now) - self.stored
+
+    def getValidators(self):
+        """
+        Headers of a conditional request to revalidate the response
+        """
+        validators = {}
+        if self.headers.get('etag') is not None:
+            validators['If-None-Match'] = self.headers['etag']
+        if self.headers.get('last-modified') is not None:
+            validators['If-Modified-Since'] = self.headers['last-modified']
+        return validators
+
+class HttpCache(object):
+
+    def __init__(self, filename=CACHEFILE):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.connection = None
+        self.size = 0
+
+    def open(self):
+        if self.connection is not None:
+            return self.connection
+
+        folder = os.path.dirname(self.filename)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        connection = sqlite3.connect(self.filename, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS Responses "
+                           "(key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, content BLOB, "
+                           "stored REAL, accessed REAL, size INTEGER)")
+        connection.execute("CREATE INDEX IF NOT EXISTS ix_Responses_accessed ON Responses (accessed)")
+        self.size = connection.execute("SELECT coalesce(sum(size), 0) FROM Responses").fetchone()[0]
+        self.connection = connection
+        return connection
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    @staticmethod
+    def getKey(method, url, params=None, headers=None, payload=None, credential=''):
+        """
+        Hash of the final request, None if the payload can not be hashed (e.g. multipart uploads)
+        """
+        if payload is None:
+            body = None
+        elif isinstance(payload, bytes):
+            body = hashlib.sha1(payload).hexdigest()
+        elif isinstance(payload, str):
+            body = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+        elif isinstance(payload, dict):
+            body = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        else:
+            return None
+
+        params = sorted([str(key), str(value)] for key, value in (params or {}).items() if value is not None)
+        headers = sorted([str(key).lower(), str(value)] for key, value in (headers or {}).items())
+        request = [method.upper(), url, params, headers, body, credential]
+        return hashlib.sha1(json.dumps(request).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Return the cached response or None
+        """
+        with self.lock:
+            connection = self.open()
+            row = connection.execute("SELECT url, status, headers, content, stored FROM Responses WHERE key=?",
+                                     (key,)).fetchone()
+            if row is None:
+                return None
+
+            connection.execute("UPDATE Responses SET accessed=? WHERE key=?", (time.time(), key))
+
+        url, status, headers, content, stored = row
+        return CachedResponse(url, status, json.loads(headers), bytes(content), stored)
+
+    def put(self, key, url, status, headers, content, maxsize=None):
+        """
+        Store the response and evict old entries if the cache is larger than maxsize bytes
+        """
+        now = time.time()
+        size = len(content)
+        if (maxsize is not None) and (size > maxsize):
+            return False
+
+        with self.lock:
+            connection = self.open()
+            with connection:
+                connection.execute("BEGIN")
+                row = connection.execute("SELECT size FROM Responses WHERE key=?", (key,)).fetchone()
+                connection.execute("INSERT OR REPLACE INTO Responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (key, url, status, json.dumps(dict(headers)), content, now, now, size))
+            self.size += size - (row[0] if row is not None else 0)
+
+            if (maxsize is not None) and (self.size > maxsize):
+                self.evict(maxsize * 0.9)
+
+        return True
+
+    def refresh(self, key, headers=None):
+        """
+        Restart the lifetime of a revalidated entry
+        """
+        with self.lock:
+            connection = self.open()
+            now = time.time()
+            if headers is not None:
+                headers = CaseInsensitiveDict(headers)
+                row = connection.execute("SELECT headers FROM Responses WHERE key=?", (key,)).fetchone()
+                if row is not None:
+                    stored = CaseInsensitiveDict(json.loads(row[0]))
+                    for name in ['etag', 'last-modified', 'expires', 'cache-control', 'date']:
+                        if name in headers:
+                            stored[name] = headers[name]
+                    connection.execute("UPDATE Responses SET headers=? WHERE key=?",
+                                       (json.dumps(dict(stored)), key))
+
+            connection.execute("UPDATE Responses SET stored=?, accessed=? WHERE key=?", (now, now, key))
+
+    def evict(self, maxsize):
+        """
+        Remove the least recently used entries until the cache is not larger than maxsize bytes
+        """
+        connection = self.open()
+        with connection:
+            connection.execute("BEGIN")
+            rows = connection.execute("SELECT key, size FROM Responses ORDER BY accessed DESC").fetchall()
+            kept = 0
+            remove = []
+            for key, size in rows:
+                if kept + size > maxsize:
+                    remove.append((key,))
+                else:
+                    kept += size
+            connection.executemany("DELETE FROM Responses WHERE key=?", remove)
+
+        self.size = kept
+
+    def clear(self):
+        with self.lock:
+            connection = self.open()
+            connection.execute("DELETE FROM Responses")
+            self.size = 0
+
+class SingleFlight(object):
+    """
+    Requests in flight by key
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def join(self, key):
+        """
+        Returns the future of the request and whether the caller has to send the request
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                flight['followers'] += 1
+                return flight['future'], False
+
+            flight = {'future': Future(), 'followers': 0}
+            self.flights[key] = flight
+            return flight['future'], True
+
+    def leave(self, key, result=None, exception=None):
+        """
+        Pass the result to the waiting callers, they get a copy
+        because the sender may change its result
+        """
+        with self.lock:
+            flight = self.flights.pop(key)
+
+        if exception is not None:
+            flight['future'].set_exception(exception)
+        else:
+            flight['future'].set_result(deepcopy(result) if flight['followers'] > 0 else None)
+
+httpcache = HttpCache()
@@ -0,0 +1,218 @@
+"""
+JSON encoding and decoding with the fastest library available.
+
+orjson and ujson are optional, the json module of the standard
+library is used if neither is installed. Decoding accepts str or bytes,
+encoding always returns str. Values the fast libraries cannot handle
+(e.g. integers beyond 64 bit or NaN) are passed to the json module.
+
+Responses with a Content-Length above STREAM_SIZE are decoded incrementally
+from the stream if ijson is installed. The body is never held as bytes or str,
+memory is bounded by the decoded data instead of the response size. ijson is
+slower than the codecs, smaller responses and responses of unknown length are
+read completely.
+"""
+
+import json
+import math
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Decode responses above this size from the stream
+STREAM_SIZE = 1024 * 1024
+STREAM_CHUNK = 64 * 1024
+
+CODECS = ['auto', 'orjson', 'ujson', 'json']
+
+def availableCodecs():
+    codecs = ['auto']
+    if orjson is not None:
+        codecs.append('orjson')
+    if ujson is not None:
+        codecs.append('ujson')
+    codecs.append('json')
+    return codecs
+
+def _orjsonDefault(value):
+    raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
+
+def _orjsonDumps(value):
+    # Types the json module rejects are passed to the default function
+    encoded = orjson.dumps(value, default=_orjsonDefault,
+                           option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+
+    # orjson encodes NaN and infinity as null
+    if (b'null' in encoded) and not _isFinite(value):
+        raise ValueError("Out of range float values are not supported by orjson")
+    return encoded.decode('utf-8')
+
+def _isFinite(value):
+    """
+    Check nested lists and dicts for NaN and infinity,
+    the recursion is limited by the nesting depth orjson accepts
+    """
+    valuetype = type(value)
+    if valuetype is float:
+        return math.isfinite(value)
+    elif valuetype is dict:
+        return all(map(_isFinite, value.values()))
+    elif (valuetype is list) or (valuetype is tuple):
+        return all(map(_isFinite, value))
+    return True
+
+def _ujsonDumps(value):
+    return ujson.dumps(value, ensure_ascii=False, escape_forward_slashes=False)
+
+def _ujsonLoads(value):
+    # ujson doesn't detect other encodings than UTF-8
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode('utf-8')
+    return ujson.loads(value)
+
+def setCodec(name='auto'):
+    """
+    Select the codec by name, returns the name of the codec in use.
+    Unavailable codecs fall back to the next faster one.
+    """
+    global codec, _loads, _dumps
+
+    available = availableCodecs()
+    if name not in available:
+        name = 'auto'
+    if name == 'auto':
+        name = available[1]
+
+    if name == 'orjson':
+        _loads, _dumps = orjson.loads, _orjsonDumps
+    elif name == 'ujson':
+        _loads, _dumps = _ujsonLoads, _ujsonDumps
+    else:
+        _loads, _dumps = json.loads, json.dumps
+
+    codec = name
+    return codec
+
+def getCodec():
+    return codec
+
+def loads(value):
+    try:
+        return _loads(value)
+    except ValueError:
+        if _loads is json.loads:
+            raise
+        return json.loads(value)
+
+def dumps(value):
+    try:
+        return _dumps(value)
+    except (TypeError, ValueError, OverflowError):
+        if _dumps is json.dumps:
+            raise
+        return json.dumps(value)
+
+def loadsResponse(response):
+    """
+    Decode the body of a requests response, empty bodies result in an empty list.
+    UTF-8 content is passed to the codec without decoding it to str first.
+    """
+    content = response.content
+    if not content:
+        return []
+
+    encoding = response.encoding
+    if (encoding is None) or (encoding.lower() in ('utf-8', 'utf8')):
+        return loads(content)
+    else:
+        return loads(response.text)
+
+def canStream(response):
+    """
+    Check whether the body of a response that was not read yet can be decoded by loadsStream()
+    """
+    if ijson is None:
+        return False
+
+    # ijson decodes UTF-8 only
+    contenttype = response.headers.get('content-type', '').lower()
+    charset = contenttype.partition('charset=')[2].split(';')[0].strip(' "\'')
+    if charset not in ('', 'utf-8', 'utf8'):
+        return False
+
+    length = response.headers.get('content-length', '')
+    return length.isdigit() and (int(length) > STREAM_SIZE)
+
+class ChunkReader(object):
+    """
+    File-like object for ijson over an iterator of byte chunks
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.size = 0
+
+    def read(self, size=-1):
+        # ijson checks the type with read(0)
+        if size == 0:
+            return b''
+        for chunk in self.chunks:
+            if chunk:
+                self.size += len(chunk)
+                return chunk
+        return b''
+
+class AsyncChunkReader(ChunkReader):
+
+    async def read(self, size=-1):
+        if size == 0:
+            return b''
+        async for chunk in self.chunks:
+            if chunk:
+                self.size += len(chunk)
+                return chunk
+        return b''
+
+def loadsStream(chunks):
+    """
+    Decode the body from an iterator of byte chunks, e.g. iter_content() of requests.
+    Empty bodies result in an empty list.
+    """
+    reader = ChunkReader(iter(chunks))
+    try:
+        for value in ijson.items(reader, '', use_float=True):
+            return value
+    except ijson.IncompleteJSONError:
+        if reader.size > 0:
+            raise
+    return []
+
+async def loadsStreamAsync(chunks):
+    """
+    Decode the body from an async iterator of byte chunks, e.g. aiter_bytes() of httpx
+    """
+    reader = AsyncChunkReader(chunks.__aiter__())
+    try:
+        async for value in ijson.items(reader, '', use_float=True):
+            return value
+    except ijson.IncompleteJSONError:
+        if reader.size > 0:
+            raise
+    return []
+
+codec = None
+_loads = json.loads
+_dumps = json.dumps
+setCodec()
@@ -0,0 +1,182 @@
+"""
+Limit the request rate with token buckets shared by all threads and the async engine.
+
+There is one bucket for each module, host and credential. A bucket holds up to
+burst tokens and refills with the configured rate. Each request reserves the
+next token under a lock and waits until the token is available, so concurrent
+requests are spaced evenly. Response headers adjust the rate: remaining
+requests until a reset time, Retry-After and the usage percentages of Facebook.
+"""
+
+import time
+import threading
+import asyncio
+from email.utils import parsedate_to_datetime
+
+import jsoncodec
+
+class TokenBucket(object):
+    """
+    Token bucket in the form of the generic cell rate algorithm,
+    nextfree is the time when the bucket is full again
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.lock = threading.Lock()
+        self.clock = clock
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.nextfree = clock()
+        self.pausedUntil = 0
+
+        # Adjusted by the headers
+        self.limit = None
+        self.limitUntil = 0
+        self.factor = 1.0
+
+    def configure(self, rate, burst=1):
+        with self.lock:
+            self.rate = rate
+            self.burst = max(1, burst)
+
+    def getRate(self, now=None):
+        now = self.clock() if now is None else now
+        rate = self.rate
+        if (self.limit is not None) and (now < self.limitUntil):
+            rate = min(rate, self.limit)
+        return max(rate * self.factor, 0.001)
+
+    def reserve(self):
+        """
+        Take the next token, returns the seconds to wait until the token is available
+        """
+        with self.lock:
+            now = self.clock()
+            interval = 1.0 / self.getRate(now)
+            arrival = max(now, self.pausedUntil)
+
+            nextfree = max(self.nextfree, arrival)
+            start = max(arrival, nextfree - (self.burst - 1) * interval)
+            self.nextfree = nextfree + interval
+
+            return start - now
+
+    def acquire(self, connected=None):
+        """
+        Wait for the next token, returns False if the wait was cancelled by connected()
+        """
+        until = self.clock() + self.reserve()
+        while True:
+            if (connected is not None) and not connected():
+                return False
+            wait = until - self.clock()
+            if wait <= 0:
+                return True
+            time.sleep(min(wait, 0.1))
+
+    async def acquireAsync(self, connected=None):
+        until = self.clock() + self.reserve()
+        while True:
+            if (connected is not None) and not connected():
+                return False
+            wait = until - self.clock()
+            if wait <= 0:
+                return True
+            await asyncio.sleep(min(wait, 0.1))
+
+    def pause(self, seconds):
+        with self.lock:
+            self.pausedUntil = max(self.pausedUntil, self.clock() + seconds)
+
+    def update(self, headers, statuscode=None):
+        """
+        Adjust the rate to the rate limit headers of a response
+        """
+        headers = {key.lower(): value for key, value in headers.items()}
+        now = self.clock()
+
+        with self.lock:
+            # Remaining requests until reset (Twitter, GitHub and others)
+            remaining = getNumber(headers, ['x-rate-limit-remaining', 'x-ratelimit-remaining', 'ratelimit-remaining'])
+            reset = getNumber(headers, ['x-rate-limit-reset', 'x-ratelimit-reset', 'ratelimit-reset'])
+            if (remaining is not None) and (reset is not None):
+                # Reset is either a timestamp or the number of seconds
+                seconds = reset - time.time() if reset > 1000000000 else reset
+                seconds = max(1.0, seconds)
+                if remaining < 1:
+                    self.pausedUntil = max(self.pausedUntil, now + seconds)
+                else:
+                    self.limit = remaining / seconds
+                    self.limitUntil = now + seconds
+
+            # Usage in percent (Facebook)
+            usage = getUsage(headers.get('x-app-usage'))
+            if usage is not None:
+                if usage >= 100:
+                    self.pausedUntil = max(self.pausedUntil, now + 60)
+                self.factor = min(1.0, max(0.1, (100 - usage) / 25.0))
+
+            # Retry later
+            retryafter = getRetryAfter(headers.get('retry-after'))
+            if retryafter is not None:
+                self.pausedUntil = max(self.pausedUntil, now + retryafter)
+
+            # Slow down after rate limit errors without headers, speed up again after successful requests
+            if (statuscode == 429) and (retryafter is None) and (remaining is None):
+                self.factor = max(0.1, self.factor / 2)
+            elif (statuscode is not None) and (statuscode < 400) and (usage is None):
+                self.factor = min(1.0, self.factor + 0.05)
+
+class RateLimiter(object):
+    """
+    Buckets by module, host and credential
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def getBucket(self, key, rate, burst=1):
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(rate, burst)
+                self.buckets[key] = bucket
+            elif (bucket.rate != rate) or (bucket.burst != max(1, burst)):
+                bucket.configure(rate, burst)
+            return bucket
+
+    def clear(self):
+        with self.lock:
+            self.buckets = {}
+
+def getNumber(headers, names):
+    for name in names:
+        try:
+            return float(headers[name])
+        except (KeyError, ValueError, TypeError):
+            pass
+    return None
+
+def getUsage(value):
+    if value is None:
+        return None
+    try:
+        usage = jsoncodec.loads(value)
+        return max(float(usage.get(key, 0)) for key in ['call_count', 'total_time', 'total_cputime'])
+    except Exception:
+        return None
+
+def getRetryAfter(value):
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+ratelimiter = RateLimiter()
@@ -0,0 +1,301 @@
+"""
+Feed fetch jobs to the thread pool and write the results to the database.
+
+The scheduler is shared by the user interface and the batch runner.
+Subclasses show the progress and decide how to continue after errors
+by overriding the callbacks, the scheduler itself has no widgets.
+"""
+
+import time
+from collections import defaultdict
+
+from database import NodeWriter
+from asyncthread import createThreadPool
+
+ALLOWED_STATUS = ['fetched (200)', 'downloaded (200)', 'fetched (202)']
+
+class FetchScheduler(object):
+
+    def __init__(self, apimodule, options, database, jobqueue=None):
+        """
+        :param apimodule: module fetching the data in the threads
+        :param database: database the nodes are written to
+        :param jobqueue: JobQueue saving the state of the jobs, None if the jobs are not saved
+        """
+        self.apimodule = apimodule
+        self.options = options
+        self.database = database
+        self.jobqueue = jobqueue
+        self.threadpool = None
+        self.writer = None
+        self.canceled = False
+        self.connectionstats = None
+        self.cachestats = None
+
+        self.stats = {'started': time.time(), 'nodes': 0, 'finished': 0, 'responses': 0, 'newnodes': 0,
+                      'status': defaultdict(int), 'canceled': False}
+
+    # Callbacks
+    def logmessage(self, msg):
+        pass
+
+    def nodesWritten(self, written):
+        self.stats['newnodes'] += written['count']
+
+    def jobsAdded(self, complete):
+        """
+        Called after jobs were added, complete is True after the last job
+        """
+        pass
+
+    def jobProgress(self, job):
+        """
+        Progress of a node in a thread, e.g. the current page
+        """
+        pass
+
+    def jobFinished(self, job):
+        pass
+
+    def dataAdded(self, job, status):
+        pass
+
+    def update(self, newdata):
+        """
+        Called once in each iteration after the results were processed, may cancel the run
+        """
+        pass
+
+    def suspend(self, msg, ratelimit, autoretry):
+        """
+        The jobs were suspended after errors or a rate limit
+        """
+        self.logmessage(msg)
+
+    def errorsPending(self, count):
+        """
+        The jobs were suspended because all nodes are finished but some failed
+        """
+        pass
+
+    def resume(self):
+        """
+        Continue suspended jobs, return True if the jobs were resumed
+        """
+        return False
+
+    def stopping(self):
+        pass
+
+    def wait(self):
+        self.threadpool.waitForJobs(0.1)
+
+    def finish(self):
+        """
+        Log the summary after the run
+        """
+        stats = self.stats
+        if stats['reuse'] is not None:
+            self.logmessage("{:.0%} of the requests reused a kept-alive connection.".format(stats['reuse']))
+
+        cachehits = stats['cache']
+        if cachehits['hits'] or cachehits['revalidated']:
+            self.logmessage("{} response(s) served from the cache, {} revalidated by the server.".format(
+                cachehits['hits'], cachehits['revalidated']))
+        if cachehits['coalesced']:
+            self.logmessage("{} identical request(s) waited for a request in flight instead of being sent.".format(
+                cachehits['coalesced']))
+
+    # Scheduling
+    def cancel(self):
+        self.canceled = True
+        self.stats['canceled'] = True
+
+    def getRemaining(self):
+        remaining = self.threadpool.getJobCount()
+        if self.jobqueue is not None:
+            remaining += self.jobqueue.getRemaining()
+        return remaining
+
+    def updateWritten(self):
+        for written in self.writer.getWritten():
+            if 'error' in written:
+                self.logmessage(written['error'])
+            else:
+                self.nodesWritten(written)
+
+    def run(self, jobs):
+        """
+        Fetch all jobs and return the statistics
+        :param jobs: iterable of jobs, None for skipped nodes
+        """
+        stats = self.stats
+        jobs = iter(jobs)
+        hasjobs = True
+        finished = False
+        errorcount = 0
+        ratelimitcount = 0
+
+        self.connectionstats = self.apimodule.getConnectionStats()
+        self.cachestats = self.apimodule.getCacheStats()
+
+        # Write nodes in a separate thread
+        self.writer = NodeWriter(self.database.engine)
+        self.writer.start()
+
+        try:
+            threadpool = createThreadPool(self.apimodule, self.options)
+            threadpool.spawnThreads(self.options.get('threads', 1))
+            self.threadpool = threadpool
+
+            while True:
+                try:
+                    # Logging (sync logs in threads with main thread)
+                    for msg in threadpool.getLogMessages():
+                        self.logmessage(msg)
+
+                    self.updateWritten()
+
+                    # Jobs in: packages of 100 at a time,
+                    # nodes from the database are added while the threads need them
+                    jobsin = 0
+                    while hasjobs and (jobsin < 100) and ((self.jobqueue is None) or (threadpool.getJobCount() < 1000)):
+                        job = next(jobs, False)
+                        if job is not False:
+                            jobsin += 1
+                            stats['nodes'] += 1
+                            if job is not None:
+                                threadpool.addJob(job)
+                        else:
+                            threadpool.applyJobs()
+                            hasjobs = False
+                            self.jobsAdded(True)
+
+                    if hasjobs and (jobsin > 0):
+                        self.jobsAdded(False)
+
+                    # Jobs out: all results of the threads since the last iteration
+                    finished = False
+                    newdata = False
+                    for job in threadpool.getJobs():
+
+                        # Finished all nodes (sentinel)
+                        if job is None:
+                            finished = True
+                            break
+
+                        # Progress of a single node
+                        elif 'progress' in job and (('current' in job) or ('page' in job)):
+                            self.jobProgress(job)
+
+                        # Finished one node
+                        elif 'progress' in job:
+                            if not threadpool.suspended:
+                                stats['finished'] += 1
+
+                            # Save the state of the job
+                            if self.jobqueue is not None:
+                                self.writer.updateJob(self.jobqueue.getFinalState(job, self.canceled))
+
+                            self.jobFinished(job)
+
+                        # Add data, the nodes are written by the writer
+                        elif ('data' in job) and not self.canceled:
+                            status = job['options'].get('querystatus', 'empty')
+                            jobstate = None
+                            if self.jobqueue is not None:
+                                jobstate = self.jobqueue.getPageState(job, status in ALLOWED_STATUS)
+
+                            parent = {'id': job['nodeid'], 'objectid': job['nodedata']['objectid'],
+                                      'level': job['nodedata']['level']}
+                            self.writer.addNodes(parent, job['data'], job['options'], job=jobstate)
+                            newdata = True
+
+                            # Count status and errors
+                            stats['status'][status] += 1
+                            stats['responses'] += 1
+                            errorcount += int(not status in ALLOWED_STATUS)
+
+                            # Detect rate limit
+                            ratelimit = job['options'].get('ratelimit', False)
+                            ratelimitcount += int(ratelimit)
+                            autoretry = (ratelimitcount > 0) or (status == "request error")
+
+                            # Clear errors when everything is ok
+                            if not threadpool.suspended and (status in ALLOWED_STATUS) and (not ratelimit):
+                                errorcount = 0
+                                ratelimitcount = 0
+
+                            # Suspend on error or rate limit
+                            elif not threadpool.suspended and ((errorcount >= self.options['errors']) or (ratelimitcount > 0)):
+                                threadpool.suspendJobs()
+                                if ratelimit:
+                                    msg = "You reached the rate limit of the API."
+                                else:
+                                    msg = "{} consecutive errors occurred.".format(errorcount)
+                                self.suspend(msg, ratelimit, autoretry)
+
+                            # Add job for retry
+                            if not status in ALLOWED_STATUS:
+                                threadpool.addError(job)
+
+                            self.dataAdded(job, status)
+
+                    if finished:
+                        break
+
+                    self.update(newdata)
+
+                    # Abort
+                    if self.canceled:
+                        hasjobs = False
+                        threadpool.clearJobs()
+                        threadpool.clearRetry()
+                        threadpool.stopJobs()
+
+                    # Retry or skip
+                    elif threadpool.suspended and self.resume():
+                        errorcount = 0
+                        ratelimitcount = 0
+
+                    # Continue, threads waiting for jobs are woken up
+                    elif not threadpool.suspended:
+                        adapted = threadpool.adaptThreads()
+                        if adapted or (jobsin > 0):
+                            threadpool.resumeJobs()
+
+                    # Finished with pending errors
+                    if not threadpool.suspended and not threadpool.hasJobs() and threadpool.hasErrorJobs():
+                        threadpool.suspendJobs()
+                        self.errorsPending(threadpool.getErrorJobsCount())
+
+                    # Finished
+                    if not threadpool.hasJobs():
+                        self.stopping()
+                        threadpool.stopJobs()
+
+                    # Wait for results, new jobs are added at least every interval
+                    self.wait()
+
+                except KeyboardInterrupt:
+                    self.logmessage("Cancelled, waiting for the threads to finish.")
+                    self.cancel()
+
+        finally:
+            self.writer.stop()
+            self.updateWritten()
+
+            # Keep the run for continuing if not all nodes were fetched
+            if self.jobqueue is not None:
+                self.jobqueue.finish(self.canceled or not finished)
+
+            # Reload child counts changed by the writer
+            self.database.session.expire_all()
+
+            stats['finished'] = min(stats['finished'], stats['nodes'])
+            stats['duration'] = time.time() - stats['started']
+            stats['reuse'] = self.apimodule.getConnectionReuse(self.connectionstats)
+            stats['cache'] = self.apimodule.getCacheHits(self.cachestats)
+            self.finish()
+
+        return stats
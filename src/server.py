@@ -1,5 +1,6 @@
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
+import jsoncodec
 import cgi
 from PySide2.QtCore import QObject, Signal, Slot
 from urllib.parse import urlparse, parse_qs, unquote
@@ -40,7 +41,7 @@ class RequestHandler(BaseHTTPRequestHandler):
         self.end_headers()
 
         if content is not None:
-            response = json.dumps(content)
+            response = jsoncodec.dumps(content)
             self.wfile.write(response.encode('utf-8'))
 
     def parseAction(self):
@@ -71,7 +72,7 @@ class RequestHandler(BaseHTTPRequestHandler):
 
             # Get post data
             length = int(self.headers.get('content-length'))
-            action['body'] = json.loads(self.rfile.read(length))
+            action['body'] = jsoncodec.loads(self.rfile.read(length))
 
         except Exception as e:
             action['error'] = str(e)
@@ -84,7 +85,7 @@ class RequestHandler(BaseHTTPRequestHandler):
         Get state
 
         The first component of the URL path is the snippet name.
-        Supported snippets are : settings, log
+        Supported snippets are : settings, log, database
         An empty snipped just returns the database name and the state
         """
 
@@ -110,7 +111,8 @@ class RequestHandler(BaseHTTPRequestHandler):
         try:
             action = self.parseAction()
 
-            # Open database
+            # Open database or set the database profile in the payload,
+            # e.g. {"profile": "performance", "cachesize": 64, "mmapsize": 256}
             if action['action'] == "database":
                 if action.get('filename') is not None:
                     if action['query'].get('create', False):
@@ -118,8 +120,11 @@ class RequestHandler(BaseHTTPRequestHandler):
                     else:
                         self.actionCallback('opendatabase', filename=action.get('filename'))
                     result = "ok"
+                elif action.get('body') is not None:
+                    self.actionCallback('databaseprofile', payload=action.get('body'))
+                    result = "ok"
                 else:
-                    result = "Missing filename."
+                    result = "Missing filename or profile."
 
             # Post nodes: csv file or nodes in the payload
             elif action['action'] == "nodes":
@@ -1,4 +1,5 @@
 import json
+import jsoncodec
 import os,sys,platform,time
 from base64 import b64encode
 from datetime import datetime
@@ -11,6 +12,7 @@ import urllib.parse
 import tldextract
 from collections import OrderedDict
 from collections import Mapping
+from functools import lru_cache
 from xmljson import BadgerFish
 import io
 import pyjsparser
@@ -36,40 +38,49 @@ def flattenList(items):
 
 def hasDictValue(data,multikey, piped=False):
     try:
-        multikey = multikey.split('|').pop(0) if piped else multikey
+        if not isinstance(multikey, KeyPath):
+            multikey = multikey.split('|').pop(0) if piped else multikey
+            multikey = compilePath(multikey)
 
-        keys=multikey.split('.',1)
+        return _hasPathValue(data, multikey.segments, 0)
 
-        if isinstance(data, Mapping) and keys[0] != '':
+    except Exception as e:
+        return False
+
+def _hasPathValue(data, segments, pos):
+    try:
+        key, index = segments[pos] if pos < len(segments) else ('', None)
+        rest = pos + 1
+
+        if isinstance(data, Mapping) and key != '':
 
-            if len(keys) > 1:
-                value = data.get(keys[0],"")
-                value = hasDictValue(value,keys[1])
+            if rest < len(segments):
+                value = data.get(key,"")
+                value = _hasPathValue(value, segments, rest)
             else:
-                value = keys[0] in data
+                value = key in data
 
-            if (not value) and (keys[0] == '*'):
-                if len(keys) == 1:
+            if (not value) and (key == '*'):
+                if rest == len(segments):
                     value = bool(data)
 
                 else:
-                    listkey = keys[1]
                     for elem in data:
-                        value = hasDictValue(data[elem], listkey)
+                        value = _hasPathValue(data[elem], segments, rest)
                         if value:
                             break
 
-        elif type(data) is list and keys[0] == '*':
-            if len(keys) > 1 and len(data) > 0:
+        elif type(data) is list and key == '*':
+            if rest < len(segments) and len(data) > 0:
                 value = data[0]
-                value = hasDictValue(value,keys[1])
+                value = _hasPathValue(value, segments, rest)
             else:
                 value = len(data) > 0
-        elif type(data) is list and keys[0].isnumeric():
-            no = int(keys[0])
-            if len(keys) > 1 and len(data) > no:
+        elif type(data) is list and key.isnumeric():
+            no = int(key)
+            if rest < len(segments) and len(data) > no:
                 value = data[no]
-                value = hasDictValue(value,keys[1])
+                value = _hasPathValue(value, segments, rest)
             else:
                 value = len(data) > no
 
@@ -167,122 +178,180 @@ def jsWalkValues(indict, pre=None):
                     for d in jsWalkValues(v, pre + [key] + [k]):
                         yield d
 
+def _modifierJs(selector):
+    # Input: list of strings.
+    # Output if dump==True: list of strings
+    # Output if dump==False: list of dict, list, string or number
+    selector = compilePath(selector)
+
+    def modifier(value, dump, folder):
+        items = []
+        for x in value:
+            try:
+                #x = x.replace('\\\\"', '\\"')
+
+                tree = pyjsparser.parse(x)
+                items += jsWalkValues(tree)
+            except Exception as e:
+                items.append({'error':str(e)})
+
+        items = [getDictValue(x, selector, dump=dump, default=[]) for x in items]
+
+        # Flatten list if not dumped
+        return flattenList(items) if not dump else items
+
+    return modifier
+
+def _modifierJson(selector):
+    # Input: list of strings.
+    # Output if dump==True: list of strings
+    # Output if dump==False: list of dict, list, string or number
+    selector = compilePath(selector)
+
+    def modifier(value, dump, folder):
+        items = [getDictValue(jsoncodec.loads(x), selector, dump=dump) for x in value]
+
+        # Flatten list if not dumped
+        return flattenList(items) if not dump else items
+
+    return modifier
+
+def _modifierNot(selector):
+    def modifier(value, dump, folder):
+        check = [x == selector for x in value]
+        return not any(check)
+
+    return modifier
+
+def _modifierIs(selector):
+    def modifier(value, dump, folder):
+        check = [x == selector for x in value]
+        return any(check)
+
+    return modifier
+
+def _modifierRe(selector):
+    # Input: list of strings.
+    # Output: list of strings
+    try:
+        selector = re.compile(selector)
+    except re.error:
+        # Invalid patterns fail when the modifier is applied
+        pass
+
+    def modifier(value, dump, folder):
+        items = [re.findall(selector,x) for x in value]
+
+        # Flatten (first group in match if re.findall returns multiple groups)
+        value = []
+        for matches in items:
+            for match in matches:
+                if (type(match) is tuple):
+                    value.append(match[0])
+                else:
+                    value.append(match)
+        return value
+
+    return modifier
+
+# Example: encode:utf-8
+def _modifierEncode(encoding):
+    # Input: list of strings.
+    # Output: list of strings
+    def modifier(value, dump, folder):
+        return [x.encode(encoding) for x in value]
+
+    return modifier
+
+def _modifierHtml(selector, type):
+    # Input: list of strings.
+    # Output: list of strings
+    def modifier(value, dump, folder):
+        value = [extractHtml(x, selector, type=type) for x in value]
+        return [y for x in value for y in x]
+
+    return modifier
+
+# Load file contents (using modifiers after a pipe symbol)
+def _modifierFile(value, dump, folder):
+    value = value[0]
+    with open(os.path.join(folder, value), 'rb') as file:
+        return file.read()
+
+def _modifierBase64(value, dump, folder):
+    value = value[0]
+    return b64encode(value.encode('utf-8')).decode('utf-8')
+
+def _modifierLength(value, dump, folder):
+    return len(value)
+
+def _modifierTimestamp(value, dump, folder):
+    return [datetime.utcfromtimestamp(float(x)).isoformat() for x in value]
+
+def _modifierShortdate(value, dump, folder):
+    return [str(datetime.strptime(x, '%a %b %d %H:%M:%S %z %Y')) for x in value]
+
+def _modifierNone(value, dump, folder):
+    return value
+
+def compileModifier(modifier):
+    """Resolve a pipeline step (e.g. css:div.main) to a callable
+    taking the value list, the dump flag and the folder
+    """
+    if modifier.startswith('js:'):
+        return _modifierJs(modifier[3:])
+    elif modifier.startswith('json:'):
+        return _modifierJson(modifier[5:])
+    elif modifier.startswith('not:'):
+        return _modifierNot(modifier[4:])
+    elif modifier.startswith('is:'):
+        return _modifierIs(modifier[3:])
+    elif modifier.startswith('re:'):
+        return _modifierRe(modifier[3:])
+    elif modifier.startswith('encode:'):
+        return _modifierEncode(modifier[7:])
+    elif modifier.startswith('css:'):
+        return _modifierHtml(modifier[4:], 'css')
+    elif modifier.startswith('xpath:'):
+        return _modifierHtml(modifier[6:], 'xpath')
+    elif modifier == 'file':
+        return _modifierFile
+    elif modifier == 'base64':
+        return _modifierBase64
+    elif modifier == 'length':
+        return _modifierLength
+    elif modifier == "timestamp":
+        return _modifierTimestamp
+    elif modifier == "shortdate":
+        return _modifierShortdate
+    else:
+        return _modifierNone
+
 def extractValue(data, key, dump=True, folder="", default=''):
     """Extract value from dict and pipe through modifiers
     :param data:
-    :param multikey:
+    :param key: key string or KeyPath returned by compileKey()
     :param dump:
     :return:
     """
     #global jsparser
     try:
         # Parse key
-        name, key, pipeline = parseKey(key)
+        if not isinstance(key, KeyPath):
+            key = compileKey(key)
 
         # Input: dict. Output: string, number, list or dict
-        value = getDictValue(data, key, dump, default)
-
-        for idx, modifier in enumerate(pipeline):
-            value = value if type(value) is list else [value]
-
-            if modifier.startswith('js:'):
-                # Input: list of strings.
-                # Output if dump==True: list of strings
-                # Output if dump==False: list of dict, list, string or number
-                selector = modifier[3:]
+        value = _getPathValue(data, key.segments, 0, dump, default)
+        return _pipeValue(value, key, dump, folder, default)
 
-                items = []
-                for x in value:
-                    try:
-                        #x = x.replace('\\\\"', '\\"')
-
-                        tree = pyjsparser.parse(x)
-                        items += jsWalkValues(tree)
-                    except Exception as e:
-                        items.append({'error':str(e)})
-
-                items = [getDictValue(x, selector, dump=dump, default=[]) for x in items]
+    except Exception as e:
+        return (None, default)
 
-                # Flatten list if not dumped
-                if not dump:
-                    value = flattenList(items)
-                else:
-                    value = items
-
-            elif modifier.startswith('json:'):
-                # Input: list of strings.
-                # Output if dump==True: list of strings
-                # Output if dump==False: list of dict, list, string or number
-                selector = modifier[5:]
-                items = [getDictValue(json.loads(x), selector, dump=dump) for x in value]
-
-                # Flatten list if not dumped
-                if not dump:
-                    value = flattenList(items)
-                else:
-                    value = items
-
-            elif modifier.startswith('not:'):
-                selector = modifier[4:]
-                check = [x == selector for x in value]
-                value = not any(check)
-
-            elif modifier.startswith('is:'):
-                selector = modifier[3:]
-                check = [x == selector for x in value]
-                value = any(check)
-
-            elif modifier.startswith('re:'):
-                # Input: list of strings.
-                # Output: list of strings
-                selector = modifier[3:]
-                items = [re.findall(selector,x) for x in value]
-
-                # Flatten (first group in match if re.findall returns multiple groups)
-                value = []
-                for matches in items:
-                    for match in matches:
-                        if (type(match) is tuple):
-                            value.append(match[0])
-                        else:
-                            value.append(match)
-
-            # Example: encode:utf-8
-            elif modifier.startswith('encode:'):
-                # Input: list of strings.
-                # Output: list of strings
-                encoding = modifier[7:]
-                value = [x.encode(encoding) for x in value]
-
-            elif modifier.startswith('css:'):
-                # Input: list of strings.
-                # Output: list of strings
-                selector = modifier[4:]
-                value = [extractHtml(x, selector, type='css') for x in value]
-                value = [y for x in value for y in x]
-            elif modifier.startswith('xpath:'):
-                # Input: list of strings.
-                # Output: list of strings
-                selector = modifier[6:]
-                value = [extractHtml(x, selector, type='xpath') for x in value]
-                value = [y for x in value for y in x]
-
-            # Load file contents (using modifiers after a pipe symbol)
-            elif modifier == 'file':
-                value = value[0]
-                with open(os.path.join(folder, value), 'rb') as file:
-                    value = file.read()
-
-            elif modifier == 'base64':
-                value = value[0]
-                value = b64encode(value.encode('utf-8')).decode('utf-8')
-
-            elif modifier == 'length':
-                value = len(value)
-            elif modifier == "timestamp":
-                value = [datetime.utcfromtimestamp(float(x)).isoformat() for x in value]
-            elif modifier == "shortdate":
-                value = [str(datetime.strptime(x, '%a %b %d %H:%M:%S %z %Y')) for x in value]
+def _pipeValue(value, key, dump, folder, default):
+    try:
+        for modifier in key.modifiers:
+            value = value if type(value) is list else [value]
+            value = modifier(value, dump, folder)
 
         # If modified in pipeline (otherwise already handled by getDictValue)...
         if dump and (type(value) is dict):
@@ -292,11 +361,83 @@ def extractValue(data, key, dump=True, folder="", default=''):
         elif dump and (isinstance(value, int)):
             value = str(value)
 
-        return (name, value)
+        return (key.name, value)
 
     except Exception as e:
         return (None, default)
 
+class KeyTrie(object):
+    """Prefix tree over the path segments of several keys,
+    see compileKeys() and extractValues()
+    """
+    __slots__ = ('keys', 'root')
+
+    def __init__(self, keys):
+        self.keys = tuple(key if isinstance(key, KeyPath) else compileKey(key) for key in keys)
+        self.root = _KeyTrieNode()
+
+        for no, key in enumerate(self.keys):
+            node = self.root
+            node.columns.append(no)
+            for segment in key.segments:
+                node = node.children.setdefault(segment, _KeyTrieNode())
+                node.columns.append(no)
+            node.final.append(no)
+
+    def __len__(self):
+        return len(self.keys)
+
+class _KeyTrieNode(object):
+    __slots__ = ('children', 'columns', 'final')
+
+    def __init__(self):
+        self.children = {}
+        self.columns = []  # All keys in the subtree
+        self.final = []  # Keys ending at this node
+
+def compileKeys(keys):
+    """Compile a list of keys (e.g. the custom columns) into a KeyTrie"""
+    return keys if isinstance(keys, KeyTrie) else KeyTrie(keys)
+
+def extractValues(data, keys, dump=True, folder="", default=''):
+    """Extract the values of several keys in one pass over the data.
+    Shared prefixes (e.g. snippet.title and snippet.description)
+    are only looked up once.
+
+    :param data:
+    :param keys: list of keys or KeyTrie returned by compileKeys()
+    :param dump:
+    :return: list of (name, value) tuples, same as extractValue() for each key
+    """
+    keys = compileKeys(keys)
+    values = [None] * len(keys)
+
+    # Input: dict. Output: string, number, list or dict
+    _walkTrie(data, keys.root, 0, keys.keys, values, dump, default)
+
+    return [_pipeValue(value, key, dump, folder, default) for key, value in zip(keys.keys, values)]
+
+def _walkTrie(data, node, pos, keys, values, dump, default):
+    for no in node.final:
+        values[no] = _getPathValue(data, keys[no].segments, pos, dump, default, 0)
+
+    for (key, index), child in node.children.items():
+        # Descend on plain lookups, everything else is resolved per key
+        try:
+            if key == '':
+                raise LookupError()
+            elif isinstance(data, Mapping):
+                value = data[key]
+            elif type(data) is list:
+                value = data[index]
+            else:
+                raise LookupError()
+        except:
+            for no in child.columns:
+                values[no] = _getPathValue(data, keys[no].segments, pos, dump, default, 0)
+        else:
+            _walkTrie(value, child, pos + 1, keys, values, dump, default)
+
 def findDictValues(data, multikey, dump=True, default=''):
     """
     Recursively searches for the multikey
@@ -380,71 +521,133 @@ def sliceData(data, headers=None, options={}):
 
     return data
 
+class KeyPath(object):
+    """Parsed key: the dotted path is split into segments once
+    and the modifiers of the pipeline are resolved to callables.
+    Use compileKey() or compilePath() to get cached instances.
+    """
+    __slots__ = ('key', 'name', 'path', 'segments', 'modifiers')
+
+    def __init__(self, path, name=None, pipeline=None, key=None):
+        self.key = path if key is None else key
+        self.name = name
+        self.path = path
+
+        # Tuples of segment and list index (None if not numeric)
+        self.segments = tuple((segment, _segmentIndex(segment)) for segment in path.split('.'))
+        self.modifiers = tuple(compileModifier(modifier) for modifier in (pipeline or []))
+
+    def __repr__(self):
+        return self.key
+
+def _segmentIndex(segment):
+    try:
+        return int(segment)
+    except ValueError:
+        return None
+
+# Number of parsed keys kept in memory
+KEYPATH_CACHESIZE = 4096
+
+@lru_cache(maxsize=KEYPATH_CACHESIZE)
+def compileKey(key):
+    """Parse a key including name and modifiers, e.g. title=snippet.title|re:[a-z]+"""
+    name, path, pipeline = parseKey(key)
+    return KeyPath(path, name, pipeline, key)
+
+@lru_cache(maxsize=KEYPATH_CACHESIZE)
+def compilePath(multikey):
+    """Parse a plain dotted path without name and modifiers, e.g. snippet.title"""
+    return KeyPath(multikey)
+
+def _dumpValue(value, dump):
+    if dump and (type(value) is dict):
+        value = json.dumps(value)
+    elif dump and (type(value) is list):
+        value = ";".join(value)
+    elif dump and (isinstance(value, int)):
+        value = str(value)
+    elif dump and (isinstance(value, float)):
+        value = str(value)
+
+    return value
+
 def getDictValue(data, multikey, dump=True, default=''):
     """Extract value from dict
     :param data:
-    :param multikey:
+    :param multikey: dotted path or KeyPath returned by compilePath()
     :param dump:
     :param default:
     :return:
     """
     try:
-        keys=multikey.split('.',1)
+        if not isinstance(multikey, KeyPath):
+            multikey = compilePath(multikey)
 
-        if isinstance(data, Mapping) and keys[0] != '':
-            try:
-                value=data[keys[0]]
-                if len(keys) > 1:
-                    value = getDictValue(value,keys[1],dump, default)
-            except:
-                if keys[0] == '*':
-                    listkey = keys[1] if len(keys) > 1 else ''
-                    value=[]
-                    for elem in data:
-                        value.append(getDictValue(data[elem],listkey,dump, default))
-                elif keys[0] == '**':
-                    listkey = keys[1] if len(keys) > 1 else ''
-                    value = findDictValues(data, listkey, dump, default)
-                else:
-                    value = default
+        return _getPathValue(data, multikey.segments, 0, dump, default)
 
-        elif type(data) is list and keys[0] != '':
-            try:
-                value=data[int(keys[0])]
-                if len(keys) > 1:
-                    value = getDictValue(value,keys[1],dump, default)
-            except:
-                if keys[0] == '**':
-                    listkey = keys[1] if len(keys) > 1 else ''
-                    value = findDictValues(data, listkey, dump, default)
+    except Exception as e:
+        return default
 
-                else:
-                    if keys[0] == '*':
-                        listkey = keys[1] if len(keys) > 1 else ''
-                    else:
-                        listkey = keys[0]
+def _getPathValue(data, segments, pos, dump, default, start=None):
+    """Walk along the segments starting at pos, branch on wildcards.
+    Provide start if the segments before pos were already resolved.
+    """
+    if (start is None) or (start == pos):
+        start = level = pos
+    else:
+        level = min(pos, len(segments) - 1)
 
-                    value=[]
-                    for elem in data:
-                        value.append(getDictValue(elem, listkey, dump, default))
+    try:
+        value = data
+        while pos < len(segments):
+            level = pos
+            key, index = segments[pos]
+            rest = pos + 1
+
+            if isinstance(value, Mapping) and key != '':
+                try:
+                    value = value[key]
+                except:
+                    if key == '*':
+                        value = [_getPathValue(value[elem], segments, rest, dump, default) for elem in value]
+                    elif key == '**':
+                        listkey = ".".join(segment for segment, index in segments[rest:])
+                        value = findDictValues(value, listkey, dump, default)
+                    else:
+                        value = default
+                    break
+
+            elif type(value) is list and key != '':
+                try:
+                    value = value[index]
+                except:
+                    if key == '**':
+                        listkey = ".".join(segment for segment, index in segments[rest:])
+                        value = findDictValues(value, listkey, dump, default)
+                    elif key == '*':
+                        value = [_getPathValue(elem, segments, rest, dump, default) for elem in value]
+                    else:
+                        value = [_getPathValue(elem, segments[pos:rest], 0, dump, default) for elem in value]
+                    break
 
-        elif keys[0] == '':
-            value = data
-        else:
-            value = default
+            elif key == '':
+                break
+            else:
+                value = default
+                break
 
-        if dump and (type(value) is dict):
-            value = json.dumps(value)
-        elif dump and (type(value) is list):
-            value = ";".join(value)
-        elif dump and (isinstance(value, int)):
-            value = str(value)
-        elif dump and (isinstance(value, float)):
-            value = str(value)
+            pos = rest
 
-        return value
+        return _dumpValue(value, dump)
 
     except Exception as e:
+        # Enclosing levels dump the default value
+        if level > start:
+            try:
+                return _dumpValue(default, dump)
+            except Exception:
+                pass
         return default
 
 def getDictValueOrNone(data, key, dump = True):
@@ -461,44 +664,54 @@ def getDictValueOrNone(data, key, dump = True):
 
 def filterDictValue(data, multikey, dump=True, piped=False):
     try:
-        multikey = multikey.split('|').pop(0) if piped else multikey
-        keys=multikey.split('.',1)
+        if not isinstance(multikey, KeyPath):
+            multikey = multikey.split('|').pop(0) if piped else multikey
+            multikey = compilePath(multikey)
+
+        value = _filterPathValue(data, multikey.segments, 0)
+
+        if dump and (type(value) is dict or type(value) is list):
+            return json.dumps(value)
+        else:
+            return value
+
+    except Exception as e:
+        return ""
+
+def _filterPathValue(data, segments, pos):
+    try:
+        key, index = segments[pos] if pos < len(segments) else ('', None)
+        rest = pos + 1
 
-        if isinstance(data, Mapping) and keys[0] != '':
-            value = { key: data[key] for key in list(data.keys()) if key != keys[0]}
-            if len(keys) > 1:
-                value[keys[0]] = filterDictValue(data[keys[0]],keys[1],False)
+        if isinstance(data, Mapping) and key != '':
+            value = { k: data[k] for k in list(data.keys()) if k != key}
+            if rest < len(segments):
+                value[key] = _filterPathValue(data[key], segments, rest)
             if not len(value):
                 value = None
 
-        elif type(data) is list and keys[0] != '':
+        elif type(data) is list and key != '':
             try:
                 value=data
-                if len(keys) > 1:
-                    value[int(keys[0])] = getDictValue(value[int(keys[0])],keys[1],False)
+                if rest < len(segments):
+                    value[index] = _getPathValue(value[index], segments, rest, False, '')
                 else:
-                    value[int(keys[0])] = ''
+                    value[index] = ''
             except:
-                if keys[0] == '*' and len(keys) > 1:
-                    listkey = keys[1]
-                elif keys[0] == '*':
-                    listkey = ''
+                if key == '*':
+                    listkey = segments[rest:]
                 else:
-                    listkey = keys[0]
+                    listkey = segments[pos:rest]
 
                 valuelist=[]
                 for elem in data:
-                    valuelist.append(filterDictValue(elem,listkey,False))
+                    valuelist.append(_filterPathValue(elem, listkey, 0))
                 value = valuelist
 
         else:
             value = ''
 
-
-        if dump and (type(value) is dict or type(value) is list):
-            return json.dumps(value)
-        else:
-            return value
+        return value
 
     except Exception as e:
         return ""
@@ -695,7 +908,7 @@ def xmlToJson(data):
     return data
 
 #' Create a new filename from an URL
-def makefilename(url = None, foldername=None, filename=None, fileext=None, appendtime=False):  # Create file name
+def makefilename(url = None, foldername=None, filename=None, fileext=None, appendtime=False, exists=os.path.isfile):  # Create file name
     url_filename, url_fileext = os.path.splitext(os.path.basename(url))
     if fileext is None:
         fileext = url_fileext
@@ -718,7 +931,7 @@ def makefilename(url = None, foldername=None, filename=None, fileext=None, appen
         newfilename += str(fileext)
         fullfilename = os.path.join(foldername, newfilename)
 
-        if (os.path.isfile(fullfilename)):
+        if exists(fullfilename):
             filenumber = filenumber + 1
         else:
             break
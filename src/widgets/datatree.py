@@ -1,7 +1,11 @@
 from PySide2.QtCore import *
 from PySide2.QtWidgets import *
 from database import *
+from sqlalchemy import tuple_
+from sqlalchemy.orm import defer
+import sys
 import json
+import jsoncodec
 from collections import defaultdict
 
 class DataTree(QTreeView):
@@ -49,7 +53,7 @@ class DataTree(QTreeView):
         
         model = self.model()
         parent = QModelIndex()
-        model.fetchMore(parent)
+        model.fetchAll(parent)
         row = model.rowCount(parent)-1
          
         index = model.index(row, 0, parent)
@@ -71,7 +75,9 @@ class DataTree(QTreeView):
         else:
             model = self.model()
             indexes = [idx for idx in indexes if idx.parent() == self.rootIndex()]
-            return len(indexes) == model.rootItem.childCount()
+
+            # Seeds that are not loaded yet are not selected
+            return len(indexes) == model.rootItem.childCountAll()
 
     def selectNext(self, conditions={}, progress=None):
         # Start with selected index or root index
@@ -112,12 +118,68 @@ class DataTree(QTreeView):
                 yield from self.model().getNextChildOrSelf(index, conditions, progress)
 
 
+def internValue(value):
+    """Share repeated strings like object types between tree items"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+class TreeItemData(Mapping):
+    """
+    Read-only dict view of a tree item.
+    Query parameters and response are loaded on access, see TreeModel.getItemResponse()
+    """
+    __slots__ = ('item',)
+
+    KEYS = ('level', 'childcount', 'objectid', 'objecttype', 'querystatus', 'querytime',
+            'querytype', 'queryparams', 'response')
+
+    def __init__(self, item):
+        self.item = item
+
+    def __getitem__(self, key):
+        item = self.item
+        if key == 'level':
+            return item.nodelevel
+        elif key == 'childcount':
+            return item._childcountall
+        elif key == 'objectid':
+            return item.objectid
+        elif key == 'objecttype':
+            return item.objecttype
+        elif key == 'querystatus':
+            return item.querystatus
+        elif key == 'querytime':
+            return item.querytime
+        elif key == 'querytype':
+            return item.querytype
+        elif key == 'queryparams':
+            return item.model.getItemResponse(item)[0]
+        elif key == 'response':
+            return item.model.getItemResponse(item)[1]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+
 class TreeItem(object):
+    """
+    Only the scalar columns are kept in memory,
+    use the data attribute to get a dict-like view including the response.
+    """
+    __slots__ = ('model', 'id', 'parentItem', 'childItems', 'loaded',
+                 '_childcountallloaded', '_childcountall', '_row', 'lastdata',
+                 'nodelevel', 'objectid', 'objecttype', 'objectkey',
+                 'querystatus', 'querytime', 'querytype')
+
     def __init__(self, model=None, parent=None, id=None, data=None):
         self.model = model
 
         self.id = id
-        self.data = data
+        self.setData(data)
 
         self.parentItem = parent
         self.childItems = []
@@ -126,10 +188,33 @@ class TreeItem(object):
         self._childcountallloaded = False
         self._childcountall = 0
         self._row = None
+        self.lastdata = None
 
         if parent is not None:
             parent.appendChild(self)
 
+    def setData(self, data):
+        """
+        Keep the scalar values of the item data, see TreeModel.getItemDataFromRecord()
+        """
+        if data is None:
+            self.nodelevel = None
+            self.objectid = None
+        else:
+            self.nodelevel = data.get('level')
+            self.objectid = data.get('objectid')
+            self.objecttype = internValue(data.get('objecttype'))
+            self.objectkey = data.get('objectkey')
+            self.querystatus = internValue(data.get('querystatus'))
+            self.querytime = data.get('querytime')
+            self.querytype = internValue(data.get('querytype'))
+
+    @property
+    def data(self):
+        if self.id is None:
+            return None
+        return TreeItemData(self)
+
     def appendChild(self, item, persistent=False):
         item.parentItem = self
         self.childItems.append(item)
@@ -202,10 +287,10 @@ class TreeItem(object):
             return None
 
     def level(self):
-        if self.data is None:
+        if self.id is None:
             return 0
         else:
-            return self.data['level']
+            return self.nodelevel
 
     def row(self):
         return self._row
@@ -222,49 +307,11 @@ class TreeItem(object):
         if not dbnode:
             return False
 
-        newnodes = []
-
-        def appendNode(objecttype, objectid, response, extractedkey=''):
-            new = Node(str(objectid), dbnode.id)
-            new.objecttype = objecttype
-            new.response = response
-
-            new.level = dbnode.level + 1
-            new.querystatus = options.get("querystatus", "")
-            new.querytime = str(options.get("querytime", ""))
-            new.querytype = options.get('querytype', '')
-
-            queryparams = {key : options.get(key,'') for key in  ['nodedata','basepath','resource']}
-            queryparams['nodedata'] = extractedkey
-            new.queryparams = queryparams
-
-            newnodes.append(new)
-
-        #empty records
-        if data['empty'] is not None:
-            appendNode('empty', dbnode.objectid, data['empty'])
+        parent = {'id': dbnode.id, 'objectid': dbnode.objectid, 'level': dbnode.level}
+        newnodes = getNodeRecords(parent, data, options)
+        if newnodes:
+            self.model.database.session.execute(Node.__table__.insert(), newnodes)
 
-        #extracted nodes
-        for k, n in data['nodes']:
-            # Extract Object ID or use parent id if no key present
-            o = options.get('objectid')
-            if o is not None:
-                o = extractValue(n, o, default=None)[1]
-            if o is None:
-                o = dbnode.objectid
-
-            objecttype = options.get('objecttype', 'data')
-            appendNode(objecttype, o, n, k)
-
-        #offcut
-        if data['offcut'] is not None:
-            appendNode('offcut', dbnode.objectid, data['offcut'])
-
-        #headers
-        if data['headers'] is not None:
-            appendNode('headers', dbnode.objectid, data['headers'])
-
-        self.model.database.session.add_all(newnodes)
         self._childcountall += len(newnodes)
         dbnode.childcount += len(newnodes)
 
@@ -276,7 +323,7 @@ class TreeItem(object):
         return (len(data['nodes']))
 
     def hasValues(self,filter = {}):
-        if self.data is None:
+        if self.id is None:
             return False
 
         for key, value in filter.items():
@@ -317,18 +364,26 @@ class TreeModel(QAbstractItemModel):
 
         self.database = database
         self.customcolumns = []
+        self.customkeys = compileKeys([])
         self.newnodes = 0
         self.nodecounter = 0
 
+        # Number of children loaded at once when scrolling
+        self.pagesize = 1000
+
         # Cache for prefetching data
         self.prefetching = False
         self.cache = defaultdict(defaultdict)
 
+        # Cache for query parameters and responses of tree items
+        self.responses = ResponseCache(2000)
+
         #Hidden root
         self.rootItem = TreeItem(self)
 
     def clear(self):
         self.cache.clear()
+        self.responses.clear()
         self.beginResetModel()
         try:
             self.rootItem.clear()
@@ -337,6 +392,7 @@ class TreeModel(QAbstractItemModel):
 
     def setCustomColumns(self,cols):
         self.customcolumns = cols
+        self.customkeys = compileKeys(cols)
         self.layoutChanged.emit()
 
     def deleteNode(self, index, delaycommit=False):
@@ -347,6 +403,7 @@ class TreeModel(QAbstractItemModel):
         item = index.internalPointer()
 
         Node.query.filter(Node.id == item.id).delete()
+        self.responses.clear()
         self.newnodes += 1
         self.commitNewNodes(delaycommit)
         item.remove(True)
@@ -375,7 +432,7 @@ class TreeModel(QAbstractItemModel):
                     nodedata = nodedata.split('|',1)
                     objectid = nodedata[0]
                     try:
-                        response = json.loads(nodedata[1]) if len(nodedata) > 1 else None
+                        response = jsoncodec.loads(nodedata[1]) if len(nodedata) > 1 else None
                     except Exception as e:
                         response = {'error':str(e)}
 
@@ -405,6 +462,28 @@ class TreeModel(QAbstractItemModel):
         if not delaycommit:
             self.layoutChanged.emit()
 
+    def nodesAppended(self, index, count, fetch=False):
+        """
+        Update the tree after nodes were written by the node writer.
+        Set fetch to True to insert the new rows, e.g. for expanded parents.
+        """
+        if not index.isValid() or not count:
+            return False
+
+        item = index.internalPointer()
+
+        # Not counted yet, the count will include the new nodes
+        if not item._childcountallloaded:
+            return True
+
+        loaded = item.childCount() >= item._childcountall
+        item._childcountall += count
+
+        if fetch and loaded:
+            self.fetchMore(index)
+        elif item._childcountall == count:
+            self.dataChanged.emit(index, index)
+
     def rowCount(self, parent=QModelIndex()):
         parentNode = self.getItemFromIndex(parent)
         return parentNode.childCount()
@@ -420,20 +499,20 @@ class TreeModel(QAbstractItemModel):
 
         if (role == Qt.DisplayRole) or (role == Qt.ToolTipRole):
             if index.column() == 0:
-                value = item.data.get('objectid','')
+                value = item.objectid
             elif index.column() == 1:
-                value = item.data.get('objecttype','')
+                value = item.objecttype
             elif index.column() == 2:
-                value = getDictValue(item.data.get('queryparams',''), 'nodedata')
+                value = item.objectkey
             elif index.column() == 3:
-                value = item.data.get('querystatus','')
+                value = item.querystatus
             elif index.column() == 4:
-                value = item.data.get('querytime','')
+                value = item.querytime
             elif index.column() == 5:
-                value = item.data.get('querytype','')
+                value = item.querytype
             else:
-                key = self.customcolumns[index.column() - 6]
-                value = extractValue(item.data.get('response',''), key)[1]
+                key = self.customkeys.keys[index.column() - 6]
+                value = extractValue(self.getItemResponse(item)[1], key)[1]
 
             if role == Qt.ToolTipRole:
                 return wraptip(value)
@@ -491,16 +570,16 @@ class TreeModel(QAbstractItemModel):
         node = index.internalPointer()
         row = [node.id,
                node.parentItem.id,
-               node.data['level'],
-               node.data['objectid'],
-               node.data['objecttype'],
-               getDictValue(node.data['queryparams'],'nodedata'),
-               node.data['querystatus'],
-               node.data['querytime'],
-               node.data['querytype']
+               node.nodelevel,
+               node.objectid,
+               node.objecttype,
+               node.objectkey,
+               node.querystatus,
+               node.querytime,
+               node.querytype
               ]
-        for key in self.customcolumns:
-            row.append(extractValue(node.data['response'],key)[1])
+        for name, value in extractValues(self.getItemResponse(node)[1], self.customkeys):
+            row.append(value)
         return row
 
     def hasChildren(self, index):
@@ -515,8 +594,8 @@ class TreeModel(QAbstractItemModel):
             return -1
 
         treeitem = index.internalPointer()
-        if treeitem.data is not None and treeitem.data['level'] is not None:
-            return treeitem.data['level']
+        if treeitem.nodelevel is not None:
+            return treeitem.nodelevel
         else:
             return 0
 
@@ -526,13 +605,66 @@ class TreeModel(QAbstractItemModel):
                     'childcount': item.childcount,
                     'objectid': item.objectid,
                     'objecttype': item.objecttype,
+                    'objectkey': getDictValue(item.queryparams, 'nodedata'),
                     'querystatus': item.querystatus,
                     'querytime': item.querytime,
-                    'querytype': item.querytype,
-                    'queryparams': item.queryparams,
-                    'response': item.response}
+                    'querytype': item.querytype}
         return itemdata
 
+    def getItemResponse(self, item):
+        """
+        Load query parameters and response of a tree item,
+        the decoded values are kept in a bounded LRU cache
+        """
+        value = self.responses.get(item.id)
+        if value is None:
+            record = self.database.session.query(Node.queryparams_raw, Node.response_raw).\
+                filter(Node.id == item.id).first()
+            if record is None:
+                return ({}, {})
+
+            queryparams = jsoncodec.loads(record[0]) if record[0] is not None else {}
+            response = jsoncodec.loads(record[1]) if record[1] is not None else {}
+            value = (queryparams, response)
+            self.responses.put(item.id, None, value)
+
+        return value
+
+    def getIndexById(self, id):
+        """
+        Get the index of a node if the node and all its ancestors are loaded,
+        otherwise return an invalid index. Nodes are not loaded by this method.
+        """
+        if (id is None) or not self.database.connected:
+            return QModelIndex()
+
+        ancestors = self.database.session.execute(
+            "WITH RECURSIVE ancestors(id, parent_id) AS ("
+            "SELECT id, parent_id FROM Nodes WHERE id = :id UNION ALL "
+            "SELECT Nodes.id, Nodes.parent_id FROM Nodes JOIN ancestors ON Nodes.id = ancestors.parent_id"
+            ") SELECT id FROM ancestors", {'id': id}).fetchall()
+
+        index = QModelIndex()
+        item = self.rootItem
+        for id, in reversed(ancestors):
+            # Children are ordered by id
+            children = item.childItems
+            low, high = 0, len(children)
+            while low < high:
+                middle = (low + high) // 2
+                if children[middle].id < id:
+                    low = middle + 1
+                else:
+                    high = middle
+
+            if (low == len(children)) or (children[low].id != id):
+                return QModelIndex()
+
+            item = children[low]
+            index = self.createIndex(low, 0, item)
+
+        return index
+
     def getItemFromIndex(self, index):
         """
           Get TreeItem for QModelIndex
@@ -589,7 +721,18 @@ class TreeModel(QAbstractItemModel):
                 self.hideprogress.emit()
 
     def getLastChildData(self, index, filter=None):
-        self.fetchMore(index)
+        """
+        Get the data of the last child matching the filter.
+        Queried from the database if possible, otherwise all children are loaded.
+        """
+        clauses = getFilterClauses(filter) if filter is not None else []
+        if clauses is not None:
+            parentItem = self.getItemFromIndex(index)
+            record = Node.query.filter(Node.parent_id == parentItem.id, *clauses).\
+                order_by(Node.id.desc()).first()
+            return getNodeData(record) if record is not None else None
+
+        self.fetchAll(index)
         row = self.rowCount(index)-1
 
         # Iterate all nodes backwards
@@ -597,7 +740,7 @@ class TreeModel(QAbstractItemModel):
             child = index.child(row, 0)
             if self.checkFilter(child, filter):
                 item = self.getItemFromIndex(child)
-                return item.data
+                return dict(item.data)
 
             row -= 1
         return None
@@ -610,31 +753,60 @@ class TreeModel(QAbstractItemModel):
         return item.childCountAll() > item.childCount()
 
     def fetchMore(self, index):
+        """
+        Load the next page of children. Children are ordered by id,
+        pages continue after the id of the last loaded child (keyset pagination).
+        In SQLite the index on parent_id includes the rowid,
+        it serves as composite index on (parent_id, id).
+        """
         parentItem = self.getItemFromIndex(index)
 
         # From cache (append, fetch, clear in one operation)
         #self.prefetch(index)
 
-        # Remaining
+        # Next page
         if parentItem.childCountAll() > parentItem.childCount():
-            row = parentItem.childCount()
-            items = Node.query.filter(Node.parent_id == parentItem.id).offset(row).all()
-            self.appendRecords(index, items)
+            lastid = parentItem.childItems[-1].id if parentItem.childCount() else 0
+            records = Node.query.options(defer(Node.response_raw)).\
+                filter(Node.parent_id == parentItem.id, Node.id > lastid).\
+                order_by(Node.id).limit(self.pagesize).all()
+
+            # Outdated count
+            if not records:
+                parentItem._childcountall = parentItem.childCount()
+                parentItem.loaded = True
+                return False
+
+            self.appendRecords(index, records)
+
+    def fetchAll(self, index):
+        """
+        Load all remaining children page by page
+        """
+        while self.canFetchMore(index):
+            if self.fetchMore(index) is False:
+                break
 
     def prefetch(self, parentIndex, chunk=1000):
         # Append from cache if possible
         self.appendFromCache(parentIndex)
 
-        # Get next chunks
+        # Get next chunks, continuing with the children of the following parents
         parentItem = self.getItemFromIndex(parentIndex)
         while parentItem.childCountAll() > parentItem.childCount():
-            row = parentItem.childCount()
             if parentItem.id is None:
-                records = Node.query.filter(Node.parent_id == parentItem.id).offset(row).all()
-            else:
-                missing = parentItem.childCountAll() - row
-                nextchunk = missing if missing > chunk else chunk
-                records = Node.query.filter(Node.parent_id >= parentItem.id).offset(row).limit(nextchunk).all()
+                self.fetchMore(parentIndex)
+                continue
+
+            lastid = parentItem.childItems[-1].id if parentItem.childCount() else 0
+            missing = parentItem.childCountAll() - parentItem.childCount()
+            nextchunk = missing if missing > chunk else chunk
+            records = Node.query.options(defer(Node.response_raw)).\
+                filter(tuple_(Node.parent_id, Node.id) > tuple_(parentItem.id, lastid)).\
+                order_by(Node.parent_id, Node.id).limit(nextchunk).all()
+
+            if not records:
+                break
 
             # Add to cache, grouped by parent_id and id to avoid duplicates
             for record in records:
@@ -686,18 +858,11 @@ class TreeModel(QAbstractItemModel):
 
         # Find last offcut or data node
         elif options.get('resume', False):
-            filter = {'querystatus': "fetched (200)", 'objecttype': ["data", "offcut", "empty"]}
-            treeitem.lastdata = self.getLastChildData(index, filter)
-
-            # Dont't fetch if already finished (=has offcut without next cursor)
-            if (treeitem.lastdata is not None):
-                response = getDictValueOrNone(treeitem.lastdata, 'response', dump=False)
-                cursor = getDictValueOrNone(response, options.get('key_paging'))
-                stopvalue = not extractValue(response, options.get('paging_stop'), dump=False, default=True)[1]
+            treeitem.lastdata = self.getLastChildData(index, RESUME_FILTER)
 
-                # Dont't fetch if already finished (=offcut without next cursor)
-                if (cursor is None) or stopvalue:
-                    return False
+            # Dont't fetch if already finished (=offcut without next cursor)
+            if (treeitem.lastdata is not None) and isPagingFinished(treeitem.lastdata, options):
+                return False
         else:
             treeitem.lastdata = None
 
@@ -738,6 +903,49 @@ class TreeModel(QAbstractItemModel):
 
         return True
 
+    def getFilterIds(self, filter=None, exact=True, maxcount=100000):
+        """
+        Query the nodes matching the filter and their ancestors.
+        Returns a dict with the ids of matching nodes ('match'), the ids of their
+        ancestors ('path') and the id of the last matching or ancestor child by
+        parent id ('lastchild'). Returns None if the filter can't be queried
+        in SQL or if more nodes than maxcount match.
+        """
+        if (filter is None) or not self.database.connected:
+            return None
+
+        clauses = getFilterClauses(filter, exact)
+        if clauses is None:
+            return None
+
+        records = self.database.session.query(Node.id, Node.parent_id).\
+            filter(*clauses).limit(maxcount + 1).all()
+        if len(records) > maxcount:
+            return None
+
+        ids = {'match': set(), 'path': set(), 'lastchild': {}}
+
+        def addRecords(records):
+            parents = set()
+            for id, parent_id in records:
+                ids['lastchild'][parent_id] = max(id, ids['lastchild'].get(parent_id, id))
+                if (parent_id is not None) and (parent_id not in ids['path']):
+                    parents.add(parent_id)
+            ids['path'].update(parents)
+            return list(parents)
+
+        ids['match'].update(id for id, parent_id in records)
+        parents = addRecords(records)
+
+        # Walk up to the seed nodes level by level
+        while parents:
+            chunk, parents = parents[:500], parents[500:]
+            records = self.database.session.query(Node.id, Node.parent_id).\
+                filter(Node.id.in_(chunk)).all()
+            parents.extend(addRecords(records))
+
+        return ids
+
     def getNextOrSelf(self, index, conditions={}, progress=None):
         """
         Yield next node matching the criteria
@@ -747,7 +955,7 @@ class TreeModel(QAbstractItemModel):
         parent = index.parent()
         row = index.row()
         row_start = row
-        row_end = self.rowCount(parent)-1
+        row_end = self.getItemFromIndex(parent).childCountAll()-1
         level = self.getLevel(index)
 
         recursive = conditions.get('recursive',True)
@@ -770,6 +978,8 @@ class TreeModel(QAbstractItemModel):
                 conditions['includeself'] = conditions.get('includeself',True) or (row > row_start)
                 conditions['persistent'] = False
                 yield from self.getNextChildOrSelf(child, conditions, progress)
+            elif self.canFetchMore(parent) and (self.fetchMore(parent) is not False):
+                continue
             else:
                 break
             row += 1
@@ -781,6 +991,10 @@ class TreeModel(QAbstractItemModel):
             parent = index.parent()
             row = index.row()
             nextindex = self.index(row+1,0,parent)
+
+            # The next sibling may not be loaded yet
+            if not nextindex.isValid() and self.canFetchMore(parent) and (self.fetchMore(parent) is not False):
+                nextindex = self.index(row+1,0,parent)
             index = parent
 
         if nextindex.isValid():
@@ -794,6 +1008,9 @@ class TreeModel(QAbstractItemModel):
 
         Default conditions are: filter=None, exact=True, options=None, includeself=True,
                                         persistent=False
+
+        Filters are queried in SQL once and stored in the conditions (filterids),
+        only the nodes on the path to matching nodes are visited.
         """
         # Self
         includeself = conditions.get('includeself', True)
@@ -801,7 +1018,17 @@ class TreeModel(QAbstractItemModel):
         options = conditions.get('options')
         exact = conditions.get('exact', True)
 
-        if includeself and self.checkFilter(index, filter, exact) and self.checkData(index, options):
+        if (filter is not None) and ('filterids' not in conditions):
+            conditions['filterids'] = self.getFilterIds(filter, exact)
+        filterids = conditions.get('filterids') if filter is not None else None
+
+        if filterids is not None:
+            item = self.getItemFromIndex(index)
+            matching = index.isValid() and (item.id in filterids['match'])
+        else:
+            matching = self.checkFilter(index, filter, exact)
+
+        if includeself and matching and self.checkData(index, options):
             if conditions.get('persistent'):
                 index_persistent = QPersistentModelIndex(index)
                 yield (index_persistent)
@@ -812,11 +1039,18 @@ class TreeModel(QAbstractItemModel):
         maxlevel = filter.get('level') if filter is not None else None
         level = self.getLevel(index)
 
+        if filterids is not None:
+            lastchild = filterids['lastchild'].get(self.getItemFromIndex(index).id)
+            if lastchild is None:
+                return
+        else:
+            lastchild = None
+
         if (maxlevel is None) or (maxlevel > level):
             self.fetchMore(index)
 
             if progress is not None:
-                row_end = self.rowCount(index) - 1
+                row_end = self.getItemFromIndex(index).childCountAll() - 1
 
             row = 0
             while True:
@@ -830,8 +1064,16 @@ class TreeModel(QAbstractItemModel):
                     child = index.child(row, 0)
 
                 if child.isValid():
-                    conditions['includeself'] = True
-                    yield from self.getNextChildOrSelf(child, conditions, progress)
+                    childid = child.internalPointer().id
+                    if (filterids is None) or (childid in filterids['match']) or (childid in filterids['path']):
+                        conditions['includeself'] = True
+                        yield from self.getNextChildOrSelf(child, conditions, progress)
+
+                    # Skip remaining children without matches
+                    if (lastchild is not None) and (childid >= lastchild):
+                        break
+                elif self.canFetchMore(index) and (self.fetchMore(index) is not False):
+                    continue
                 else:
                     break
                 row += 1
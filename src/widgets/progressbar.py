@@ -4,6 +4,8 @@ from PySide2.QtWidgets import *
 from datetime import timedelta
 
 class ProgressBar(QDialog):
+    # Emitted when the user cancels, skips or retries
+    changed = Signal()
 
     def __init__(self, mainmessage, parent=None, hidden=False):
         #Init dialog
@@ -133,7 +135,7 @@ class ProgressBar(QDialog):
         self.timeout = 0
         self.wasRetried = False
         self.wasResumed = True
-
+        self.changed.emit()
 
     def doretry(self):
         self.stopCountdown()
@@ -141,7 +143,7 @@ class ProgressBar(QDialog):
         self.timeout = 0
         self.wasRetried = True
         self.wasResumed = True
-
+        self.changed.emit()
 
     def cancel(self):
         '''
@@ -153,6 +155,7 @@ class ProgressBar(QDialog):
         self.wasCanceled = True
         self.cancelButton.setText("Please wait...")
         self.cancelButton.setDisabled(True)
+        self.changed.emit()
 
 
     def close(self):
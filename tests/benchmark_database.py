@@ -0,0 +1,114 @@
+"""
+Compare the SQLite profiles on a database file.
+
+- insert: nodes are added to the session and committed every 500 nodes,
+  like TreeModel.commitNewNodes() when nodes are added in the tree.
+- scan: all nodes are read like the export of all nodes.
+- fetch: the node writer inserts pages of nodes in its thread, like fetching
+  data, while the main thread loads children and responses like the tree.
+  The write rate and the latency of the reads are measured.
+
+Usage:
+$ python tests/benchmark_database.py [nodes]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from database import Database, Node, NodeWriter
+
+SEEDS = 100
+PAGE = 50
+
+def createNode(i):
+    node = Node(str(i))
+    node.objecttype = 'data'
+    node.querystatus = 'fetched (200)'
+    node.queryparams = {'nodedata': str(i)}
+    node.response = getResponse(i)
+    return node
+
+def getResponse(i):
+    return {'id': i, 'message': 'Lorem ipsum dolor sit amet ' * 20, 'likes': {'count': i}}
+
+def insert(database, count):
+    start = time.perf_counter()
+    for i in range(count):
+        database.session.add(createNode(i))
+        if i % 500 == 0:
+            database.session.commit()
+    database.session.commit()
+    return count / (time.perf_counter() - start)
+
+def scan(database):
+    count = 0
+    start = time.perf_counter()
+    for node in database.iterNodes():
+        node.getResponseValue('likes.count')
+        count += 1
+    return count / (time.perf_counter() - start)
+
+def fetch(database, count):
+    seeds = [node.id for node in database.session.query(Node).filter(Node.parent_id == None).order_by(Node.id).limit(SEEDS)]
+    options = {'objectid': 'id', 'querytype': 'benchmark', 'querystatus': 'fetched (200)'}
+
+    writer = NodeWriter(database.engine)
+    writer.start()
+
+    start = time.perf_counter()
+    for i in range(0, count, PAGE):
+        seed = seeds[(i // PAGE) % len(seeds)]
+        data = {'nodes': [('', getResponse(x)) for x in range(i, i + PAGE)], 'offcut': None, 'empty': None, 'headers': None}
+        writer.addNodes({'id': seed, 'objectid': str(seed), 'level': 0}, data, options)
+
+    # Read like the tree while the writer is busy
+    latencies = []
+    i = 0
+    while writer.input.qsize() > 0:
+        seed = seeds[i % len(seeds)]
+        i += 1
+
+        started = time.perf_counter()
+        children = database.session.query(Node.id, Node.objectid, Node.childcount).\
+            filter(Node.parent_id == seed).order_by(Node.id).limit(100).all()
+        if children:
+            database.session.query(Node.response_raw).filter(Node.id == children[-1][0]).scalar()
+        database.session.commit()
+        latencies.append(time.perf_counter() - started)
+
+        # The tree is updated between other events
+        time.sleep(0.01)
+
+    writer.stop()
+    rate = count / (time.perf_counter() - start)
+
+    latencies.sort()
+    if not latencies:
+        return rate, 0, 0
+    return rate, latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000
+
+def benchmark(profile, count):
+    with tempfile.TemporaryDirectory() as folder:
+        database = Database(None)
+        database.setProfile(profile)
+        database.connect(os.path.join(folder, 'benchmark.db'))
+        try:
+            insertrate = insert(database, count)
+            scanrate = scan(database)
+            fetchrate, median, maximum = fetch(database, count)
+        finally:
+            database.disconnect()
+
+    return insertrate, scanrate, fetchrate, median, maximum
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    for profile in ['default', 'performance']:
+        insertrate, scanrate, fetchrate, median, maximum = benchmark(profile, count)
+        print("{:<12} insert {:6.0f} nodes/s   scan {:6.0f} nodes/s   "
+              "fetch {:6.0f} nodes/s, reads {:5.1f} ms (max {:6.1f} ms)".format(
+            profile, insertrate, scanrate, fetchrate, median, maximum))
@@ -0,0 +1,69 @@
+"""
+Compare the JSON codecs on the responses stored in a Facepager database.
+
+Usage:
+$ python tests/benchmark_jsoncodec.py path/to/database.db [limit]
+
+JSON files (e.g. the API specifications in the apis folder) can be passed
+instead of a database.
+"""
+
+import os
+import sys
+import sqlite3
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import jsoncodec
+
+def loadResponses(filename, limit=10000):
+    if filename.endswith('.json'):
+        with open(filename, 'r', encoding='utf-8') as input:
+            return [input.read()]
+
+    connection = sqlite3.connect(filename)
+    try:
+        cursor = connection.execute("SELECT response FROM Nodes WHERE response IS NOT NULL LIMIT ?", (limit,))
+        return [row[0] for row in cursor]
+    finally:
+        connection.close()
+
+def benchmark(responses, repeat=5):
+    results = {}
+    for codec in jsoncodec.availableCodecs()[1:]:
+        jsoncodec.setCodec(codec)
+
+        start = time.perf_counter()
+        for i in range(repeat):
+            values = [jsoncodec.loads(raw) for raw in responses]
+        loadtime = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        for i in range(repeat):
+            for value in values:
+                jsoncodec.dumps(value)
+        dumptime = (time.perf_counter() - start) / repeat
+
+        results[codec] = (loadtime, dumptime)
+
+    jsoncodec.setCodec()
+    return results
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    limit = int(sys.argv[-1]) if sys.argv[-1].isdigit() else 10000
+    responses = []
+    for filename in [x for x in sys.argv[1:] if not x.isdigit()]:
+        responses.extend(loadResponses(filename, limit))
+
+    size = sum(len(raw) for raw in responses) / 1024 / 1024
+    print("{} responses, {:.1f} MB".format(len(responses), size))
+
+    results = benchmark(responses)
+    baseline = results['json']
+    for codec, (loadtime, dumptime) in results.items():
+        print("{:<8} loads {:8.1f} ms ({:4.1f}x)   dumps {:8.1f} ms ({:4.1f}x)".format(
+            codec, loadtime * 1000, baseline[0] / loadtime, dumptime * 1000, baseline[1] / dumptime))
@@ -0,0 +1,69 @@
+from unittest import TestCase
+import threading
+from apimodules import ApiTab
+
+class Tab(object):
+    """
+    Session handling of ApiTab without the widgets
+    """
+    initSession = ApiTab.initSession
+    initConnectionPool = ApiTab.initConnectionPool
+    resetConnectionPool = ApiTab.resetConnectionPool
+    closeSession = ApiTab.closeSession
+    countConnection = ApiTab.countConnection
+    getProxies = ApiTab.getProxies
+    canSendAsync = ApiTab.canSendAsync
+
+    def __init__(self, proxies=''):
+        self.lock_session = threading.RLock()
+        self.lock_stats = threading.Lock()
+        self.connectionstats = {'requests': 0, 'connections': 0}
+        self.sessions = []
+        self.adapter = None
+        self.proxyEdit = ProxyEdit(proxies)
+
+class ProxyEdit(object):
+    def __init__(self, value):
+        self.value = value
+
+    def text(self):
+        return self.value
+
+class Test_ApiTab(TestCase):
+
+    def test_sessions(self):
+        tab = Tab()
+        session = tab.initSession(1)
+        self.assertIs(tab.initSession(1), session)
+        adapter = tab.adapter
+
+        # Sessions are created again with a new adapter after a reset
+        tab.resetConnectionPool()
+        self.assertEqual(tab.sessions, [None, None])
+        session = tab.initSession(2)
+        self.assertIsNot(tab.adapter, adapter)
+        self.assertIs(session.get_adapter('https://example.com'), tab.adapter)
+
+    def test_proxies(self):
+        tab = Tab('127.0.0.1:8080')
+        tab.initSession(0)
+        adapter = tab.adapter
+
+        # Loading the same proxies keeps the pool
+        tab.getProxies(True)
+        self.assertIs(tab.adapter, adapter)
+
+        tab.proxyEdit.value = '127.0.0.1:8081'
+        tab.getProxies(True)
+        self.assertIsNone(tab.adapter)
+        self.assertEqual(tab.initSession(0).proxies, {'http': '127.0.0.1:8081', 'https': '127.0.0.1:8081'})
+
+    def test_async(self):
+        tab = Tab()
+        self.assertTrue(tab.canSendAsync('https://example.com'))
+        self.assertFalse(tab.canSendAsync('https://example.com', True))
+        self.assertFalse(tab.canSendAsync('file:///tmp/file.json'))
+
+        # Cookies of the session jar are only sent by the session
+        tab.initSession(0).cookies.set('session', 'secret')
+        self.assertFalse(tab.canSendAsync('https://example.com'))
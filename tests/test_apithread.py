@@ -0,0 +1,89 @@
+from unittest import TestCase
+import threading
+from apithread import ApiThreadPool, ConcurrencyController
+
+class StubModule(object):
+    def fetchData(self, nodedata, options, logData, logMessage, logProgress):
+        options['querystatus'] = 'fetched (200)'
+        logData({'id': nodedata['objectid']}, options, {})
+
+    def disconnectSocket(self):
+        pass
+
+class Test_ApiThreadPool(TestCase):
+
+    def test_notify(self):
+        threadpool = ApiThreadPool(StubModule())
+        notified = threading.Semaphore(0)
+        threadpool.setNotify(notified.release)
+
+        for number in range(50):
+            threadpool.addJob({'nodeid': number, 'nodedata': {'objectid': number},
+                               'options': {'nodedata': None, 'objectid': 'id'}})
+        threadpool.applyJobs()
+        threadpool.spawnThreads(4)
+
+        results = 0
+        finished = False
+        while not finished:
+            self.assertTrue(threadpool.waitForJobs(1))
+            for job in threadpool.getJobs():
+                if job is None:
+                    finished = True
+                elif 'data' in job:
+                    results += 1
+            if not threadpool.hasJobs():
+                threadpool.stopJobs()
+
+        self.assertEqual(results, 50)
+
+        # One notification until the results were taken
+        self.assertTrue(notified.acquire(False))
+        self.assertFalse(threadpool.hasResults())
+
+class Test_ConcurrencyController(TestCase):
+
+    def respond(self, controller, count, latency=0.1, status='fetched (200)', waiting=100):
+        for x in range(count):
+            controller.addResponse(latency, status)
+        controller.checkat = 0
+        return controller.adapt(waiting)
+
+    def test_slowstart(self):
+        controller = ConcurrencyController(10)
+        threads = []
+        for x in range(5):
+            self.respond(controller, 10)
+            threads.append(controller.threads)
+        self.assertEqual(threads, [2, 4, 8, 10, 10])
+
+    def test_congestion(self):
+        controller = ConcurrencyController(20)
+        for x in range(3):
+            self.respond(controller, 10)
+        self.assertEqual(controller.threads, 8)
+
+        # Halve on rate limits, then increase by one
+        controller.addResponse(0.1, 'fetched (429)')
+        msg = self.respond(controller, 10)
+        self.assertEqual(controller.threads, 4)
+        self.assertIn('congestion', msg)
+        self.respond(controller, 10)
+        self.assertEqual(controller.threads, 5)
+
+        # Halve on rising latency
+        self.respond(controller, 10, latency=0.5)
+        self.assertEqual(controller.threads, 2)
+
+        # Server errors
+        self.respond(controller, 10, status='request error')
+        self.assertEqual(controller.threads, 1)
+
+    def test_waiting(self):
+        controller = ConcurrencyController(10)
+        self.assertIsNone(self.respond(controller, 10, waiting=1))
+        self.assertEqual(controller.threads, 1)
+
+        # Too few responses
+        self.assertIsNone(self.respond(controller, 2))
+        self.assertEqual(controller.threads, 1)
@@ -0,0 +1,134 @@
+from unittest import TestCase, skipIf
+import asyncio
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from apithread import ApiThreadPool
+from asyncthread import AsyncApiThreadPool, OUTPUT_SIZE, httpx
+import requests
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps({'items': [{'id': self.path.strip('/')}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class StubModule(object):
+    def __init__(self, baseurl):
+        self.baseurl = baseurl
+
+    def fetchData(self, nodedata, options, logData, logMessage, logProgress):
+        response = requests.get(self.baseurl + nodedata['objectid'])
+        options['querystatus'] = 'fetched ({})'.format(response.status_code)
+        logData(response.json(), options, {})
+
+    async def fetchDataAsync(self, nodedata, options, logData, logMessage, logProgress, client):
+        response = await client.get(self.baseurl + nodedata['objectid'])
+        options['querystatus'] = 'fetched ({})'.format(response.status_code)
+        logData(response.json(), options, {})
+
+    def disconnectSocket(self):
+        pass
+
+    def getProxies(self):
+        return {}
+
+class SlowModule(StubModule):
+    """
+    Log progress and data for each page while the requests are waiting
+    """
+    def __init__(self):
+        self.started = 0
+
+    async def fetchDataAsync(self, nodedata, options, logData, logMessage, logProgress, client):
+        self.started += 1
+        for page in range(3):
+            logProgress({'page': page})
+            options['querystatus'] = 'fetched (200)'
+            logData({'items': [{'id': nodedata['objectid']}]}, options, {})
+            await asyncio.sleep(0.1)
+
+@skipIf(httpx is None, "httpx is not installed")
+class Test_AsyncThread(TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.module = StubModule('http://127.0.0.1:{}/'.format(self.server.server_port))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fetch(self, threadpool):
+        for number in range(20):
+            threadpool.addJob({'nodeid': number, 'nodedata': {'objectid': 'node' + str(number)},
+                               'options': {'nodedata': 'items', 'objectid': 'id'}})
+        threadpool.applyJobs()
+        threadpool.spawnThreads(2)
+
+        output = []
+        finished = False
+        while not finished:
+            threadpool.waitForJobs(1)
+            for job in threadpool.getJobs():
+                if job is None:
+                    finished = True
+                elif 'data' in job:
+                    output.append(job)
+
+            if not threadpool.hasJobs():
+                threadpool.stopJobs()
+
+        return sorted(output, key=lambda job: job['nodeid'])
+
+    def test_output(self):
+        expected = self.fetch(ApiThreadPool(self.module))
+        output = self.fetch(AsyncApiThreadPool(self.module, 5))
+
+        self.assertEqual(len(output), 20)
+        self.assertEqual(output, expected)
+        self.assertEqual(output[3]['data']['nodes'], [('items.*', {'id': 'node3'})])
+
+    def test_slow_consumer(self):
+        threadpool = AsyncApiThreadPool(SlowModule(), 500)
+        for number in range(500):
+            threadpool.addJob({'nodeid': number, 'nodedata': {'objectid': 'node' + str(number)},
+                               'options': {'nodedata': 'items', 'objectid': 'id'}})
+        threadpool.applyJobs()
+        threadpool.spawnThreads()
+
+        output = []
+        finished = False
+        try:
+            # Results are not taken from the output queue yet, the loop keeps running
+            time.sleep(0.5)
+            self.assertGreater(threadpool.output.qsize(), OUTPUT_SIZE)
+            ping = asyncio.run_coroutine_threadsafe(asyncio.sleep(0), threadpool.loop)
+            ping.result(1)
+
+            while not finished:
+                for job in threadpool.getJobs(10):
+                    if job is None:
+                        finished = True
+                    elif 'data' in job:
+                        output.append(job)
+
+                if not threadpool.hasJobs():
+                    threadpool.stopJobs()
+                time.sleep(0.001)
+        finally:
+            if not finished:
+                threadpool.stopJobs()
+                while threadpool.thread.is_alive():
+                    threadpool.getJobs()
+                    threadpool.thread.join(0.1)
+
+        self.assertEqual(len(output), 1500)
@@ -0,0 +1,72 @@
+from unittest import TestCase
+import os
+import tempfile
+from database import Database, Node, NodeQueue, NodeWriter, JobQueue, Job
+
+class Test_JobQueue(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.database = Database(None)
+        self.database.connect(os.path.join(self.folder.name, 'test.db'))
+        self.database.session.add_all([Node(str(number)) for number in range(5)])
+        self.database.session.commit()
+        self.options = {'nodelevel': 1, 'nodedata': None, 'objectid': 'id', 'threads': 1}
+
+    def tearDown(self):
+        self.database.disconnect()
+        self.folder.cleanup()
+
+    def getJobQueue(self):
+        session = self.database.session
+        jobqueue = JobQueue.findRun(session, 'Generic', self.options)
+        if jobqueue is None:
+            jobqueue = JobQueue.createRun(session, 'Generic', self.options, NodeQueue(session, 0, [], self.options))
+        return jobqueue
+
+    def fetch(self, jobqueue, writer, node, pages):
+        for page in pages:
+            job = {'nodeid': node['id'], 'data': {'nodes': [('', {'id': page})], 'offcut': None, 'empty': None,
+                                                  'headers': None},
+                   'paging': {'currentpage': page, 'params': {'page': page}}}
+            parent = {'id': node['id'], 'objectid': node['data']['objectid'], 'level': 0}
+            writer.addNodes(parent, job['data'], {'objectid': 'id'}, job=jobqueue.getPageState(job, True))
+
+    def test_resume(self):
+        jobqueue = self.getJobQueue()
+        self.assertEqual(len(jobqueue), 5)
+
+        # Interrupted after two finished nodes and two pages of the third node
+        writer = NodeWriter(self.database.engine)
+        writer.start()
+        nodes = list(jobqueue)
+        for node in nodes[:2]:
+            self.fetch(jobqueue, writer, node, range(3))
+            writer.updateJob(jobqueue.getFinalState({'nodeid': node['id'], 'finished': True}))
+        self.fetch(jobqueue, writer, nodes[2], range(2))
+        writer.stop()
+
+        # The run continues with the cursor of the third node
+        jobqueue = self.getJobQueue()
+        self.assertEqual(len(jobqueue), 3)
+        nodes = list(jobqueue)
+        self.assertEqual(nodes[0]['lastdata'], {'response': {'id': 1}, 'currentpage': 1, 'params': {'page': 1}})
+        self.assertIsNone(nodes[1]['lastdata'])
+
+        # Only failed jobs are kept when the run is finished
+        writer = NodeWriter(self.database.engine)
+        writer.start()
+        for node in nodes:
+            writer.updateJob(jobqueue.getFinalState({'nodeid': node['id'], 'finished': node is not nodes[2]}))
+        writer.stop()
+        jobqueue.finish()
+
+        self.assertIsNone(JobQueue.findRun(self.database.session, 'Generic', self.options))
+        self.assertEqual([job.status for job in self.database.session.query(Job)], ['failed'])
+
+    def test_key(self):
+        # Speed and threads don't change the fetched data
+        key = JobQueue.getKey('Generic', self.options)
+        self.assertEqual(key, JobQueue.getKey('Generic', dict(self.options, threads=4, speed=100)))
+        self.assertNotEqual(key, JobQueue.getKey('Generic', dict(self.options, nodedata='items')))
+        self.assertNotEqual(key, JobQueue.getKey('Facebook', self.options))
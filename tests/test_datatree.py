@@ -0,0 +1,85 @@
+from unittest import TestCase
+import os
+import tempfile
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PySide2.QtCore import QModelIndex, QItemSelection, QItemSelectionModel
+from PySide2.QtWidgets import QApplication
+from database import Database, Node
+from widgets.datatree import DataTree
+
+class Test_TreeModel(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.database = Database(None)
+        self.database.connect(os.path.join(self.folder.name, 'test.db'))
+
+        # More children and seeds than loaded in one page
+        seed = Node('a')
+        seed.childcount = 1500
+        self.database.session.add(seed)
+        self.database.session.flush()
+        children = []
+        for number in range(1500):
+            child = Node('c' + str(number), seed.id)
+            child.level = 1
+            children.append(child)
+        self.database.session.add_all(children)
+        self.database.session.add_all([Node('s' + str(number)) for number in range(1500)])
+        self.database.session.commit()
+
+        self.tree = DataTree()
+        self.tree.loadData(self.database)
+        self.model = self.tree.treemodel
+        self.model.fetchMore(QModelIndex())
+
+    def tearDown(self):
+        self.database.disconnect()
+        self.folder.cleanup()
+
+    def test_next_sibling(self):
+        seed = self.model.index(0, 0, QModelIndex())
+        self.model.fetchMore(seed)
+        self.assertEqual(self.model.rowCount(seed), 1000)
+
+        # Siblings beyond the loaded page
+        start = self.model.index(0, 0, seed)
+        found = next(self.model.getNextOrSelf(start, {'filter': {'objectid': 'c1200'}, 'includeself': False}))
+        self.assertEqual(found.internalPointer().objectid, 'c1200')
+
+    def test_next_parent(self):
+        self.assertEqual(self.model.rowCount(QModelIndex()), 1000)
+
+        # The last loaded seed at row 999 has a child
+        seed = self.model.index(999, 0, QModelIndex())
+        child = Node('child', seed.internalPointer().id)
+        child.level = 1
+        self.database.session.add(child)
+        self.database.session.commit()
+        seed.internalPointer()._childcountall = 1
+        self.model.fetchMore(seed)
+
+        # The next seed after the child is not loaded yet
+        start = self.model.index(0, 0, seed)
+        found = next(self.model.getNextOrSelf(start, {'includeself': False}))
+        self.assertEqual(found.internalPointer().objectid, 's999')
+
+    def test_all_selected(self):
+        first = self.model.index(0, 0, QModelIndex())
+        last = self.model.index(self.model.rowCount(QModelIndex()) - 1, 0, QModelIndex())
+        selection = QItemSelection(first, last)
+        self.tree.selectionModel().select(selection, QItemSelectionModel.Select | QItemSelectionModel.Rows)
+
+        # Seeds that are not loaded are not selected
+        self.assertFalse(self.tree.noneOrAllSelected())
+
+        self.model.fetchAll(QModelIndex())
+        last = self.model.index(self.model.rowCount(QModelIndex()) - 1, 0, QModelIndex())
+        self.tree.selectionModel().select(QItemSelection(first, last), QItemSelectionModel.Select | QItemSelectionModel.Rows)
+        self.assertTrue(self.tree.noneOrAllSelected())
@@ -0,0 +1,140 @@
+from unittest import TestCase
+import os
+import re
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+import downloader
+from downloader import FileDownload, DownloadError, reserveFilename
+from utilities import makefilename
+
+BODY = bytes(range(256)) * 4096
+
+class RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    ranges = []
+    acceptranges = True
+    etag = True
+
+    def do_GET(self):
+        start, end = 0, len(BODY)
+        match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if match and self.acceptranges:
+            start, end = int(match.group(1)), int(match.group(2)) + 1
+            self.ranges.append((start, end))
+            self.send_response(206)
+        else:
+            self.send_response(200)
+
+        self.send_header('Accept-Ranges', 'bytes')
+        if self.etag:
+            self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(end - start))
+        self.end_headers()
+        try:
+            self.wfile.write(BODY[start:end])
+        except ConnectionError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+class Test_FileDownload(TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/file'.format(self.server.server_port)
+        self.folder = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.folder.name, 'file.bin')
+        self.session = requests.Session()
+
+        self.defaults = (downloader.CHUNK_SIZE, downloader.SEGMENT_SIZE)
+        downloader.CHUNK_SIZE, downloader.SEGMENT_SIZE = 64 * 1024, 256 * 1024
+        RangeHandler.ranges = []
+        RangeHandler.acceptranges = True
+        RangeHandler.etag = True
+
+    def tearDown(self):
+        downloader.CHUNK_SIZE, downloader.SEGMENT_SIZE = self.defaults
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.folder.cleanup()
+
+    def download(self, connected=None):
+        response = self.session.get(self.url, stream=True)
+        return FileDownload(self.session, response, self.filename, connected=connected).run()
+
+    def test_segments(self):
+        self.download()
+        with open(self.filename, 'rb') as file:
+            self.assertEqual(file.read(), BODY)
+
+        # The first segment is read from the first response
+        self.assertEqual(sorted(RangeHandler.ranges), [(262144, 524288), (524288, 786432), (786432, 1048576)])
+
+    def test_resume(self):
+        chunks = iter(range(6))
+        with self.assertRaises(DownloadError):
+            self.download(lambda: next(chunks, None) is not None)
+        self.assertTrue(os.path.isfile(self.filename + '.part.json'))
+
+        # Only the missing bytes are requested
+        RangeHandler.ranges = []
+        self.download()
+        with open(self.filename, 'rb') as file:
+            self.assertEqual(file.read(), BODY)
+        self.assertFalse(os.path.exists(self.filename + '.part'))
+        self.assertLess(sum(end - start for start, end in RangeHandler.ranges), len(BODY))
+
+    def test_validator(self):
+        RangeHandler.etag = False
+        chunks = iter(range(6))
+        with self.assertRaises(DownloadError):
+            self.download(lambda: next(chunks, None) is not None)
+
+        # Without ETag or Last-Modified the download starts again
+        self.assertFalse(os.path.exists(self.filename + '.part'))
+        self.assertFalse(os.path.exists(self.filename + '.part.json'))
+
+        self.download()
+        with open(self.filename, 'rb') as file:
+            self.assertEqual(file.read(), BODY)
+        self.assertEqual(min(start for start, end in RangeHandler.ranges[-3:]), 262144)
+
+    def test_state(self):
+        calls = []
+        response = self.session.get(self.url, stream=True)
+        download = FileDownload(self.session, response, self.filename)
+        saveState = download.saveState
+
+        def countState(force=False):
+            saveState(force)
+            calls.append(download.saved)
+
+        download.saveState = countState
+        download.run()
+
+        # Saved at the start and after each segment, the chunks in between are throttled
+        self.assertEqual(len(calls), 5 + len(BODY) // downloader.CHUNK_SIZE)
+        self.assertEqual(len(set(calls)), 5)
+        self.assertFalse(os.path.exists(self.filename + '.part.json'))
+
+    def test_fallback(self):
+        # The server advertises ranges but sends the complete file
+        RangeHandler.acceptranges = False
+        self.download()
+        with open(self.filename, 'rb') as file:
+            self.assertEqual(file.read(), BODY)
+
+    def test_reserve(self):
+        make = lambda exists: makefilename('https://example.com/file.bin', self.folder.name, 'file', exists=exists)
+        first = reserveFilename(make)
+        self.assertNotEqual(reserveFilename(make), first)
+
+        # Released after the download
+        response = self.session.get(self.url, stream=True)
+        FileDownload(self.session, response, first).run()
+        self.assertEqual(reserveFilename(make), os.path.join(self.folder.name, 'file-2.bin'))
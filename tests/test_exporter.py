@@ -0,0 +1,123 @@
+from unittest import TestCase, skipIf
+import os
+import json
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import exporter
+from exporter import splitIdRange, createWriter
+from database import Database, Node
+
+class Test_Exporter(TestCase):
+
+    def test_split_id_range(self):
+        shards = splitIdRange(1, 10, 3)
+        self.assertEqual(shards, [(0, 4), (4, 8), (8, 10)])
+        self.assertEqual(splitIdRange(None, None, 3), [])
+
+    def test_export_shards(self):
+        folder = tempfile.TemporaryDirectory()
+        database = Database(None)
+        try:
+            filename = os.path.join(folder.name, 'test.db')
+            database.connect(filename)
+            for number in range(50):
+                node = Node(str(number))
+                node.response = {'text': 'line\nbreak {}'.format(number), 'value': number / 3}
+                database.session.add(node)
+            database.session.commit()
+
+            customcolumns = ['text', 'value']
+            minid, maxid = exporter.getIdRange(filename)
+
+            # Sequential export
+            sequential = os.path.join(folder.name, 'sequential.csv')
+            writer = createWriter('csv', sequential, None)
+            connection = exporter.connectReadOnly(filename)
+            customkeys = exporter.compileKeys(customcolumns)
+            for record in exporter.iterRecords(connection, minid - 1, maxid):
+                writer.writeRow(exporter.getRow(record, customkeys))
+            writer.close()
+            connection.close()
+
+            # Shards in worker processes, merged in id order
+            merged = os.path.join(folder.name, 'merged.csv')
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=2, mp_context=context) as executor:
+                futures = [executor.submit(exporter.exportShard, filename, shard, customcolumns, ';', True)
+                           for shard in splitIdRange(minid, maxid, 7)]
+
+                count = 0
+                with open(merged, 'w', newline='', encoding='utf8') as output:
+                    for future in futures:
+                        tempname, shardcount = future.result()
+                        with open(tempname, 'r', newline='', encoding='utf8') as shardfile:
+                            output.write(shardfile.read())
+                        exporter.removeShard(future)
+                        self.assertFalse(os.path.exists(tempname))
+                        count += shardcount
+
+            self.assertEqual(count, 50)
+            with open(sequential, 'rb') as expected, open(merged, 'rb') as actual:
+                self.assertEqual(actual.read(), expected.read())
+        finally:
+            database.disconnect()
+            folder.cleanup()
+
+    def test_jsonlines_writer(self):
+        handle, filename = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        try:
+            writer = createWriter('jsonl', filename, ['id', 'object_id'])
+            writer.writeRow([1, 'a'], '{"text": "smartidea"}')
+            writer.writeRow([2, 'b'])
+            writer.close()
+
+            with open(filename, encoding='utf8') as input:
+                lines = [json.loads(line) for line in input]
+            self.assertEqual(lines[0], {'id': 1, 'object_id': 'a', 'response': {'text': 'smartidea'}})
+            self.assertEqual(lines[1], {'id': 2, 'object_id': 'b'})
+        finally:
+            os.remove(filename)
+
+    def test_jsonlines_names(self):
+        handle, filename = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        try:
+            # Custom columns named like other columns or the response are renamed
+            writer = createWriter('jsonl', filename, ['id', 'id', 'response'])
+            writer.writeRow([1, 'a', 'b'], '{"text": "smartidea"}')
+            writer.close()
+
+            with open(filename, encoding='utf8') as input:
+                line = input.readline()
+            self.assertEqual(json.loads(line), {'id': 1, 'id_': 'a', 'response_': 'b', 'response': {'text': 'smartidea'}})
+            self.assertEqual(line.count('"response"'), 1)
+        finally:
+            os.remove(filename)
+
+    @skipIf(exporter.pyarrow is None, "pyarrow is not installed")
+    def test_arrow_writers(self):
+        folder = tempfile.TemporaryDirectory()
+        try:
+            header = ['level', 'id', 'parent_id', 'object_id', 'name', 'name']
+            rows = [[0, x, None, str(x), 'ä' * x, None if x % 2 else x] for x in range(25)]
+            readers = [(exporter.ArrowWriter, lambda name: exporter.pyarrow.ipc.open_file(name).read_all()),
+                       (exporter.ParquetWriter, exporter.pyarrow.parquet.read_table)]
+
+            # Several batches and a partial batch
+            for cls, read in readers:
+                filename = os.path.join(folder.name, cls.__name__)
+                writer = cls(filename, header, batchsize=10)
+                for row in rows:
+                    writer.writeRow(row)
+                writer.close()
+
+                table = read(filename)
+                self.assertEqual(table.column_names, ['level', 'id', 'parent_id', 'object_id', 'name', 'name_'])
+                self.assertEqual(table.num_rows, 25)
+                self.assertEqual(table.column('id').to_pylist(), list(range(25)))
+                self.assertEqual(table.column('parent_id').to_pylist(), [None] * 25)
+                self.assertEqual(table.column('name_').to_pylist(), [None if x % 2 else str(x) for x in range(25)])
+        finally:
+            folder.cleanup()
@@ -0,0 +1,69 @@
+from unittest import TestCase
+import os
+import tempfile
+from httpcache import HttpCache, SingleFlight
+
+class Test_HttpCache(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache = HttpCache(os.path.join(self.folder.name, 'cache.db'))
+
+    def tearDown(self):
+        self.cache.close()
+        self.folder.cleanup()
+
+    def test_key(self):
+        key = HttpCache.getKey('get', 'https://example.com', {'b': 2, 'a': 1, 'c': None})
+        self.assertEqual(HttpCache.getKey('GET', 'https://example.com', {'a': 1, 'b': 2}), key)
+        self.assertNotEqual(HttpCache.getKey('GET', 'https://example.com', {'a': 1, 'b': 3}), key)
+        self.assertNotEqual(HttpCache.getKey('GET', 'https://example.com', {'a': 1, 'b': 2}, credential='token'), key)
+        self.assertNotEqual(HttpCache.getKey('POST', 'https://example.com', {'a': 1, 'b': 2}, payload='{}'), key)
+
+        # Uploads are not cached
+        self.assertIsNone(HttpCache.getKey('POST', 'https://example.com', payload=object()))
+
+    def test_response(self):
+        headers = {'Content-Type': 'application/json; charset=utf-8', 'ETag': '"v1"'}
+        self.cache.put('key', 'https://example.com', 200, headers, b'{"a": 1}')
+
+        response = self.cache.get('key')
+        self.assertEqual(response.text, '{"a": 1}')
+        self.assertEqual(response.headers['content-type'], headers['Content-Type'])
+        self.assertEqual(response.getValidators(), {'If-None-Match': '"v1"'})
+        self.assertIsNone(self.cache.get('other'))
+
+        # Revalidation updates the validators
+        self.cache.refresh('key', {'etag': '"v2"'})
+        self.assertEqual(self.cache.get('key').getValidators(), {'If-None-Match': '"v2"'})
+
+    def test_eviction(self):
+        for key in ['a', 'b', 'c']:
+            self.cache.put(key, 'https://example.com/' + key, 200, {}, b'x' * 100, 1000)
+        self.cache.get('a')
+
+        # The least recently used response is removed
+        self.cache.put('d', 'https://example.com/d', 200, {}, b'x' * 100, 350)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertEqual(self.cache.size, 300)
+
+class Test_SingleFlight(TestCase):
+
+    def test_join(self):
+        flights = SingleFlight()
+        future, sender = flights.join('key')
+        self.assertTrue(sender)
+
+        # Identical requests wait for the same future
+        waiting, sender = flights.join('key')
+        self.assertIs(waiting, future)
+        self.assertFalse(sender)
+
+        result = {'data': [1, 2]}
+        flights.leave('key', result)
+        self.assertEqual(waiting.result(), result)
+        self.assertIsNot(waiting.result(), result)
+
+        # The next request is sent again
+        self.assertTrue(flights.join('key')[1])
@@ -0,0 +1,73 @@
+from unittest import TestCase, skipIf
+import asyncio
+import json
+from datetime import datetime
+import jsoncodec
+
+class Test_JsonCodec(TestCase):
+
+    def setUp(self):
+        self.codec = jsoncodec.getCodec()
+        self.data = {'data': [{'id': str(x), 'value': x / 4, 'text': 'äö'} for x in range(100)], 'next': None}
+        body = json.dumps(self.data, ensure_ascii=False).encode('utf-8')
+        self.chunks = [body[x:x + 7] for x in range(0, len(body), 7)]
+
+    def tearDown(self):
+        jsoncodec.setCodec(self.codec)
+
+    def test_codecs(self):
+        values = [self.data, {'big': 2 ** 70, 'list': [1.5, None, True]}, {'nan': float('nan'), 'inf': [float('inf')]}, 'äö/']
+        for name in jsoncodec.availableCodecs():
+            with self.subTest(codec=name):
+                jsoncodec.setCodec(name)
+                for value in values:
+                    encoded = jsoncodec.dumps(value)
+                    self.assertIsInstance(encoded, str)
+                    self.assertEqual(json.dumps(json.loads(encoded)), json.dumps(value))
+
+                # Bytes are decoded like text
+                for value in values[:2]:
+                    encoded = jsoncodec.dumps(value)
+                    self.assertEqual(jsoncodec.loads(encoded), value)
+                    self.assertEqual(jsoncodec.loads(encoded.encode('utf-8')), value)
+
+                # Values the json module rejects are not converted
+                with self.assertRaises(TypeError):
+                    jsoncodec.dumps({'date': datetime(2020, 1, 1)})
+
+    def test_canstream(self):
+        class Response(object):
+            def __init__(self, headers):
+                self.headers = headers
+
+        large = str(jsoncodec.STREAM_SIZE + 1)
+        ijson = jsoncodec.ijson
+        try:
+            jsoncodec.ijson = object()
+            self.assertTrue(jsoncodec.canStream(Response({'content-length': large})))
+            self.assertFalse(jsoncodec.canStream(Response({'content-length': large, 'content-type': 'application/json; charset=latin-1'})))
+
+            # Small responses and responses of unknown length are read completely
+            self.assertFalse(jsoncodec.canStream(Response({'content-length': '100'})))
+            self.assertFalse(jsoncodec.canStream(Response({})))
+
+            jsoncodec.ijson = None
+            self.assertFalse(jsoncodec.canStream(Response({'content-length': large})))
+        finally:
+            jsoncodec.ijson = ijson
+
+    @skipIf(jsoncodec.ijson is None, "ijson is not installed")
+    def test_stream(self):
+        self.assertEqual(jsoncodec.loadsStream(self.chunks), self.data)
+        self.assertEqual(jsoncodec.loadsStream([]), [])
+
+        with self.assertRaises(Exception):
+            jsoncodec.loadsStream(self.chunks[:-1])
+
+    @skipIf(jsoncodec.ijson is None, "ijson is not installed")
+    def test_stream_async(self):
+        async def chunks():
+            for chunk in self.chunks:
+                yield chunk
+
+        self.assertEqual(asyncio.run(jsoncodec.loadsStreamAsync(chunks())), self.data)
@@ -0,0 +1,58 @@
+from unittest import TestCase
+import time
+from ratelimiter import TokenBucket, RateLimiter
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class Test_RateLimiter(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+
+    def test_spacing(self):
+        bucket = TokenBucket(10, 1, self.clock)
+        waits = [round(bucket.reserve(), 3) for x in range(3)]
+        self.assertEqual(waits, [0, 0.1, 0.2])
+
+        # Tokens are refilled while idle
+        self.clock.now += 10
+        self.assertEqual(round(bucket.reserve(), 3), 0)
+
+    def test_burst(self):
+        bucket = TokenBucket(10, 3, self.clock)
+        waits = [round(bucket.reserve(), 3) for x in range(5)]
+        self.assertEqual(waits, [0, 0, 0, 0.1, 0.2])
+
+    def test_headers(self):
+        bucket = TokenBucket(10, 1, self.clock)
+
+        # No requests left until reset
+        bucket.update({'X-Rate-Limit-Remaining': '0', 'X-Rate-Limit-Reset': str(int(time.time()) + 30)})
+        self.assertGreater(bucket.reserve(), 25)
+
+        # Retry-After in seconds
+        bucket = TokenBucket(10, 1, self.clock)
+        bucket.update({'Retry-After': '5'}, 429)
+        self.assertEqual(round(bucket.reserve(), 3), 5)
+
+        # Remaining requests are spread until the reset
+        bucket = TokenBucket(10, 1, self.clock)
+        bucket.update({'x-ratelimit-remaining': '20', 'x-ratelimit-reset': '10'})
+        self.assertEqual(bucket.getRate(), 2)
+
+        # Usage in percent
+        bucket = TokenBucket(10, 1, self.clock)
+        bucket.update({'x-app-usage': '{"call_count": 90, "total_time": 10, "total_cputime": 10}'})
+        self.assertEqual(round(bucket.getRate(), 3), 4)
+
+    def test_shared_buckets(self):
+        limiter = RateLimiter()
+        bucket = limiter.getBucket(('Generic', 'example.com', ''), 1)
+        self.assertIs(limiter.getBucket(('Generic', 'example.com', ''), 2), bucket)
+        self.assertEqual(bucket.rate, 2)
+        self.assertIsNot(limiter.getBucket(('Generic', 'example.com', 'token'), 2), bucket)
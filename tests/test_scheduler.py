@@ -0,0 +1,93 @@
+from unittest import TestCase
+import os
+import tempfile
+from database import Database, Node, NodeQueue, JobQueue
+from scheduler import FetchScheduler
+
+class StubModule(object):
+    name = 'Generic'
+
+    def __init__(self, failures=0):
+        self.failures = failures
+
+    def fetchData(self, nodedata, options, logData, logMessage, logProgress):
+        if self.failures > 0:
+            self.failures -= 1
+            options['querystatus'] = 'fetched (500)'
+            logData({'error': 'failed'}, options, {})
+        else:
+            options['querystatus'] = 'fetched (200)'
+            logData([{'id': nodedata['objectid'] + '-' + str(x)} for x in range(2)], options, {})
+
+    def disconnectSocket(self):
+        pass
+
+    def getConnectionStats(self):
+        return {'requests': 0, 'connections': 0}
+
+    def getConnectionReuse(self, since=None):
+        return None
+
+    def getCacheStats(self):
+        return {'hits': 0, 'revalidated': 0, 'coalesced': 0}
+
+    def getCacheHits(self, since=None):
+        return self.getCacheStats()
+
+class RetryScheduler(FetchScheduler):
+    """
+    Retry immediately after errors
+    """
+    def __init__(self, *args, **kwargs):
+        super(RetryScheduler, self).__init__(*args, **kwargs)
+        self.events = []
+
+    def suspend(self, msg, ratelimit, autoretry):
+        self.events.append('suspend')
+
+    def errorsPending(self, count):
+        self.events.append('pending')
+
+    def resume(self):
+        self.threadpool.retryJobs()
+        return True
+
+class Test_FetchScheduler(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.database = Database(None)
+        self.database.connect(os.path.join(self.folder.name, 'test.db'))
+        self.database.session.add_all([Node(str(number)) for number in range(20)])
+        self.database.session.commit()
+        self.options = {'nodelevel': 1, 'nodedata': None, 'objectid': 'id', 'threads': 4, 'errors': 3}
+
+    def tearDown(self):
+        self.database.disconnect()
+        self.folder.cleanup()
+
+    def run_scheduler(self, module, cls=FetchScheduler):
+        session = self.database.session
+        jobqueue = JobQueue.createRun(session, module.name, self.options, NodeQueue(session, 0, [], self.options))
+        jobs = ({'nodeid': node['id'], 'nodedata': node['data'], 'options': dict(self.options)} for node in jobqueue)
+
+        scheduler = cls(module, self.options, self.database, jobqueue)
+        return scheduler, scheduler.run(jobs)
+
+    def test_run(self):
+        scheduler, stats = self.run_scheduler(StubModule())
+        self.assertEqual(stats['finished'], 20)
+        self.assertEqual(stats['newnodes'], 40)
+        self.assertEqual(dict(stats['status']), {'fetched (200)': 20})
+        self.assertFalse(stats['canceled'])
+
+        # The finished run is removed
+        self.assertEqual(self.database.session.query(Node).filter(Node.level == 1).count(), 40)
+        self.assertIsNone(JobQueue.findRun(self.database.session, 'Generic', self.options))
+
+    def test_retry(self):
+        scheduler, stats = self.run_scheduler(StubModule(failures=3), RetryScheduler)
+        self.assertIn('suspend', scheduler.events)
+        self.assertEqual(stats['status']['fetched (500)'], 3)
+        self.assertEqual(stats['status']['fetched (200)'], 20)
+        self.assertIsNone(JobQueue.findRun(self.database.session, 'Generic', self.options))
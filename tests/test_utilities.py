@@ -1,5 +1,5 @@
 from unittest import TestCase
-from utilities import getDictValue
+from utilities import getDictValue, hasDictValue, extractValue, extractValues, compileKey, compileKeys, compilePath
 
 class Test_Utilities(TestCase):
 
@@ -12,3 +12,17 @@ class Test_Utilities(TestCase):
     def test_get_dict_value(self):
         out = getDictValue(self.fixture,'posts.comments.0.text')
         self.assertEqual(out,'smartidea')
+
+    def test_compiled_key(self):
+        key = compileKey('comment=posts.comments.*.text|length')
+        self.assertIs(key, compileKey('comment=posts.comments.*.text|length'))
+        self.assertEqual(extractValue(self.fixture, key), ('comment', '1'))
+
+        path = compilePath('posts.comments.0.text')
+        self.assertEqual(getDictValue(self.fixture, path), 'smartidea')
+        self.assertTrue(hasDictValue(self.fixture, path))
+
+    def test_extract_values(self):
+        keys = ['posts.comments.0.text', 'count=posts.comments|length', 'posts.missing', 'posts.comments.*.text']
+        out = extractValues(self.fixture, compileKeys(keys))
+        self.assertEqual(out, [extractValue(self.fixture, key) for key in keys])